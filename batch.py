@@ -0,0 +1,159 @@
+# Batch evaluation of many independent decklists.
+#  Ranks a set of candidate decklists (like tournament lists, or a handful of manual tweaks) by their average win turn.
+#  All of the games of every decklist are scheduled across a single pool of workers, rather than a pool per decklist,
+#  so that the cores stay busy for the whole batch instead of waiting on the slowest game of each decklist.
+#  Every decklist plays the same seeds, so the difference between a decklist and the best one is measured game by game
+#  (a paired comparison), which is a lot tighter than comparing their two confidence intervals.
+#  The games are recorded in the same results store as a training run (one variant per decklist), so results.py can
+#  summarize the output folder too.
+#
+# Usage:
+#  python batch.py decklists/ [--games 100] [--config settings.json]   (one decklist per file)
+#  python batch.py candidates.txt [--games 100]   (decklists separated by lines of ---, named by a "# name" first line)
+import argparse
+import datetime
+import json
+import math
+import os
+import sys
+
+import cards
+import montecarlo
+import results
+
+BATCH_SEPARATOR = '---' # Separates the decklists in a batch file
+CONFIDENCE_Z = 1.96 # Confidence intervals are this many standard errors wide on each side (95%, with a normal approximation)
+SUMMARY_FILENAME = 'batch_summary.tsv'
+
+def load_decklists(path):
+    # Returns a list of (name, decklist text) pairs, from either a folder with a decklist in each file, or a single file
+    #  of decklists
+    named_decklists = []
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            if filename.startswith('.'):
+                continue
+            with open(os.path.join(path, filename), 'r') as f:
+                named_decklists.append((os.path.splitext(filename)[0], f.read()))
+    else:
+        with open(path, 'r') as f:
+            sections = [[]]
+            for line in f.read().split('\n'):
+                if line.strip() == BATCH_SEPARATOR:
+                    sections.append([])
+                else:
+                    sections[-1].append(line)
+        for index, lines in enumerate(sections):
+            lines = [line for line in lines if line.strip()]
+            if len(lines) == 0:
+                continue
+            name = f'Decklist {index + 1}'
+            if lines[0].startswith('#'):
+                name = lines[0].lstrip('#').strip()
+            named_decklists.append((name, '\n'.join(lines)))
+    if len(named_decklists) == 0:
+        raise Exception(f'No decklists found in {path}')
+    return named_decklists
+
+def get_interval(values):
+    # Mean and the half-width of its confidence interval
+    mean = sum(values) / len(values)
+    if len(values) < 2:
+        return mean, math.inf
+    variance = sum([(value - mean) ** 2 for value in values]) / (len(values) - 1)
+    return mean, CONFIDENCE_Z * math.sqrt(variance / len(values))
+
+def evaluate_decklists(named_decklists, num_games, max_turns = 10, seed_base = 0, results_store = None):
+    # Play num_games games of every decklist on the same seeds, and return one row per decklist, best first
+    decklists = []
+    for name, decklist in named_decklists:
+        try:
+            deckrange = montecarlo.parse_decklist(decklist)
+        except Exception as e:
+            raise Exception(f'Decklist {name}: {e}')
+        decklists.append(montecarlo.get_deck_variants(deckrange)[0])
+
+    # Interleave the decklists, so that the slow games of a slow decklist are spread out over the whole batch
+    players = [cards.Player(decklist, seed_base + game) for game in range(num_games) for decklist in decklists]
+    game_results = montecarlo.play_games(players, max_turns)
+
+    rows = []
+    for deck_index, (name, decklist) in enumerate(zip([name for name, text in named_decklists], decklists)):
+        win_turns = []
+        durations = []
+        wins = 0
+        card_stats = {}
+        variant_id = results_store.add_variant(0, name, decklist) if results_store is not None else None
+        for game in range(num_games):
+            win_state, action_count, max_leaf_nodes, duration, search_stats = game_results[game * len(decklists) + deck_index]
+            # Games that weren't won count as max_turns + 2, the same as in training
+            won_turn = win_state.current_turn if win_state is not None else max_turns + 2
+            win_turns.append(won_turn)
+            durations.append(duration)
+            wins += win_state is not None
+            montecarlo.merge_card_stats(card_stats, search_stats.get('card_stats', {}))
+            if results_store is not None:
+                results_store.add_game(0, 0, variant_id, seed_base + game, won_turn, win_state is not None, action_count, max_leaf_nodes, duration, search_stats.get('peak_memory', 0))
+        if results_store is not None and len(card_stats) > 0:
+            results_store.add_card_stats(0, 0, variant_id, card_stats)
+
+        avg_win_turn, interval = get_interval(win_turns)
+        rows.append({'name': name, 'games': num_games, 'avg_win_turn': avg_win_turn, 'interval': interval,
+                     'win_rate': wins / num_games, 'avg_duration': sum(durations) / num_games, 'win_turns': win_turns})
+    if results_store is not None:
+        results_store.flush()
+
+    rows.sort(key=lambda row: row['avg_win_turn'])
+    best_win_turns = rows[0]['win_turns']
+    for row in rows:
+        row['difference'], row['difference_interval'] = get_interval([win_turn - best_win_turn for win_turn, best_win_turn in zip(row['win_turns'], best_win_turns)])
+    return rows
+
+def print_summary(rows):
+    for rank, row in enumerate(rows):
+        print(f"{rank + 1:3d}. {row['name']}: avg {row['avg_win_turn']:.3f} ± {row['interval']:.3f}, "
+              f"won {row['win_rate'] * 100:.1f}%, {row['difference']:+.3f} ± {row['difference_interval']:.3f} vs the best, "
+              f"{row['avg_duration']:.3f}s per game")
+
+def write_summary(filename, rows):
+    with open(filename, 'w') as f:
+        f.write('rank\tname\tgames\tavg_win_turn\tinterval_low\tinterval_high\twin_rate\tdifference\tdifference_low\tdifference_high\tavg_duration\n')
+        for rank, row in enumerate(rows):
+            f.write(f"{rank + 1}\t{row['name']}\t{row['games']}\t{row['avg_win_turn']}\t{row['avg_win_turn'] - row['interval']}\t{row['avg_win_turn'] + row['interval']}\t"
+                    f"{row['win_rate']}\t{row['difference']}\t{row['difference'] - row['difference_interval']}\t{row['difference'] + row['difference_interval']}\t{row['avg_duration']}\n")
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Rank a batch of decklists by their average win turn.')
+    parser.add_argument('decklists', help=f'Folder with one decklist per file, or a file of decklists separated by lines of {BATCH_SEPARATOR}')
+    parser.add_argument('--config', help='JSON file of montecarlo.py settings (e.g. {"prune_limit": 500})')
+    parser.add_argument('--games', type=int, default=100, help='Number of games to play with each decklist (default: 100)')
+    parser.add_argument('--seed', type=int, default=0, help='First seed to play (default: 0)')
+    parser.add_argument('--max-turns', type=int, default=10, help='Max number of turns to search for a win (default: 10)')
+    parser.add_argument('--prune-limit', type=int, help='Max number of leaf nodes to search through')
+    parser.add_argument('--serial', action='store_true', help='Play games in this process instead of in a pool of workers')
+    parser.add_argument('--output', help='Folder to write the summary and the games to (default: a new folder under logs/)')
+    args = parser.parse_args(argv)
+
+    if args.config:
+        with open(args.config, 'r') as f:
+            montecarlo.apply_config(json.load(f))
+    if args.prune_limit is not None:
+        montecarlo.PRUNE_LIMIT = args.prune_limit
+    if args.serial:
+        montecarlo.USE_PARALLEL = False
+
+    named_decklists = load_decklists(args.decklists)
+    output = args.output
+    if output is None:
+        output = f'logs/batch_{datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")}/'
+    results_store = results.ResultsStore(output)
+
+    print(f'Playing {args.games} games with each of {len(named_decklists)} decklists')
+    rows = evaluate_decklists(named_decklists, args.games, args.max_turns, args.seed, results_store)
+    print_summary(rows)
+    write_summary(os.path.join(output, SUMMARY_FILENAME), rows)
+    print(f'Summary written to {os.path.join(output, SUMMARY_FILENAME)}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
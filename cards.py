@@ -1,21 +1,45 @@
 
 # CardList extends the list class to add a few methods for dealing with
 # a list of cards.
+import math
 import pickle
 #import msgpack as pickle
 import random
+import sys
 import time
+from collections import deque
 from typing import List
 
 MAXINT = 2**31 - 1
 LOGGING_ENABLED = False
+ZONE_POOL_LIMIT = 50000 # Most empty zones to keep around for reuse
+FOREST_SEARCH_MARGIN = 3 # Library searches only commute while at least this many Forests are left (the most that any card searches for)
+card_timings = None # {card name: seconds} spent in the Player's can_*/play methods for each card, while it's set to a dict (see timed_card_method())
+
+# Randomness in a game (shuffling, and random pruning in the search) comes from a generator of our own that is reseeded
+#  with the game's seed every time it's used, rather than from the random module's global generator. That way a game only
+#  depends on its own seed, and not on what else in the process used random numbers before it (or which other games a
+#  worker played first), and it doesn't disturb the global generator for anything else either.
+#  Reseeding on every use is what gives every shuffle in a game the same fixed order, which is cheaper than keeping a
+#  generator's state in every copy of a state (and lets states that only differ in generator state be deduplicated).
+game_random = random.Random()
+
+def get_game_random(seed) -> random.Random:
+    # Without a seed, just carry on the global generator's sequence
+    if seed is None:
+        return random
+    game_random.seed(seed)
+    return game_random
 
 def get_card_by_name(name):
     for subclass in Card.__subclasses__():
         if subclass.name == name:
             return subclass
     return None
-class Cards(list):
+
+# CardsMixin holds the methods that are shared by every zone of cards, regardless of the container that backs it.
+#  The top of a zone is the end of the container, and the bottom is the start.
+class CardsMixin:
     def __init__(self, cards=None, randseed=None):
         super().__init__()
         self.randseed = randseed
@@ -42,9 +66,7 @@ class Cards(list):
 
     def shuffle(self):
         # Shuffle the deck with a fixed seed
-        if not self.randseed is None:
-            random.seed(self.randseed)
-        random.shuffle(self)
+        get_game_random(self.randseed).shuffle(self)
 
     def draw(self, quant=1):
         if quant == 1:
@@ -122,14 +144,6 @@ class Cards(list):
                 break
         return count
 
-    def put_on_bottom(self, card):
-        # If card is a list, put each card on the bottom of the deck
-        if isinstance(card, list):
-            for c in card:
-                self.put_on_bottom(c)
-        else:
-            self.insert(0, card)
-
     def get_card(self, card_ref, player:'Player'=None, can_play=False, can_alt_play=False, can_activate=False) -> 'Card':
         if (can_play or can_alt_play or can_activate) and not isinstance(player, Player):
             raise Exception("Player object must be passed to get_card if play/activate filter is set.")
@@ -159,6 +173,118 @@ class Cards(list):
 
         return None
 
+    def __reduce__(self):
+        # Zones are unpickled into containers from the zone pool (when it has any), rather than always allocating new ones.
+        return (_restore_zone, (self.__class__,), self.__dict__, iter(self))
+
+# Pruned states can hand their zones back to be reused by the next states that are copied, which saves allocating (and later
+#  freeing) several containers per state. See Player.release().
+class ZonePool:
+    def __init__(self):
+        self.free = {}
+        self.allocated = 0
+        self.reused = 0
+        self.released = 0
+        self.free_bytes = 0 # How much memory the free zones hold, so that searches under a memory budget can count it
+
+    def get(self, zone_class):
+        free = self.free.get(zone_class)
+        if free:
+            self.reused += 1
+            zone = free.pop()
+            self.free_bytes -= sys.getsizeof(zone) + sys.getsizeof(zone.__dict__)
+            return zone
+        self.allocated += 1
+        return zone_class.__new__(zone_class)
+
+    def release(self, zone):
+        free = self.free.setdefault(zone.__class__, [])
+        if len(free) < ZONE_POOL_LIMIT:
+            zone.clear()
+            zone.__dict__.clear()
+            free.append(zone)
+            self.free_bytes += sys.getsizeof(zone) + sys.getsizeof(zone.__dict__)
+            self.released += 1
+
+    def clear(self):
+        # Let go of every free zone
+        self.free = {}
+        self.free_bytes = 0
+
+    def reset_counts(self):
+        self.allocated = 0
+        self.reused = 0
+        self.released = 0
+
+zone_pool = ZonePool()
+
+def _restore_zone(zone_class):
+    return zone_pool.get(zone_class)
+
+# Cards is a list-backed zone, used for the hand, table, graveyard, and exile.
+class Cards(CardsMixin, list):
+    def put_on_bottom(self, card):
+        # If card is a list, put each card on the bottom of the deck
+        if isinstance(card, list):
+            for c in card:
+                self.put_on_bottom(c)
+        else:
+            self.insert(0, card)
+
+# Library is a deque-backed zone for the player's library, so that drawing from the top and putting cards
+#  on the bottom are both O(1). Cards like Goblin Charbelcher, Abundant Harvest, and Ancient Stirrings move
+#  a lot of cards from the top of the library to the bottom.
+class Library(CardsMixin, deque):
+    def shuffle(self):
+        # Shuffle the deck with a fixed seed
+        # Shuffling a deque in place is O(n^2) because of its indexing, so shuffle a list copy instead.
+        #  This uses the random number generator exactly the same way as shuffling a list, so the resulting order is the same.
+        cards = list(self)
+        get_game_random(self.randseed).shuffle(cards)
+        self.clear()
+        self.extend(cards)
+
+    def put_on_bottom(self, card):
+        # If card is a list, put each card on the bottom of the deck
+        if isinstance(card, list):
+            self.extendleft(card)
+        else:
+            self.appendleft(card)
+
+    def reveal_depth(self, name) -> int:
+        # Return how many cards would be revealed from the top of the library to find the first card with the given name (including that card).
+        # If there is no such card, then the whole library would be revealed.
+        depth = 0
+        for card in reversed(self):
+            depth += 1
+            if card.name == name:
+                break
+        return depth
+
+    def put_top_on_bottom(self, quantity):
+        # Move the top X cards to the bottom, in the same order as revealing them one at a time and putting each on the bottom.
+        self.rotate(quantity)
+
+def get_card_ref_name(card_ref) -> str:
+    if isinstance(card_ref, Card):
+        return card_ref.name
+    return str(card_ref)
+
+def timed_card_method(method):
+    # Add the time spent in a Player method that takes a card_ref to card_timings, under the card's name. Calls that
+    #  happen inside of another timed call (like playing the Panglacial Wurm that Krosan Wayfarer found) count toward both.
+    def timed(self, card_ref):
+        if card_timings is None:
+            return method(self, card_ref)
+        then = time.perf_counter()
+        try:
+            return method(self, card_ref)
+        finally:
+            name = get_card_ref_name(card_ref)
+            card_timings[name] = card_timings.get(name, 0.0) + time.perf_counter() - then
+    timed.__name__ = method.__name__
+    return timed
+
 class Player:
     land_drops:int = 0
     lands:int = 0
@@ -172,18 +298,27 @@ class Player:
     life_total:int = 20
     opponent_lifetotal:int = 20
     is_pruned:bool = False # Marks a player state as pruned, meaning that it should not be evaluated for exhaustive search anymore.
+    is_released:bool = False # Marks a pruned state whose zones have been handed back to the zone pool. See release().
+    settle_belcher_lethal:bool = True # If a Goblin Charbelcher can be activated for lethal, do that right away instead of expanding every other option. Only valid when the library order is known.
+    partial_order_reduction:bool = True # Only expand one order of in-turn actions that commute with each other. See is_redundant_ordering().
+    last_branch_action = None # The (card class, mode, uid, mana pools before paying) of the action that led to this state, if any.
+    collapse_forced_actions:bool = True # When an action is the only option (like playing a land, or a free spell), take it in place as part of the step before it, instead of copying the state for it. See take_forced_actions().
+    next_actions = None # The actions of the decision that take_forced_actions() stopped at, for step_next_actions() to expand ([] if the state turned out to be redundant)
+    branch_card = None # The name of the card whose action led to this state (see branch()), that montecarlo's per-card stats count it under
     pickledump = None
     can_cast_wurm_now:bool = False
+    is_preshuffled:bool = False # The library is already in its starting order, so start_game() shouldn't shuffle it. See with_card_changed().
 
     def __init__(self, decklist, randseed=None):
         if randseed is None:
             randseed = time.time()
         self.randseed = randseed
-        self.deck:Cards = Cards(decklist, randseed)
-        self.hand:Cards = Cards()
-        self.graveyard:Cards = Cards()
-        self.table:Cards = Cards()
-        self.exile:Cards = Cards()
+        self.deck:Library = Library(decklist, randseed)
+        # Every zone gets the game's seed, not just the library: find_and_remove() shuffles whichever zone it takes from
+        self.hand:Cards = Cards(randseed=randseed)
+        self.graveyard:Cards = Cards(randseed=randseed)
+        self.table:Cards = Cards(randseed=randseed)
+        self.exile:Cards = Cards(randseed=randseed)
         self.log:List[str] = [""]
         self.childstates:List['Player'] = []
         # If we don't have any Panglacial Wurms in the deck, we can shortcut some costly checks.
@@ -235,10 +370,14 @@ class Player:
         return ((colored_cost <= colored_mana_available)
             and (total_cost <= colored_mana_available + colorless_mana_available))
 
-    def adjust_mana_pool(self, total_cost, colorless_cost=0):
-        #debuglog = f"\n Adjusting mana pool for {total_cost} ({colorless_cost}) for card {debug_card_ref}"
-        starting_total_mana = self.mana_pool + self.colorless_mana_pool + self.persistent_mana_pool + self.persistent_colorless_mana_pool
-        #debuglog += f'\n  {starting_total_mana} starting mana: {self.mana_pool} ({self.colorless_mana_pool}) [{self.persistent_mana_pool} ({self.persistent_colorless_mana_pool})]'
+    def get_mana_pools(self) -> tuple:
+        return (self.mana_pool, self.colorless_mana_pool, self.persistent_mana_pool, self.persistent_colorless_mana_pool)
+
+    @staticmethod
+    def pay_mana(pools, total_cost, colorless_cost=0) -> tuple:
+        # Work out what is left of the (mana_pool, colorless_mana_pool, persistent_mana_pool, persistent_colorless_mana_pool) pools
+        #  after paying a cost, or None if it can't be paid.
+        mana_pool, colorless_mana_pool, persistent_mana_pool, persistent_colorless_mana_pool = pools
         remaining_colored_cost = total_cost - colorless_cost
         remaining_colorless_cost = colorless_cost
 
@@ -254,64 +393,52 @@ class Player:
 
         ### Stage 1: Colored costs
         ## Step 1.1) Spend temporary colored mana on our colored costs first
-        colored_usage = min(self.mana_pool, remaining_colored_cost)
-        self.mana_pool -= colored_usage
+        colored_usage = min(mana_pool, remaining_colored_cost)
+        mana_pool -= colored_usage
         remaining_colored_cost -= colored_usage
 
-        #debuglog += f'\n Spent {colored_usage} colored mana on colored costs, {remaining_colored_cost} remaining'
-
         ## Step 1.2) Spend persistent colored mana on our remaining colored costs last
-        colored_usage = min(self.persistent_mana_pool, remaining_colored_cost)
-        self.persistent_mana_pool -= colored_usage
+        colored_usage = min(persistent_mana_pool, remaining_colored_cost)
+        persistent_mana_pool -= colored_usage
         remaining_colored_cost -= colored_usage
 
-        #debuglog += f'\n Spent {colored_usage} persistent colored mana on colored costs, {remaining_colored_cost} remaining'
-
         ### Stage 2: Colorless costs
         ## Step 2.1) Spend temporary colorless mana on our colorless costs first
-        colorless_usage = min(self.colorless_mana_pool, remaining_colorless_cost)
-        self.colorless_mana_pool -= colorless_usage
+        colorless_usage = min(colorless_mana_pool, remaining_colorless_cost)
+        colorless_mana_pool -= colorless_usage
         remaining_colorless_cost -= colorless_usage
 
-        #debuglog += f'\n Spent {colorless_usage} colorless mana on colorless costs, {remaining_colorless_cost} remaining'
-
         ## Step 2.2) Spend temporary colored mana on our remaining colorless costs next
-        colored_usage = min(self.mana_pool, remaining_colorless_cost)
-        self.mana_pool -= colored_usage
+        colored_usage = min(mana_pool, remaining_colorless_cost)
+        mana_pool -= colored_usage
         remaining_colorless_cost -= colored_usage
 
-        #debuglog += f'\n Spent {colored_usage} colored mana on colorless costs, {remaining_colorless_cost} remaining'
-
         ## Step 2.3) Spend persistent colorless mana on our remaining colorless costs next
-        colorless_usage = min(self.persistent_colorless_mana_pool, remaining_colorless_cost)
-        self.persistent_colorless_mana_pool -= colorless_usage
+        colorless_usage = min(persistent_colorless_mana_pool, remaining_colorless_cost)
+        persistent_colorless_mana_pool -= colorless_usage
         remaining_colorless_cost -= colorless_usage
 
-        #debuglog += f'\n Spent {colorless_usage} persistent colorless mana on colorless costs, {remaining_colorless_cost} remaining'
-
         ## Step 2.4) Spend persistent colored mana on our remaining colorless costs last
-        colored_usage = min(self.persistent_mana_pool, remaining_colorless_cost)
-        self.persistent_mana_pool -= colored_usage
+        colored_usage = min(persistent_mana_pool, remaining_colorless_cost)
+        persistent_mana_pool -= colored_usage
         remaining_colorless_cost -= colored_usage
 
-        #debuglog += f'\n Spent {colored_usage} persistent colored mana on colorless costs, {remaining_colorless_cost} remaining'
+        if remaining_colored_cost > 0 or remaining_colorless_cost > 0:
+            return None
+        return (mana_pool, colorless_mana_pool, persistent_mana_pool, persistent_colorless_mana_pool)
 
+    def adjust_mana_pool(self, total_cost, colorless_cost=0):
+        pools = Player.pay_mana(self.get_mana_pools(), total_cost, colorless_cost)
         # Check that we haven't overspent
-        assert self.mana_pool >= 0
-        assert self.colorless_mana_pool >= 0
-        assert self.persistent_mana_pool >= 0
-        assert self.persistent_colorless_mana_pool >= 0
-
-        # Ensure that we spent the proper amount
-        ending_total_mana = self.mana_pool + self.colorless_mana_pool + self.persistent_mana_pool + self.persistent_colorless_mana_pool
-        #debuglog += f'\n  {ending_total_mana} ending mana: {self.mana_pool} ({self.colorless_mana_pool}) [{self.persistent_mana_pool} ({self.persistent_colorless_mana_pool})]'
-
-        assert starting_total_mana - total_cost == ending_total_mana, f"ERROR: Spent {starting_total_mana - ending_total_mana} mana, but should have spent {total_cost} ({colorless_cost})."
+        assert pools is not None, f"ERROR: Cannot pay {total_cost} ({colorless_cost}) from mana pools {self.get_mana_pools()}."
+        self.mana_pool, self.colorless_mana_pool, self.persistent_mana_pool, self.persistent_colorless_mana_pool = pools
 
+    @timed_card_method
     def can_play(self, card) -> bool:
         card = self.hand.get_card(card, player=self, can_play=True)
         return card is not None
 
+    @timed_card_method
     def play(self, card_ref):
         card = self.hand.get_card(card_ref, player=self, can_play=True)
 
@@ -324,10 +451,12 @@ class Player:
 
         card.play(self)
 
+    @timed_card_method
     def can_alt_play(self, card_ref) -> bool:
         card = self.hand.get_card(card_ref, player=self, can_alt_play=True)
         return card is not None
 
+    @timed_card_method
     def alt_play(self, card_ref):
         card = self.hand.get_card(card_ref, player=self, can_alt_play=True)
 
@@ -339,10 +468,12 @@ class Player:
         self.adjust_mana_pool(card.alt_cost, card.colorless_alt_cost)
         card.alt_play(self)
 
+    @timed_card_method
     def can_activate(self, card_ref) -> bool:
         card = self.table.get_card(card_ref, player=self, can_activate=True)
         return card is not None
     
+    @timed_card_method
     def activate(self, card_ref):
         card = self.table.get_card(card_ref, player=self, can_activate=True)
 
@@ -387,9 +518,49 @@ class Player:
     def start_game(self) -> 'Player':
         # If it's the first turn, shuffle up and draw 7 cards
         if self.current_turn == 0:
-            self.deck.shuffle()
+            if not self.is_preshuffled:
+                self.deck.shuffle()
             self.draw(7)
 
+    def with_card_changed(self, variant_decklist, cardname, change) -> 'Player':
+        # Return a game of variant_decklist (this game's decklist with one more or one fewer cardname, change being 1 or -1)
+        #  that starts from the library that this game would shuffle, with the one card put in or taken out at random. The two
+        #  games are then the same until the changed card makes a difference, so the difference between their results is
+        #  much less noisy than between two unrelated games (common random numbers). This game has to not have started yet.
+        library = Library(list(self.deck), self.randseed)
+        library.shuffle()
+        order = list(library)
+        # Pick where the card goes with a generator of its own, so that it doesn't depend on the shuffle
+        variant_random = get_game_random(f'{self.randseed} {change:+} {cardname}')
+        if change < 0:
+            positions = [position for position, card in enumerate(order) if card.name == cardname]
+            if len(positions) == 0:
+                raise Exception(f'Cannot remove {cardname} from a decklist without any')
+            order.pop(variant_random.choice(positions))
+
+        variant = Player(variant_decklist, self.randseed)
+        # Put the variant's cards in the same order, copy for copy
+        copies = {}
+        for card in variant.deck:
+            copies.setdefault(card.name, []).append(card)
+        expected_counts = {}
+        for card in order:
+            expected_counts[card.name] = expected_counts.get(card.name, 0) + 1
+        if change > 0:
+            expected_counts[cardname] = expected_counts.get(cardname, 0) + 1
+        if {name: len(cards) for name, cards in copies.items()} != expected_counts:
+            raise Exception(f'Variant decklist is not this decklist with {change:+} {cardname}:\n{variant_decklist}')
+        for name in copies:
+            copies[name].reverse()
+        variant_order = [copies[card.name].pop() for card in order]
+        if change > 0:
+            variant_order.insert(variant_random.randrange(len(variant_order) + 1), copies[cardname].pop())
+
+        variant.deck.clear()
+        variant.deck.extend(variant_order)
+        variant.is_preshuffled = True
+        return variant
+
     def start_turn(self) -> 'Player':
         # Increment turn count
         self.current_turn += 1
@@ -418,13 +589,251 @@ class Player:
     def check_win(self) -> bool:
         return self.opponent_lifetotal <= 0
 
+    def can_reorder_actions(self) -> bool:
+        # Landfall triggers and Panglacial Wurm aren't described by the card footprints, so don't drop any orderings when they're around.
+        if not self.partial_order_reduction or self.last_branch_action is None or self.panglacial_in_deck:
+            return False
+        for card in self.table:
+            if hasattr(card, 'do_landfall'):
+                return False
+        return True
+
+    def is_redundant_ordering(self, card, mode) -> bool:
+        # Partial-order reduction: If this action commutes with the action that led to this state, then taking them in the
+        #  other order reaches the same state. We only expand them in one order (sorted by card name and mode), so if this
+        #  action sorts first, then skip it here -- the sibling state that took it first will take the previous action next.
+        last_class, last_mode, last_uid, pools = self.last_branch_action
+        uid = card.uid if mode == 'activate' else -1
+        if not (card.name, mode, uid) < (last_class.name, last_mode, last_uid):
+            return False
+        # Cards are played from hand by name, so we don't know if it's the same card as last time. Activations are by uid.
+        if card.name == last_class.name and not (mode == 'activate' and last_mode == 'activate'):
+            return False
+
+        footprint = card.get_footprint(mode)
+        last_footprint = last_class.get_footprint(last_mode)
+        if footprint is None or last_footprint is None:
+            return False
+        reads, writes = footprint
+        last_reads, last_writes = last_footprint
+        if (reads & last_writes) or (last_reads & writes):
+            return False
+
+        # Searching a Forest out of the library commutes with another search as long as neither one can come up short
+        if ('forests' in writes or 'forests' in last_writes) and self.deck.count_cards('Forest') < FOREST_SEARCH_MARGIN:
+            return False
+
+        # Both orders have to be affordable, and pay for things out of the same mana pools
+        cost = card.get_cost(mode)
+        last_cost = last_class.get_cost(last_mode)
+        last_then_this = Player.pay_mana(Player.pay_mana(pools, *last_cost), *cost)
+        this_pools = Player.pay_mana(pools, *cost)
+        if last_then_this is None or this_pools is None:
+            return False
+        return Player.pay_mana(this_pools, *last_cost) == last_then_this
+
+    def take_action(self, mode, card_ref):
+        # Take one of the actions from get_next_actions() on this state.
+        #  Choices (where card_ref is a Card) are remembered for is_redundant_ordering(). No-brainer actions aren't, since the
+        #  search never expands them in any other order.
+        pools = self.get_mana_pools()
+        self.last_branch_action = None
+        if mode == 'play_forests':
+            for cnt in range(min(self.hand.count_cards('Forest'), self.land_drops)):
+                self.play('Forest')
+        elif mode == 'cast_wurm':
+            # Retrieve the wurm from within the deck
+            wurm = self.deck.find_and_remove("Panglacial Wurm", 1)
+            # Add the wurm to our hand
+            self.hand.extend(wurm)
+            # Cast the wurm
+            self.play(wurm[0])
+            self.can_cast_wurm_now = False
+        elif mode == 'pass':
+            self.start_turn()
+        elif mode == 'skip_playing':
+            self.hand.get_card(card_ref).skip_playing_this_turn = True
+        elif isinstance(card_ref, Card):
+            card = card_ref
+            if mode == 'activate':
+                self.activate(self.table.get_card(card.uid))
+            else:
+                getattr(self, mode)(card.name)
+            self.last_branch_action = (card.__class__, mode, card.uid if mode == 'activate' else -1, pools)
+        else:
+            getattr(self, mode)(card_ref)
+
+    def branch(self, mode, card_ref) -> 'Player':
+        # Copy this state and take an action in the copy
+        copy = self.copy()
+        copy.take_action(mode, card_ref)
+        copy.branch_card = Player.get_action_card_name(mode, card_ref)
+        return copy
+
+    @staticmethod
+    def get_action_card_name(mode, card_ref) -> str:
+        # The card that an action from get_next_actions() is for, by name
+        if mode == 'play_forests':
+            return 'Forest'
+        elif mode == 'cast_wurm':
+            return 'Panglacial Wurm'
+        elif mode == 'pass':
+            return '(pass)'
+        return get_card_ref_name(card_ref)
+
+    def mark(self) -> int:
+        # Start recording changes to this (journaled) state, and return the mark that undo() can take it back to
+        global undo_log
+        if undo_log is None:
+            undo_log = UndoLog()
+        return len(undo_log.entries)
+
+    def make(self, mode, card_ref) -> int:
+        # Take an action in place instead of in a copy, recording every change in the undo log so that undo() can take it
+        #  back again. Returns the mark to undo to. Only journaled states (see to_journaled_player()) can do this.
+        mark = self.mark()
+        self.take_action(mode, card_ref)
+        return mark
+
+    def undo(self, mark):
+        global undo_log
+        undo_log.undo(mark)
+        if mark == 0:
+            undo_log = None
+
+    def get_next_actions(self) -> List[tuple]:
+        # Return a list of the actions that are possible from the current state, as (mode, card_ref) pairs for take_action().
+        #  Returns None if every option was a different order of something that's expanded elsewhere.
+        actions = []
+
+        # If we can Belcher the opponent out right now, then there's nothing else worth considering.
+        if self.settle_belcher_lethal:
+            belcher = self.table.get_card('Goblin Charbelcher', player=self, can_activate=True)
+            if belcher is not None and belcher.is_lethal(self):
+                return [('activate', belcher.name)]
+
+        # Check if we can cast a Panglacial Wurm
+        #  Note that we're technically checking this after the resolution of whatever spell
+        #   did the searching, but because the check that set this flag looked at the amount
+        #   of mana that was available at the time of the search, we can cast the Panglacial
+        #   Wurm now without any loss of gameplay integrity.
+        if self.can_cast_wurm_now:
+            actions.append(('cast_wurm', None))
+
+            # If we don't take advantage of it now, we've lost the opportunity for later.
+            self.can_cast_wurm_now = False
+
+        # No-brainer decisions:
+        #  * If we have a Lotus Cobra we can play, then play it before we play any lands
+        #  * If we have a land in our hand, play it
+        #  * If we can cast Land Grant for free, then do so
+        #  * If we can attack with a creature, then do so
+        #  Otherwise, loop through all other cards in hand and activations (if any) and evaluate them.
+
+        # Landfall triggers take priority, so we want to play things with landfall triggers (like Lotus Cobra and Spelunking) first
+        # This is not a perfect system (I.E., what if we untap with 1 land and have an Elvish Spirit Guide + Forest + Lotus in hand)
+        #  but it's a good enough approximation for now.
+        # TODO: Fix our system of Elvish Spirit Guide mana by adding it to a persistent mana pool that is always spent LAST and carried from turn to turn.
+
+        # Instant mana sources like Elvish Spirit Guide, Simian Spirit Guide, and Lotus Petal should be played first.
+        #  This is because they can be used to pay for other cards that we play this turn.
+        if self.can_alt_play('Elvish Spirit Guide'):
+            actions.append(('alt_play', 'Elvish Spirit Guide'))
+        elif self.can_alt_play('Simian Spirit Guide'):
+            actions.append(('alt_play', 'Simian Spirit Guide'))
+        # Next, cards with landfall triggers should be played next.
+        elif self.can_play('Lotus Cobra'):
+            actions.append(('play', 'Lotus Cobra'))
+        # Land drops take next priority -- always do those first UNLESS we have a Lotus Cobra in hand that we can cast
+        # If we can drop a land, and we have 1 or more lands in hand, then play them.
+        elif self.land_drops > 0 and self.hand.count_cards('Forest') > 0:
+            actions.append(('play_forests', None))
+        # Otherwise, if we can play Land Grant for its alternate cost, do that.
+        elif self.can_alt_play('Land Grant'):
+            actions.append(('alt_play', 'Land Grant'))
+        # Check to see if we can attack with any creatures
+         # Can we attack with Chancellor?
+        elif self.can_activate('Chancellor of the Tangle'):
+            # Find the first copy of Chancellor in our new table that can be activated.
+            actions.append(('activate', 'Chancellor of the Tangle'))
+         # Can we attack with Panglacial Wurm?
+        elif self.panglacial_in_deck and self.can_activate('Panglacial Wurm'):
+            actions.append(('activate', 'Panglacial Wurm'))
+        # NOTE: If one wants to make saccing Steve a no-brainer, then uncomment the following lines.
+        # Leaving this commented will increase branching permutations, but may be worth it
+        #  for selectively saving the activation for things like Caravan Vigil or Panglacial Wurm.
+        #elif self.can_activate('Sakura-Tribe Elder'):
+        #    actions.append(('activate', 'Sakura-Tribe Elder'))
+        else:
+            # Get a list of every unique card name in the hand
+            unique_hand_cards = []
+            for card in self.hand:
+                if card not in unique_hand_cards and not card.skip_playing_this_turn:
+                    unique_hand_cards.append(card)
+
+            # For every card, if it is flagged to consider not playing it, then create a branch where we don't play it.
+            for card in self.hand:
+                # TODO: Fix this
+                if False and card.consider_not_playing and not card.skip_playing_this_turn:
+                    actions.append(('skip_playing', card.uid))
+
+            # Actions that commute with the one that got us here are only expanded in one order, before making any copies.
+            can_reorder = self.can_reorder_actions()
+            skipped_orderings = 0
+
+            # For every unique card, if we can play that card, then play it.  Don't branch more than once for each card name.
+            for card in unique_hand_cards:
+                can_altplay = self.can_alt_play(card.name)
+
+                # Only play it for regular if the card doesn't prefer to be alt played
+                if self.can_play(card.name) and not (can_altplay and card.prefer_alt):
+                    if can_reorder and self.is_redundant_ordering(card, 'play'):
+                        skipped_orderings += 1
+                    else:
+                        actions.append(('play', card))
+                if can_altplay:
+                    if can_reorder and self.is_redundant_ordering(card, 'alt_play'):
+                        skipped_orderings += 1
+                    else:
+                        actions.append(('alt_play', card))
+
+            # However, for cards already on the field, we can activate multiples of the same card
+
+            # Attempt to activate every card on the table
+            for card in self.table:
+                if self.can_activate(card):
+                    if can_reorder and self.is_redundant_ordering(card, 'activate'):
+                        skipped_orderings += 1
+                    else:
+                        actions.append(('activate', card))
+
+            # If every option was a different order of something that's expanded elsewhere, then so is everything after this state.
+            #  (Passing the turn isn't an option here, because it wouldn't be one if we hadn't skipped anything.)
+            if skipped_orderings > 0 and len(actions) == 0:
+                return None
+
+            # Always consider the option of just passing the turn.
+            # Note that this will increase branching permutations and may be of questionable value.
+            # TODO: Evaluate the baseline to see if this measurably increases win rate or not.
+            # Just because we CAN do something on our turn, is there ever any benefit to NOT doing it on our turn?
+            # Or should we attempt to always use every resource available to us?
+            # NOTE: Examples of cards that may benefit from this are:
+            #   * Simian Spirit Guide
+            #   * Elvish Spirit Guide
+            #   * Possibly Caravan Vigil...?
+            #actions.append(('pass', None))
+
+        # If after all that, there's nothing to do, then go to the next turn.
+        if len(actions) == 0:
+            actions.append(('pass', None))
+
+        return actions
+
     def step_next_actions(self) -> List['Player']:
         if self.is_pruned:
             return []
 
         if len(self.childstates) == 0:
-            next_states = []
-
             # Return a list of game states that are possible from the current state
             # This is used to generate a tree of possible game states
             if self.check_win():
@@ -432,156 +841,58 @@ class Player:
                 self.childstates = [self]
                 return self.childstates
 
-            # Check if we can cast a Panglacial Wurm
-            #  Note that we're technically checking this after the resolution of whatever spell
-            #   did the searching, but because the check that set this flag looked at the amount
-            #   of mana that was available at the time of the search, we can cast the Panglacial
-            #   Wurm now without any loss of gameplay integrity.
-            if self.can_cast_wurm_now:
-                # Make a copy of the current state
-                new_state = self.copy()
-                # Retrieve the wurm from within the deck
-                wurm = new_state.deck.find_and_remove("Panglacial Wurm", 1)
-                # Add the wurm to our hand
-                new_state.hand.append(wurm)
-                # Cast the wurm
-                new_state.play(wurm[0])
-                new_state.can_cast_wurm_now = False
-                # Add the new state to the list of child states
-                next_states.append(new_state)
-
-                # If we don't take advantage of it now, we've lost the opportunity for later.
-                self.can_cast_wurm_now = False
-
-            # No-brainer decisions:
-            #  * If we have a Lotus Cobra we can play, then play it before we play any lands
-            #  * If we have a land in our hand, play it
-            #  * If we can cast Land Grant for free, then do so
-            #  * If we can attack with a creature, then do so
-            #  Otherwise, loop through all other cards in hand and activations (if any) and evaluate them.
-
-            # Landfall triggers take priority, so we want to play things with landfall triggers (like Lotus Cobra and Spelunking) first
-            # This is not a perfect system (I.E., what if we untap with 1 land and have an Elvish Spirit Guide + Forest + Lotus in hand)
-            #  but it's a good enough approximation for now.
-            # TODO: Fix our system of Elvish Spirit Guide mana by adding it to a persistent mana pool that is always spent LAST and carried from turn to turn.
-
-            # Instant mana sources like Elvish Spirit Guide, Simian Spirit Guide, and Lotus Petal should be played first.
-            #  This is because they can be used to pay for other cards that we play this turn.
-            if self.can_alt_play('Elvish Spirit Guide'):
-                copy = self.copy()
-                copy.alt_play('Elvish Spirit Guide')
-                next_states.append(copy)
-            elif self.can_alt_play('Simian Spirit Guide'):
-                copy = self.copy()
-                copy.alt_play('Simian Spirit Guide')
-                next_states.append(copy)
-            # Next, cards with landfall triggers should be played next.
-            elif self.can_play('Lotus Cobra'):
-                copy = self.copy()
-                copy.play('Lotus Cobra')
-                next_states.append(copy)
-            # Land drops take next priority -- always do those first UNLESS we have a Lotus Cobra in hand that we can cast
-            # If we can drop a land, and we have 1 or more lands in hand, then play them.
-            elif self.land_drops > 0 and self.hand.count_cards('Forest') > 0:
-                copy = self.copy()
-                for cnt in range(min(self.hand.count_cards('Forest'), self.land_drops)):
-                    copy.play('Forest')
-                next_states.append(copy)
-            # Otherwise, if we can play Land Grant for its alternate cost, do that.
-            elif self.can_alt_play('Land Grant'):
-                copy = self.copy()
-                copy.alt_play('Land Grant')
-                next_states.append(copy)
-            # Check to see if we can attack with any creatures
-             # Can we attack with Chancellor?
-            elif self.can_activate('Chancellor of the Tangle'):
-                # Find the first copy of Chancellor in our new table that can be activated.
-                copy = self.copy()
-                copy.activate('Chancellor of the Tangle')
-                next_states.append(copy)
-             # Can we attack with Panglacial Wurm?
-            elif self.panglacial_in_deck and self.can_activate('Panglacial Wurm'):
-                copy = self.copy()
-                copy.activate('Panglacial Wurm')
-                next_states.append(copy)
-            # NOTE: If one wants to make saccing Steve a no-brainer, then uncomment the following lines.
-            # Leaving this commented will increase branching permutations, but may be worth it
-            #  for selectively saving the activation for things like Caravan Vigil or Panglacial Wurm.
-            #elif self.can_activate('Sakura-Tribe Elder'):
-            #    copy = self.copy()
-            #    copy.activate('Sakura-Tribe Elder')
-            #    next_states.append(copy)
+            actions = self.next_actions
+            if actions is None:
+                actions = self.get_next_actions()
             else:
-                # Get a list of every unique card name in the hand
-                unique_hand_cards = []
-                for card in self.hand:
-                    if card not in unique_hand_cards and not card.skip_playing_this_turn:
-                        unique_hand_cards.append(card)
-
-                # For every card, if it is flagged to consider not playing it, then create a branch where we don't play it.
-                for card in self.hand:
-                    # TODO: Fix this
-                    if False and card.consider_not_playing and not card.skip_playing_this_turn:
-                        copy = self.copy()
-                        copy_card = copy.hand.get_card(card.uid)
-                        copy_card.skip_playing_this_turn = True
-                        next_states.append(copy)
-
-                # For every unique card, if we can play that card, then play it.  Don't branch more than once for each card name.
-                for card in unique_hand_cards:
-                    can_altplay = self.can_alt_play(card.name)
-
-                    # Only play it for regular if the card doesn't prefer to be alt played
-                    if self.can_play(card.name) and not (can_altplay and card.prefer_alt):
-                        copy = self.copy()
-                        copy.play(card.name)
-                        next_states.append(copy)
-                    if can_altplay:
-                        copy = self.copy()
-                        copy.alt_play(card.name)
-                        next_states.append(copy)
-
-                # However, for cards already on the field, we can activate multiples of the same card
-
-                # Attempt to activate every card on the table
-                for card in self.table:
-                    if self.can_activate(card):
-                        copy = self.copy()
-                        copy_card = copy.table.get_card(card.uid)
-                        copy.activate(copy_card)
-                        next_states.append(copy)
-
-                # Always consider the option of just passing the turn.
-                # Note that this will increase branching permutations and may be of questionable value.
-                # TODO: Evaluate the baseline to see if this measurably increases win rate or not.
-                # Just because we CAN do something on our turn, is there ever any benefit to NOT doing it on our turn?
-                # Or should we attempt to always use every resource available to us?
-                # NOTE: Examples of cards that may benefit from this are:
-                #   * Simian Spirit Guide
-                #   * Elvish Spirit Guide
-                #   * Possibly Caravan Vigil...?
-                #copy = self.copy()
-                #copy.start_turn()
-                #next_states.append(copy)
-
-            self.childstates = next_states
-
-        # If after all that, child states is still empty, then go to the next turn.
-        if len(self.childstates) == 0:
-            copy = self.copy()
-            copy.start_turn()
-            self.childstates.append(copy)
+                # Don't copy them into the children
+                del self.next_actions
+            if actions is None or len(actions) == 0:
+                self.is_pruned = True
+                return []
+
+            self.childstates = [self.branch(mode, card_ref) for mode, card_ref in actions]
+            if self.collapse_forced_actions:
+                for child in self.childstates:
+                    child.take_forced_actions()
 
         return self.childstates
 
+    def take_forced_actions(self):
+        # Macro-actions: Keep taking the only action that this state has in place, until it reaches a real decision (or wins).
+        #  Every forced action would otherwise cost a copy of the state, a level of the tree, and a step of the search.
+        #  This stops once the turn is passed, since the search takes the first win that a step finds as the fastest one,
+        #  which only holds if every state that a step makes is still on the turn that it started on.
+        while not self.check_win():
+            # get_next_actions() can change the state (see can_cast_wurm_now), so keep what it returns for step_next_actions()
+            actions = self.get_next_actions()
+            if actions is None or len(actions) != 1:
+                self.next_actions = actions if actions is not None else []
+                return
+            mode, card_ref = actions[0]
+            self.take_action(mode, card_ref)
+            if mode == 'pass':
+                return
+
 
     def copy(self) -> 'Player':
         # Serialize self into a string
         ser = self.serialize()
         # Deserialize the string into a new Player object
         copy = Player.deserialize(ser)
+        # Children only remember the action that led to them (see branch())
+        copy.last_branch_action = None
         return copy
 
+    def release(self):
+        # Hand this (pruned) state's zones back to the zone pool. The state can't be used after this.
+        for zone in (self.deck, self.hand, self.graveyard, self.table, self.exile):
+            zone_pool.release(zone)
+        # Only keep what's needed to walk the tree through this state (see montecarlo.get_all_leaf_nodes()), so that the
+        #  shell left behind is a small fraction of the state's size
+        self.__dict__ = {'childstates': self.childstates, 'is_pruned': self.is_pruned, 'is_released': True,
+                         'deck': None, 'hand': None, 'graveyard': None, 'table': None, 'exile': None}
+
     def serialize(self):
         # Cache the pickle dump so that we don't do this any more frequently than we have to.
         if self.pickledump is None:
@@ -628,6 +939,34 @@ class Player:
         # Current turn, number of lands left in our deck, number of cards in hand, mana in our pool, lands on the field, opponent's life total, and the last log entry
         return f"{self.current_turn})  LID: {self.deck.count_cards('Forest')}  H: {len(self.hand)}  Mana: {self.mana_pool}/{self.lands} ({self.colorless_mana_pool}/{self.colorless_lands}) [{self.hand.count_cards('Forest')}]  OLife: {self.opponent_lifetotal} '{self.log[-1]}'"
 
+    def get_dominance_profile(self) -> tuple:
+        # Describe this state for dominance pruning (see montecarlo.DominanceIndex) as (key, resources, hand, table, exile).
+        #  Two states can only be compared if their keys are the same. Those are the things that are either not a resource
+        #  (the library has to be the same cards in the same order, or the draws would differ) or not more-is-better (like
+        #  creature_died_this_turn, which some cards need to be False). A state dominates another one with the same key if
+        #  it has at least as much of every resource, and the other's cards in hand, on the table, and in exile are a subset
+        #  of its own. Cards are counted by name, and again by name and 'untapped' (or 'playable', for the ones in hand that
+        #  aren't being saved for a later turn), so an untapped copy can stand in for a tapped one, but not the other way around.
+        key = (self.current_turn, tuple([card.name for card in self.deck]), self.creature_died_this_turn, self.can_cast_wurm_now,
+               self.has_delirium(), self.has_spellmastery())
+        resources = (self.mana_pool, self.colorless_mana_pool, self.persistent_mana_pool, self.persistent_colorless_mana_pool,
+                     self.lands, self.colorless_lands, self.land_drops, self.life_total, -self.opponent_lifetotal)
+        hand = {}
+        for card in self.hand:
+            hand[card.name] = hand.get(card.name, 0) + 1
+            if not card.skip_playing_this_turn:
+                hand[(card.name, 'playable')] = hand.get((card.name, 'playable'), 0) + 1
+        table = {}
+        for card in self.table:
+            table[card.name] = table.get(card.name, 0) + 1
+            if not card.is_tapped:
+                table[(card.name, 'untapped')] = table.get((card.name, 'untapped'), 0) + 1
+        # Suspended cards come back sooner with fewer time counters, but keep it simple and only count the same ones
+        exile = {}
+        for card in self.exile:
+            exile[(card.name, card.time_counters)] = exile.get((card.name, card.time_counters), 0) + 1
+        return key, resources, hand, table, exile
+
     # Methods to support testing
     def debug_force_get_card_in_hand(self, card_name, quant=1) -> 'Card':
         # Ensure that the player has the given card in their hand. If they don't, then retrieve on from the deck.
@@ -641,8 +980,128 @@ class Player:
         if LOGGING_ENABLED:
             self.log.append(msg)
 
+# Cards are flyweights: all of the rules data (name, costs, card type, etc.) is immutable and lives on the class,
+#  so it is shared by every copy of a card. Only the handful of per-game state values are stored on each instance,
+#  and they are kept in __slots__ so that cards don't each carry a __dict__ around (which makes them much cheaper to pickle and copy).
+class CardMeta(type):
+    def __new__(mcs, name, bases, namespace):
+        # Card subclasses only hold class-level rules data, so give them empty __slots__ unless they declare their own.
+        namespace.setdefault('__slots__', ())
+        card_class = super().__new__(mcs, name, bases, namespace)
+        # Compile the card's declarative rules (see card_effects below) into tables of (function, argument) pairs, so that
+        #  taking an action just runs down a table instead of looking anything up by name.
+        for mode in ('play', 'alt_play', 'activate'):
+            setattr(card_class, f'{mode}_effect_table', compile_card_rules(card_effects, getattr(card_class, f'{mode}_effects', ()), name))
+            setattr(card_class, f'{mode}_condition_table', compile_card_rules(card_conditions, getattr(card_class, f'{mode}_conditions', ()), name))
+        return card_class
+
+# Cards are pickled as their class plus a flat tuple of per-instance state, which is both smaller and faster to restore than a dict of slots.
+def _restore_card(card_class, uid, is_tapped, skip_playing_this_turn, time_counters, has_gone_on_an_adventure):
+    card = card_class.__new__(card_class)
+    card.uid = uid
+    card.is_tapped = is_tapped
+    card.skip_playing_this_turn = skip_playing_this_turn
+    card.time_counters = time_counters
+    card.has_gone_on_an_adventure = has_gone_on_an_adventure
+    return card
+
+# Declarative card rules.
+#  Most cards are built out of the same few steps: search the library for Forests, put them into the hand or onto the
+#  battlefield, add lands or mana, draw, sacrifice. Instead of writing play() and can_play() for each of those, a card can
+#  list them as data:
+#   play_effects, alt_play_effects, activate_effects - (effect, argument) steps, run in order when the card is played
+#    (or alt played, or activated). Spells and permanents have to list 'resolve' themselves, wherever it happens.
+#   play_conditions, alt_play_conditions, activate_conditions - (condition, argument) checks that have to pass (on top of
+#    being able to pay the cost) for the card to be played
+#  A card that needs something that these can't express still overrides the methods itself.
+#  Effects are passed the Forests that the last search found (if any), and return what the next effect should be passed.
+def effect_search_forests(controller: 'Player', card: 'Card', count, found) -> List['Card']:
+    found = controller.deck.find_and_remove('Forest', count)
+    controller.check_panglacial()
+    return found
+
+def effect_put_in_hand(controller: 'Player', card: 'Card', argument, found) -> List['Card']:
+    controller.hand.extend(found)
+    return found
+
+def effect_put_onto_battlefield(controller: 'Player', card: 'Card', untapped, found) -> List['Card']:
+    controller.table.extend(found)
+    controller.lands += len(found)
+    if untapped:
+        controller.mana_pool += len(found)
+    return found
+
+def effect_landfall(controller: 'Player', card: 'Card', landcount, found) -> List['Card']:
+    # Triggers landfall for the Forests that were found, unless a land count is given
+    controller.trigger_landfall(len(found) if landcount is None else landcount)
+    return found
+
+def effect_resolve(controller: 'Player', card: 'Card', argument, found) -> List['Card']:
+    card.resolve(controller)
+    return found
+
+def effect_sacrifice(controller: 'Player', card: 'Card', argument, found) -> List['Card']:
+    if not card in controller.table:
+        raise Exception(f"{card.name} is not on the battlefield")
+    controller.table.remove(card)
+    controller.graveyard.append(card)
+    if card.cardtype == 'Creature':
+        controller.creature_died_this_turn = True
+    return found
+
+def effect_add_lands(controller: 'Player', card: 'Card', count, found) -> List['Card']:
+    controller.lands += count
+    return found
+
+def effect_add_mana(controller: 'Player', card: 'Card', count, found) -> List['Card']:
+    controller.mana_pool += count
+    return found
+
+def effect_add_land_drops(controller: 'Player', card: 'Card', count, found) -> List['Card']:
+    controller.land_drops += count
+    return found
+
+def effect_draw(controller: 'Player', card: 'Card', count, found) -> List['Card']:
+    controller.draw(count)
+    return found
+
+card_effects = {
+    'search_forests': effect_search_forests, # Search the library for up to this many Forests
+    'put_in_hand': effect_put_in_hand, # Put the Forests that were found into the hand
+    'put_onto_battlefield': effect_put_onto_battlefield, # Put the Forests that were found onto the battlefield (untapped if the argument is True)
+    'landfall': effect_landfall,
+    'resolve': effect_resolve, # Put the card onto the battlefield or into the graveyard
+    'sacrifice': effect_sacrifice, # Put the card from the battlefield into the graveyard
+    'add_lands': effect_add_lands,
+    'add_mana': effect_add_mana,
+    'add_land_drops': effect_add_land_drops,
+    'draw': effect_draw,
+}
+
+card_conditions = {
+    # Passes if there's a Forest to find, or if the search could find a Panglacial Wurm to cast (with this much mana spent on the search)
+    'can_search_forests': lambda controller, card, cost: controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(cost),
+    'forests_in_library': lambda controller, card, count: controller.deck.count_cards('Forest') >= count,
+    'no_forests_in_hand': lambda controller, card, argument: controller.hand.count_cards('Forest') == 0,
+    'land_drops': lambda controller, card, argument: controller.land_drops > 0,
+    'on_table': lambda controller, card, argument: card in controller.table,
+    'none_on_table': lambda controller, card, cardname: controller.table.count_cards(cardname) == 0,
+    'creature_died': lambda controller, card, died: controller.creature_died_this_turn == died,
+}
+
+def compile_card_rules(rule_functions, rules, cardname) -> tuple:
+    compiled = []
+    for rule, argument in rules:
+        if rule not in rule_functions:
+            raise Exception(f'Unknown card rule {rule} in {cardname}')
+        compiled.append((rule_functions[rule], argument))
+    return tuple(compiled)
+
 # Define generic Card class that has a cost, name, and ability function
-class Card:
+class Card(metaclass=CardMeta):
+    # Mutable per-instance state. Everything else is rules data shared through the class.
+    __slots__ = ('uid', 'is_tapped', 'skip_playing_this_turn', 'time_counters', 'has_gone_on_an_adventure')
+
     name:str = 'card'
     cost:int = 0
     colorless_cost:int = 0 # Colorless portion of the cost
@@ -654,10 +1113,42 @@ class Card:
     prefer_alt:bool = False # If the alternate cost is available, don't evaluate the regular cost.  This is useful for cards like Caravan Vigil and Land Grant.
     deck_max_quant:int = 4 # How many of these cards can we play in our deck?
     consider_not_playing:bool = False # Set to True if this is a card that we can potentially gain advantage by saving to a future turn -- even if we can play it. Example would be cards that add mana, like Elvish Spirit Guide.
-    skip_playing_this_turn:bool = False # Flag to mark when this card should be skipped and saved for a future turn
+    starts_tapped:bool = False # Whether is_tapped starts out as True for new instances of this card
     power:int = None
     toughness:int = None
-    uid:int = -1
+    # The parts of the game state that this card's actions look at (reads) and change (writes), used to tell when two actions
+    #  commute so that the search only expands one order of them. See Player.is_redundant_ordering(). Resources are:
+    #   'mana' - adds mana, or looks at the mana pool for more than paying its own cost (paying costs is checked separately)
+    #   'library' - the order of the library (drawing, revealing, looking at the top, shuffling)
+    #   'forests' - searches Forests out of the library (or looks at exactly how many are left)
+    #   'hand' - puts cards other than Forests into the hand. Playing a card from hand always reads this, because it has to be there already.
+    #   'hand_forests' - the Forests in hand
+    #   'table', 'lands', 'land_drops', 'graveyard', 'exile', 'creature_died', 'life', 'opponent_life'
+    #  Changes to the same resource are assumed to commute with each other (adding and removing cards, adding to counters), so
+    #  anything that depends on the order of changes (like drawing) has to read the resource too. The library is the exception:
+    #  searching it reshuffles it with the fixed seed, so the order of the library depends on the order of every change to
+    #  it. get_footprint() makes everything that writes 'library' read it as well.
+    #  None means the card hasn't declared its footprint, so its actions never commute with anything.
+    reads:frozenset = None
+    writes:frozenset = None
+    # Declarative rules (see card_effects). By default, playing a card just resolves it, and activating it does nothing.
+    play_effects:tuple = (('resolve', None),)
+    alt_play_effects:tuple = (('resolve', None),)
+    activate_effects:tuple = ()
+    play_conditions:tuple = ()
+    alt_play_conditions:tuple = ()
+    activate_conditions:tuple = ()
+
+    def __init__(self):
+        self.uid:int = -1
+        self.is_tapped:bool = self.starts_tapped
+        self.skip_playing_this_turn:bool = False # Flag to mark when this card should be skipped and saved for a future turn
+        self.time_counters:int = 0
+        self.has_gone_on_an_adventure:bool = False
+
+    def __reduce__(self):
+        # Only the per-instance state needs to be pickled -- the rules data comes back with the class.
+        return (_restore_card, (self.__class__, self.uid, self.is_tapped, self.skip_playing_this_turn, self.time_counters, self.has_gone_on_an_adventure))
 
     def __str__(self):
         return self.name
@@ -666,7 +1157,7 @@ class Card:
         return self.name + f" [{self.cost}]   Can play: {self.can_play(controller)} / {self.can_alt_play(controller)}   Can activate: {self.can_activate(controller)}"
 
     def play(self, controller: Player):
-        self.resolve(controller)
+        self.run_effects(controller, self.play_effect_table)
 
     def resolve(self, controller: Player):
         # If it's a permanent, put it on the table
@@ -677,28 +1168,181 @@ class Card:
             controller.graveyard.append(self)
 
     def can_play(self, controller: Player) -> bool:
-        return controller.has_mana(self.cost, self.colorless_cost)
+        return controller.has_mana(self.cost, self.colorless_cost) and self.check_conditions(controller, self.play_condition_table)
 
     def alt_play(self, controller: Player):
-        self.resolve(controller)
+        self.run_effects(controller, self.alt_play_effect_table)
 
     def can_alt_play(self, controller: Player) -> bool:
-        return controller.has_mana(self.alt_cost, self.colorless_alt_cost)
+        return controller.has_mana(self.alt_cost, self.colorless_alt_cost) and self.check_conditions(controller, self.alt_play_condition_table)
 
     def activate(self, controller: Player):
-        pass
+        self.run_effects(controller, self.activate_effect_table)
 
     def can_activate(self, controller: Player) -> bool:
-        return controller.has_mana(self.activation_cost, self.colorless_activation_cost)
+        return controller.has_mana(self.activation_cost, self.colorless_activation_cost) and self.check_conditions(controller, self.activate_condition_table)
+
+    def run_effects(self, controller: Player, effect_table):
+        found = None
+        for effect, argument in effect_table:
+            found = effect(controller, self, argument, found)
+
+    def check_conditions(self, controller: Player, condition_table) -> bool:
+        for condition, argument in condition_table:
+            if not condition(controller, self, argument):
+                return False
+        return True
 
     def is_permanent(self) -> bool:
         return not (self.cardtype == 'Instant' or self.cardtype == 'Sorcery')
 
+    @classmethod
+    def get_cost(cls, mode) -> tuple:
+        # Total and colorless cost of playing ('play', 'alt_play') or activating ('activate') this card
+        if mode == 'play':
+            return cls.cost, cls.colorless_cost
+        elif mode == 'alt_play':
+            return cls.alt_cost, cls.colorless_alt_cost
+        return cls.activation_cost, cls.colorless_activation_cost
+
+    @classmethod
+    def get_footprint(cls, mode) -> tuple:
+        if cls.reads is None or cls.writes is None:
+            return None
+        reads = cls.reads
+        if 'library' in cls.writes:
+            reads = reads | {'library'}
+        if mode != 'activate':
+            reads = reads | {'hand'}
+        if cls.get_cost(mode)[0] > 0:
+            reads = reads | {'mana'}
+        return reads, cls.writes
+
     def do_upkeep(self, controller: Player):
         # Reset our skip-playing flag so that we always consider each card fresh on each turn
         self.skip_playing_this_turn = False
         pass
 
+# Make/unmake execution.
+#  A depth-first search (see expectimax.py) can take an action in place with Player.make() and take it back again with
+#  Player.undo(), instead of copying the whole state for every child. While an undo log is active, journaled players,
+#  zones, and cards record the old value of everything that they change in it:
+#   * Attributes of players and zones (counters, flags, etc.), as (object, attribute name, old value)
+#   * The contents of zones, as (zone, None, old contents), whenever they're changed in any way
+#   * The per-instance state of cards, as (card, slot name, old value)
+#  Journaled objects pickle as their regular classes, so copies of a journaled state are regular states again.
+class UndoLog:
+    def __init__(self):
+        self.entries = []
+
+    def record_attr(self, obj, name, value):
+        self.entries.append((obj, name, value))
+
+    def record_zone(self, zone):
+        self.entries.append((zone, None, list(zone)))
+
+    def undo(self, mark):
+        entries = self.entries
+        while len(entries) > mark:
+            obj, name, value = entries.pop()
+            if name is None:
+                # Put back the old contents of a zone, without going through the journaled methods again
+                super(obj.__class__, obj).clear()
+                super(obj.__class__, obj).extend(value)
+            elif value is UNSET:
+                object.__delattr__(obj, name)
+            else:
+                object.__setattr__(obj, name, value)
+
+UNSET = object() # Marks an attribute that only had its class default before it was changed
+undo_log:UndoLog = None # The undo log that journaled objects record their changes in, while a make() is in progress
+
+def journaled_setattr(self, name, value):
+    if undo_log is not None:
+        undo_log.record_attr(self, name, self.__dict__.get(name, UNSET))
+    object.__setattr__(self, name, value)
+
+def journaled_slot_setattr(self, name, value):
+    # Cards keep their state in __slots__, which are always set
+    if undo_log is not None:
+        undo_log.record_attr(self, name, getattr(self, name))
+    object.__setattr__(self, name, value)
+
+def _restore_player(player_class):
+    return player_class.__new__(player_class)
+
+def journal_player_class(player_class):
+    def debug_log(self, msg):
+        # The log is a plain list rather than a zone, so keep a copy of it to put back instead
+        if LOGGING_ENABLED and undo_log is not None:
+            undo_log.record_attr(self, 'log', list(self.log))
+        player_class.debug_log(self, msg)
+    def reduce(self):
+        # Copies don't need the cached pickle dump of the state they were copied from
+        state = self.__dict__.copy()
+        state.pop('pickledump', None)
+        if self.last_branch_action is not None:
+            card_class, mode, uid, pools = self.last_branch_action
+            state['last_branch_action'] = (rules_classes.get(card_class, card_class), mode, uid, pools)
+        return (_restore_player, (player_class,), state)
+    return type('Journaled' + player_class.__name__, (player_class,), {'__slots__': (), '__setattr__': journaled_setattr, 'debug_log': debug_log, '__reduce__': reduce})
+
+def journal_zone_class(zone_class):
+    # Record the old contents of the zone before any method changes it
+    def journaled(method):
+        def journaled_method(self, *args):
+            if undo_log is not None:
+                undo_log.record_zone(self)
+            return method(self, *args)
+        return journaled_method
+    method_names = ['append', 'extend', 'insert', 'remove', 'pop', 'clear', 'reverse', '__setitem__', '__delitem__', '__iadd__']
+    if issubclass(zone_class, deque):
+        method_names += ['appendleft', 'extendleft', 'popleft', 'rotate']
+    else:
+        method_names += ['sort']
+    namespace = {name: journaled(getattr(zone_class, name)) for name in method_names}
+    namespace['__slots__'] = ()
+    namespace['__setattr__'] = journaled_setattr
+    namespace['__reduce__'] = lambda self: (_restore_zone, (zone_class,), self.__dict__, iter(self))
+    return type('Journaled' + zone_class.__name__, (zone_class,), namespace)
+
+def journal_card_class(card_class):
+    def reduce(self):
+        return (_restore_card, (card_class, self.uid, self.is_tapped, self.skip_playing_this_turn, self.time_counters, self.has_gone_on_an_adventure))
+    return type(card_class.__name__, (card_class,), {'__setattr__': journaled_slot_setattr, '__reduce__': reduce})
+
+journaled_classes = {} # The journaled version of each class (and of each journaled class, itself)
+rules_classes = {} # The regular class that each journaled class was made from
+
+def get_journaled_class(cls):
+    # Journaled classes are made as they're needed
+    journaled_class = journaled_classes.get(cls)
+    if journaled_class is None:
+        if issubclass(cls, Player):
+            journaled_class = journal_player_class(cls)
+        elif issubclass(cls, CardsMixin):
+            journaled_class = journal_zone_class(cls)
+        elif issubclass(cls, Card):
+            journaled_class = journal_card_class(cls)
+        else:
+            raise Exception(f'No journaled version of {cls.__name__}')
+        journaled_classes[cls] = journaled_class
+        journaled_classes[journaled_class] = journaled_class
+        rules_classes[journaled_class] = cls
+    return journaled_class
+
+def to_journaled_player(state:Player) -> Player:
+    # Switch a state (and its zones and cards) over to journaled classes, so that it can make() and undo() actions.
+    #  Cards only ever move between the state's zones, so this only has to be done once per state.
+    if state.__class__ in rules_classes:
+        return state
+    state.__class__ = get_journaled_class(state.__class__)
+    for zone in (state.deck, state.hand, state.graveyard, state.table, state.exile):
+        zone.__class__ = get_journaled_class(zone.__class__)
+        for card in zone:
+            card.__class__ = get_journaled_class(card.__class__)
+    return state
+
 # Forest is a card that costs 0 and has an ability that increases a player's land count by 1
 # ASSUMPTION: We always tap every land for mana immediately.
 #  Adding a land to the battlefield untapped is to increase the controller's land count
@@ -712,31 +1356,21 @@ class Forest (Card):
     cost:int = 0
     cardtype = 'Land'
     deck_max_quant:int = 10 # No limit on lands to play in our deck
-
-    def can_play(self, controller: Player) -> bool:
-        return controller.land_drops > 0
-
-    def play(self, controller: Player):
-        controller.lands += 1
-        controller.mana_pool += 1 # Assume that every land is immediately tapped for mana when it's played.
-        controller.land_drops -= 1
-        super().play(controller)
-        controller.trigger_landfall()
+    reads = frozenset({'land_drops'})
+    writes = frozenset({'land_drops', 'lands', 'mana', 'table'})
+    play_conditions = (('land_drops', None),)
+    # Assume that every land is immediately tapped for mana when it's played.
+    play_effects = (('add_lands', 1), ('add_mana', 1), ('add_land_drops', -1), ('resolve', None), ('landfall', 1))
 
 # Lay of the Land is a card that costs 1 and has an ability that searches the deck for a land and puts it into the player's hand
 class LayOfTheLand (Card):
     name = 'Lay of the Land'
     cost:int = 1
     cardtype = 'Sorcery'
-
-    def can_play(self, controller: Player) -> bool:
-        return super().can_play(controller) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
-
-    def play(self, controller: Player):
-        cards = controller.deck.find_and_remove('Forest', 1)
-        controller.check_panglacial()
-        controller.hand.extend(cards)
-        super().play(controller)
+    reads = frozenset()
+    writes = frozenset({'forests', 'library', 'hand_forests', 'graveyard'})
+    play_conditions = (('can_search_forests', cost),)
+    play_effects = (('search_forests', 1), ('put_in_hand', None), ('resolve', None))
 
 # Caravan Vigil is a card that costs 1 and has an ability that says: Search your library for a basic land card, reveal it, put it into your hand, then shuffle your library. You may put that card onto the battlefield instead of putting it into your hand if a creature died this turn.
 # NOTE: The morbid mode of the card is done as an alternate play, so that we can more easily track its effect on the game.
@@ -748,33 +1382,14 @@ class CaravanVigil (Card):
     prefer_alt:bool = True
     consider_not_playing:bool = True # If we have Sakura-Tribe Elder, then we can get a big benefit by holding onto this card until Morbid is active.
     
-    def __init__(self):
-        self.mana_value = 1
-        pass
-
-    def can_play(self, controller: Player) -> bool:
-        # NOTE: If there is a Sakura-Tribe Elder on the battlefield or morbid is active, then don't play this card the regular way -- wait for the better one.
-        return super().can_play(controller) and (controller.table.count_cards('Sakura-Tribe Elder') == 0) and (not controller.creature_died_this_turn) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
-
-    def play(self, controller: Player):
-        cards = controller.deck.find_and_remove('Forest', 1)
-        controller.check_panglacial()
-        controller.hand.extend(cards)
-        super().play(controller)
-
-    def can_alt_play(self, controller: Player) -> bool:
-        return super().can_alt_play(controller) and controller.deck.count_cards('Forest') > 0 and controller.creature_died_this_turn
-
-    def alt_play(self, controller: Player) -> bool:
-        cards = controller.deck.find_and_remove('Forest', 1)
-        controller.check_panglacial()
-        # Add the land to the battlefield
-        controller.table.extend(cards)
-        controller.lands += len(cards)
-        # The land comes into play untapped
-        controller.mana_pool += len(cards)
-        super().alt_play(controller)
-        controller.trigger_landfall(len(cards))
+    reads = frozenset({'table', 'creature_died'})
+    writes = frozenset({'forests', 'library', 'hand_forests', 'table', 'lands', 'mana', 'graveyard'})
+    # NOTE: If there is a Sakura-Tribe Elder on the battlefield or morbid is active, then don't play this card the regular way -- wait for the better one.
+    play_conditions = (('none_on_table', 'Sakura-Tribe Elder'), ('creature_died', False), ('can_search_forests', cost))
+    play_effects = (('search_forests', 1), ('put_in_hand', None), ('resolve', None))
+    # The land comes into play untapped
+    alt_play_conditions = (('forests_in_library', 1), ('creature_died', True))
+    alt_play_effects = (('search_forests', 1), ('put_onto_battlefield', True), ('resolve', None), ('landfall', None))
 
 # Traverse the Ulvenwald is a card that costs 1 and has an ability that says: Search your library for a basic land card, reveal it, put it into your hand, then shuffle your library. Delirium - If there are four or more card types among cards in your graveyard, instead search your library for a creature or land card, reveal it, put it into your hand, then shuffle your library.
 #  We will implement the delirium mode as an alternate play, so that we can more easily track its effect on the game.
@@ -822,29 +1437,11 @@ class SakuraTribeElder (Card):
     activation_cost:int = 0
     power:int = 1
     toughness:int = 1
-
-    def can_activate(self, controller: Player) -> bool:
-        return (self in controller.table
-            and (
-                controller.deck.count_cards('Forest') > 0
-                or controller.panglacial_potential(self.activation_cost))
-            )
-
-    def activate(self, controller: Player):
-        cards = controller.deck.find_and_remove('Forest', 1)
-        controller.check_panglacial()
-        # Add a tapped forest
-        controller.table.extend(cards)
-        controller.lands += len(cards)
-        # Destroy self
-        if not self in controller.table:
-            raise Exception("Sakura-Tribe Elder is not on the battlefield")
-        controller.table.remove(self)
-        controller.graveyard.append(self)
-        # Mark that a creature died this turn
-        controller.creature_died_this_turn = True
-        # Trigger landfall
-        controller.trigger_landfall(len(cards))
+    reads = frozenset()
+    writes = frozenset({'forests', 'library', 'table', 'lands', 'graveyard', 'creature_died'})
+    activate_conditions = (('on_table', None), ('can_search_forests', activation_cost))
+    # Add a tapped forest, then sacrifice ourselves (which marks that a creature died this turn)
+    activate_effects = (('search_forests', 1), ('put_onto_battlefield', False), ('sacrifice', None), ('landfall', None))
 
 # Arboreal Grazer is a creature that costs 1 that says "When Arboreal Grazer enters the battlefield, you may put a land card from your hand onto the battlefield tapped."
 class ArborealGrazer (Card):
@@ -853,6 +1450,8 @@ class ArborealGrazer (Card):
     cardtype = 'Creature'
     power:int = 0
     toughness:int = 3
+    reads = frozenset({'hand_forests', 'land_drops'})
+    writes = frozenset({'hand_forests', 'table', 'lands'})
 
     def play(self, controller: Player):
         super().play(controller)
@@ -875,6 +1474,8 @@ class KrosanWayfarer (Card):
     activation_cost:int = 0
     power:int = 1
     toughness:int = 1
+    reads = frozenset({'hand_forests', 'land_drops'})
+    writes = frozenset({'hand_forests', 'table', 'lands', 'mana', 'graveyard'})
 
     def play(self, controller: Player):
         super().play(controller)
@@ -910,9 +1511,8 @@ class SkyshroudRanger (Card):
     power:int = 1
     toughness:int = 1
     deck_max_quant:int = 8 # Because Sakura-Tribe Scout is a functional duplicate, we can play 8 of these in our deck.
-
-    def __init__(self):
-        self.is_tapped = False
+    reads = frozenset({'hand_forests'})
+    writes = frozenset({'hand_forests', 'table', 'lands', 'mana'})
 
     def play(self, controller: Player):
         # Represent summoning sickness by coming into play tapped.
@@ -943,27 +1543,12 @@ class ReclaimTheWastes (Card):
     alt_cost:int = 4
     colorless_alt_cost:int = 3 # Colorless portion of the alternate cost
     cardtype = 'Sorcery'
-
-    def __init__(self):
-        pass
-
-    def can_play(self, controller: Player) -> bool:
-        return super().can_play(controller) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
-
-    def play(self, controller: Player):
-        cards = controller.deck.find_and_remove('Forest', 1)
-        controller.check_panglacial()
-        controller.hand.extend(cards)
-        super().play(controller)
-
-    def can_alt_play (self, controller: Player) -> bool:
-        return super().can_alt_play(controller) and controller.deck.count_cards('Forest') > 1
-
-    def alt_play(self, controller: Player):
-        cards = controller.deck.find_and_remove('Forest', 2)
-        controller.check_panglacial()
-        controller.hand.extend(cards)
-        super().alt_play(controller)
+    reads = frozenset()
+    writes = frozenset({'forests', 'library', 'hand_forests', 'graveyard'})
+    play_conditions = (('can_search_forests', cost),)
+    play_effects = (('search_forests', 1), ('put_in_hand', None), ('resolve', None))
+    alt_play_conditions = (('forests_in_library', 2),)
+    alt_play_effects = (('search_forests', 2), ('put_in_hand', None), ('resolve', None))
 
 # Land Grant is a card that costs 2 and has an ability that searches the deck for a land and puts it into the player's hand
 # However, if the player has no lands in hand, it costs 0.
@@ -975,26 +1560,12 @@ class LandGrant(Card):
     alt_cost:int = 0
     cardtype = 'Sorcery'
     prefer_alt = True
-
-    def can_play(self, controller: Player) -> bool:
-        return super().can_play(controller) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
-
-    def play(self, controller: Player):
-        cards = controller.deck.find_and_remove('Forest', 1)
-        controller.check_panglacial()
-        controller.hand.extend(cards)
-        super().play(controller)
-
-    def can_alt_play(self, controller: Player) -> bool:
-        return (super().can_alt_play(controller)
-            and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.alt_cost))
-            and controller.hand.count_cards('Forest') == 0)
-
-    def alt_play(self, controller: Player):
-        cards = controller.deck.find_and_remove('Forest', 1)
-        controller.check_panglacial()
-        controller.hand.extend(cards)
-        super().alt_play(controller)
+    reads = frozenset({'hand_forests'})
+    writes = frozenset({'forests', 'library', 'hand_forests', 'graveyard'})
+    play_conditions = (('can_search_forests', cost),)
+    play_effects = (('search_forests', 1), ('put_in_hand', None), ('resolve', None))
+    alt_play_conditions = (('can_search_forests', alt_cost), ('no_forests_in_hand', None))
+    alt_play_effects = play_effects
 
 # Goblin Charbelcher is a card that costs 4. It has an Activation ability that costs 3, and when activated, removes cards from the top of the library until a land is reached.  It reduces the enemy life total by the number of cards revealed this way and puts them all onto the bottom of the library.
 # NOTE: If we permit the game to activate Belcher prior to removing all lands from the deck, it will be possible to win much faster. HOWEVER, this is also "cheating" in that the game knows the contents of the deck and can therefore make a decision that the player cannot.
@@ -1008,9 +1579,8 @@ class GoblinCharbelcher(Card):
     activation_cost:int = 3
     colorless_activation_cost:int = 3 # Colorless portion of the activation cost
     cardtype = 'Artifact'
-
-    def __init__(self):
-        self.is_tapped = False
+    reads = frozenset({'library'})
+    writes = frozenset({'library', 'table', 'opponent_life'})
 
     def do_upkeep(self, controller: Player):
         self.is_tapped = False
@@ -1024,14 +1594,41 @@ class GoblinCharbelcher(Card):
 
     def activate(self, controller: Player):
         self.is_tapped = True
-        cards, revealed_card = controller.deck.reveal_cards_until('Forest')
-        # HACK: To make it less appealing to belcher early, let's make it so that belcher only does half damage.
-        damage = int(len(cards) * 2.0 / 3.0)
+        # Reveal cards until a Forest is found, and then put them all on the bottom (in the order they were revealed).
+        revealed_count = controller.deck.reveal_depth('Forest')
+        damage = self.damage_for_reveal(revealed_count)
         controller.opponent_lifetotal -= damage
-        controller.deck.put_on_bottom(cards)
+        controller.deck.put_top_on_bottom(revealed_count)
         lands_in_deck = controller.deck.count_cards('Forest')
         controller.debug_log(f'  Belcher with {lands_in_deck} lands in deck')
 
+    # Belcher damage only depends on how deep the first Forest is in the library, so it can be worked out without
+    #  actually revealing anything. These let the search settle Belcher activations without expanding them.
+    @staticmethod
+    def damage_for_reveal(revealed_count) -> int:
+        # HACK: To make it less appealing to belcher early, let's make it so that belcher only does half damage.
+        return int(revealed_count * 2.0 / 3.0)
+
+    def is_lethal(self, controller: Player) -> bool:
+        # Exact, for when the library order is known
+        return self.damage_for_reveal(controller.deck.reveal_depth('Forest')) >= controller.opponent_lifetotal
+
+    @staticmethod
+    def reveal_count_probabilities(library_size, forests) -> dict:
+        # For an unknown library order, the chance of revealing exactly k cards is the chance that the first Forest is k-th from the top
+        if forests == 0:
+            return {library_size: 1.0}
+        total = math.comb(library_size, forests)
+        return {k: math.comb(library_size - k, forests - 1) / total for k in range(1, library_size - forests + 2)}
+
+    @classmethod
+    def expected_damage(cls, library_size, forests) -> float:
+        return sum([probability * cls.damage_for_reveal(k) for k, probability in cls.reveal_count_probabilities(library_size, forests).items()])
+
+    @classmethod
+    def lethal_probability(cls, library_size, forests, life) -> float:
+        return sum([probability for k, probability in cls.reveal_count_probabilities(library_size, forests).items() if cls.damage_for_reveal(k) >= life])
+
 # Elvish Mystic is a card that costs 1 and has an ability that increases a player's mana pool by 1
 #  NOTE: This is a bit of a hack, but when we play it we simply increase the player's land count by 1,
 #   which means that the player will have extra mana in their mana pool starting *next* turn.
@@ -1042,15 +1639,11 @@ class ElvishMystic (Card):
     deck_max_quant:int = 8 # Because Llanowar Elves is functionally a copy of Elvish Mystic, we can set this playable number to 8 and not include Llanowar Elves in the permutation set.
     power:int = 1
     toughness:int = 1
-
-    def __init__(self):
-        self.is_tapped = True
-        pass
-
-    def play(self, controller: Player):
-        # Instead of activating to add mana to our mana pool, just treat it as a new land so we don't have as many branching permutations.
-        controller.lands += 1
-        super().play(controller)
+    starts_tapped:bool = True # Represent summoning sickness by coming into play tapped.
+    reads = frozenset()
+    writes = frozenset({'lands', 'table'})
+    # Instead of activating to add mana to our mana pool, just treat it as a new land so we don't have as many branching permutations.
+    play_effects = (('add_lands', 1), ('resolve', None))
 
 
 # Llanowar Elves is a copy of Elvish Mystic with a different name
@@ -1061,15 +1654,11 @@ class LlanowarElves (Card):
     deck_max_quant:int = 0 # Turn off this card for now
     power:int = 1
     toughness:int = 1
-
-    def __init__(self):
-        self.is_tapped = True
-        pass
-
-    def play(self, controller: Player):
-        # Instead of activating to add mana to our mana pool, just treat it as a new land so we don't have as many branching permutations.
-        controller.lands += 1
-        super().play(controller)
+    starts_tapped:bool = True # Represent summoning sickness by coming into play tapped.
+    reads = frozenset()
+    writes = frozenset({'lands', 'table'})
+    # Instead of activating to add mana to our mana pool, just treat it as a new land so we don't have as many branching permutations.
+    play_effects = (('add_lands', 1), ('resolve', None))
 
 # Arbor Elf is a creature of cost 1 that has an ability that adds 1 to the mana pool, unless there is a Wild Growth in play, in which case it adds 2.
 class ArborElf (Card):
@@ -1078,6 +1667,8 @@ class ArborElf (Card):
     cardtype = 'Creature'
     power:int = 1
     toughness:int = 1
+    reads = frozenset({'table'})
+    writes = frozenset({'mana', 'table'})
 
     def play(self, controller: Player):
         # Represent summoning sickness by coming into play tapped.
@@ -1105,23 +1696,12 @@ class RampantGrowth(Card):
     cost:int = 2
     colorless_cost:int = 1 # Colorless portion of the cost
     cardtype = 'Sorcery'
-
-    def can_play(self, controller: Player) -> bool:
-        # Don't play unless we have a land in the deck, or we have a potential to cast Panglacial Wurm
-        return (super().can_play(controller)
-            and (
-                controller.deck.count_cards('Forest') > 0
-                or controller.panglacial_potential(self.cost))
-            )
-
-    def play(self, controller: Player):
-        cards = controller.deck.find_and_remove('Forest', 1)
-        controller.check_panglacial()
-        # Add a tapped forest
-        controller.table.extend(cards)
-        controller.lands += len(cards)
-        super().play(controller)
-        controller.trigger_landfall(len(cards))
+    reads = frozenset()
+    writes = frozenset({'forests', 'library', 'table', 'lands', 'graveyard'})
+    # Don't play unless we have a land in the deck, or we have a potential to cast Panglacial Wurm
+    play_conditions = (('can_search_forests', cost),)
+    # Add a tapped forest
+    play_effects = (('search_forests', 1), ('put_onto_battlefield', False), ('resolve', None), ('landfall', None))
 
 # Nissa's Pilgrimage is a card with the ability: Search your library for up to two basic Forest cards, reveal those cards, and put one onto the battlefield tapped and the rest into your hand. Then shuffle your library.  If there are two or more instant and/or sorcery cards in your graveyard, search your library for up to three basic Forest cards instead of two.
 class NissasPilgrimage(Card):
@@ -1131,9 +1711,8 @@ class NissasPilgrimage(Card):
     alt_cost:int = 3
     colorless_alt_cost:int = 2 # Colorless portion of the alternate cost
     prefer_alt = True
-
-    def __init__(self):
-        pass
+    reads = frozenset({'graveyard'})
+    writes = frozenset({'forests', 'library', 'hand_forests', 'table', 'lands', 'graveyard'})
 
     def can_play(self, controller: Player) -> bool:
         return super().can_play(controller) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
@@ -1182,11 +1761,9 @@ class WallOfRoots (Card):
     cardtype = 'Creature'
     power:int = 0
     toughness:int = 5
-
-    def play(self, controller: Player):
-        controller.lands += 1
-        controller.mana_pool += 1
-        super().play(controller)
+    reads = frozenset()
+    writes = frozenset({'lands', 'mana', 'table'})
+    play_effects = (('add_lands', 1), ('add_mana', 1), ('resolve', None))
 
 """
 class WallOfRoots (Card):
@@ -1227,11 +1804,9 @@ class Explore(Card):
     cost:int = 2
     colorless_cost:int = 1 # Colorless portion of the cost
     cardtype = 'Sorcery'
-
-    def play(self, controller: Player):
-        controller.land_drops += 1
-        controller.draw()
-        super().play(controller)
+    reads = frozenset({'library'})
+    writes = frozenset({'land_drops', 'library', 'hand', 'hand_forests', 'graveyard'})
+    play_effects = (('add_land_drops', 1), ('draw', 1), ('resolve', None))
 
 # Chancellor of the Tangle costs 7 and has an ability that says: You may reveal this card from your opening hand. If you do, at the beginning of your first main phase, add 1 to your mana pool
 class ChancellorOfTheTangle(Card):
@@ -1242,10 +1817,8 @@ class ChancellorOfTheTangle(Card):
     activation_cost:int = 0 # Costs nothing to attack
     power:int = 6
     toughness:int = 7
-
-    def __init__(self):
-        self.is_tapped:bool = False
-        pass
+    reads = frozenset()
+    writes = frozenset({'table', 'opponent_life'})
 
     def play(self, controller: Player):
         self.is_tapped = True # Start off tapped to simulate summoning sickness
@@ -1275,6 +1848,8 @@ class WildGrowth(Card):
     name = 'Wild Growth'
     cost:int = 1
     cardtype = 'Enchantment'
+    reads = frozenset({'table', 'mana'})
+    writes = frozenset({'lands', 'mana', 'table'})
 
     # Only allow this card to be played if the table contains a Forest
     def can_play(self, controller: Player) -> bool:
@@ -1295,21 +1870,11 @@ class SearchForTomorrow(Card):
     colorless_cost:int = 2 # Colorless portion of the cost
     alt_cost:int = 1
     cardtype = 'Sorcery'
-
-    def __init__(self):
-        self.time_counters = 0
-
-    def can_play(self, controller: Player) -> bool:
-        return super().can_play(controller) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
-
-    def play(self, controller: Player):
-        cards = controller.deck.find_and_remove('Forest', 1)
-        controller.check_panglacial()
-        controller.table.extend(cards)
-        controller.lands += len(cards)
-        controller.mana_pool += 1 # The land comes into play untapped, so immediately add it to the mana pool.
-        super().play(controller)
-        controller.trigger_landfall(len(cards))
+    reads = frozenset()
+    writes = frozenset({'forests', 'library', 'table', 'lands', 'mana', 'graveyard', 'exile'})
+    play_conditions = (('can_search_forests', cost),)
+    # The land comes into play untapped, so immediately add it to the mana pool.
+    play_effects = (('search_forests', 1), ('put_onto_battlefield', False), ('add_mana', 1), ('resolve', None), ('landfall', None))
 
     def can_alt_play(self, controller: Player) -> bool:
         return super().can_alt_play(controller) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(0))
@@ -1336,9 +1901,8 @@ class RecrossThePaths(Card):
     cardtype = 'Sorcery'
     alt_cost:int = 3
     colorless_alt_cost:int = 2 # Colorless portion of the alternate cost
-
-    def __init__(self):
-        pass
+    reads = frozenset({'library', 'forests'})
+    writes = frozenset({'library', 'table', 'lands', 'mana'})
 
     # Only play if there ARE lands in the deck
     def can_play(self, controller: Player) -> bool:
@@ -1401,6 +1965,8 @@ class AncientStirrings(Card):
     cost:int = 1
     alt_cost:int = 1
     cardtype = 'Sorcery'
+    reads = frozenset({'library'})
+    writes = frozenset({'library', 'hand', 'hand_forests', 'graveyard'})
 
     def do_stirrings(self, controller: Player, target_type: str):
         # Look at the top five cards of your library
@@ -1439,9 +2005,8 @@ class AbundantHarvest(Card):
     cost:int = 1
     alt_cost:int = 1
     cardtype = 'Sorcery'
-
-    def __init__(self):
-        pass
+    reads = frozenset({'library'})
+    writes = frozenset({'library', 'hand', 'hand_forests', 'graveyard'})
 
     def do_harvest(self, controller: Player, target_land: bool):
         # Reveal cards from the top of your library until you reveal a card of the chosen kind
@@ -1483,9 +2048,6 @@ class PanglacialWurm(Card):
     power:int = 9
     toughness:int = 5
 
-    def __init__(self):
-        self.is_tapped:bool = False
-
     def play(self, controller: Player):
         self.is_tapped = True # Start off tapped to simulate summoning sickness
         super().play(controller)
@@ -1512,6 +2074,8 @@ class SolRing(Card):
     # activation_cost:int = 0 # Costs nothing to activate
     cardtype = 'Artifact'
     deck_max_quant:int = 1 # Restricted in Vintage, so can only play 1
+    reads = frozenset()
+    writes = frozenset({'mana', 'table'})
 
     # Don't permit special activation -- just add 2 to our colorless land count when activated
     def can_activate(self, controller: Player) -> bool:
@@ -1532,6 +2096,8 @@ class SimianSpiritGuide(Card):
     colorless_cost:int = 2 # Colorless portion of the cost
     cardtype = 'Creature'
     consider_not_playing:bool = True # This is a card that we should consider not playing immediately in case we want to save the mana for later.
+    reads = frozenset()
+    writes = frozenset({'mana', 'exile'})
 
     # TODO: Maybe implement this as a playable creature later, but for now, just have this as a mana source.
     def can_play(self, controller: Player) -> bool:
@@ -1554,6 +2120,8 @@ class ElvishSpiritGuide(Card):
     alt_cost:int = 0
     cardtype = 'Creature'
     consider_not_playing:bool = True # This is a card that we should consider not playing immediately in case we want to save the mana for later.
+    reads = frozenset()
+    writes = frozenset({'mana', 'exile'})
 
     # TODO: Maybe implement this as a playable creature later, but for now, just have this as a mana source.
     def can_play(self, controller: Player) -> bool:
@@ -1577,25 +2145,14 @@ class BeneathTheSands(Card):
     alt_cost:int = 2 # (Cycling)
     colorless_alt_cost:int = 2 # Colorless portion of the alternate cost
     cardtype = 'Sorcery'
+    reads = frozenset({'library'})
+    writes = frozenset({'forests', 'library', 'hand', 'hand_forests', 'table', 'lands', 'graveyard'})
 
-    def __init__(self):
-        pass
-
-    def can_play(self, controller: Player) -> bool:
-        return super().can_play(controller) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
-
-    def play(self, controller: Player):
-        cards = controller.deck.find_and_remove('Forest', 1)
-        controller.check_panglacial()
-        # Add a tapped forest
-        controller.lands += len(cards)
-        controller.table.extend(cards)
-        super().play(controller)
-
+    play_conditions = (('can_search_forests', cost),)
+    # Add a tapped forest
+    play_effects = (('search_forests', 1), ('put_onto_battlefield', False), ('resolve', None))
     # Alt play is cycling
-    def alt_play(self, controller: Player):
-        controller.draw()
-        super().alt_play(controller)
+    alt_play_effects = (('draw', 1), ('resolve', None))
 
 # Migration Path is a sorcery that costs 4 and says: Search your library for up to two basic land cards, put them onto the battlefield tapped, then shuffle. Cycling 2 (2, Discard this card: Draw a card)
 # NOTE: Explosive Vegetation and Circuitous Route are functionally identical to Migration Path (except without the cycling ability), so we will not implement them unless Migration Path sees play.
@@ -1606,9 +2163,8 @@ class MigrationPath(Card):
     alt_cost:int = 2 # (Cycling)
     colorless_alt_cost:int = 2 # Colorless portion of the alternate cost
     cardtype = 'Sorcery'
-
-    def __init__(self):
-        pass
+    reads = frozenset({'library'})
+    writes = frozenset({'forests', 'library', 'hand', 'hand_forests', 'table', 'lands', 'graveyard'})
 
     def can_play(self, controller: Player) -> bool:
         return super().can_play(controller) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
@@ -1636,9 +2192,8 @@ class EdgeOfAutumn(Card):
     alt_cost:int = 0 # (Cycling)
     colorless_alt_cost:int = 0 # Colorless portion of the alternate cost
     cardtype = 'Sorcery'
-
-    def __init__(self):
-        pass
+    reads = frozenset({'library', 'table', 'lands'})
+    writes = frozenset({'forests', 'library', 'hand', 'hand_forests', 'table', 'lands', 'graveyard'})
 
     def can_play(self, controller: Player) -> bool:
         return super().can_play(controller) and (controller.table.count_cards('Forest') <= 4) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
@@ -1681,10 +2236,8 @@ class GenerousEnt(Card):
     cardtype = 'Creature'
     power:int = 5
     toughness:int = 7
-
-    def __init__(self):
-        self.is_tapped:bool = False
-        pass
+    reads = frozenset()
+    writes = frozenset({'forests', 'library', 'hand_forests', 'table', 'graveyard', 'opponent_life'})
 
     def do_upkeep(self, controller: Player):
         self.is_tapped = False
@@ -1723,9 +2276,8 @@ class Cultivate(Card):
     cost:int = 3
     colorless_cost:int = 2 # Colorless portion of the cost
     cardtype = 'Sorcery'
-
-    def __init__(self):
-        pass
+    reads = frozenset({'hand_forests', 'land_drops'})
+    writes = frozenset({'forests', 'library', 'hand_forests', 'table', 'lands', 'graveyard'})
 
     def can_play(self, controller: Player) -> bool:
         return super().can_play(controller) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
@@ -1762,11 +2314,8 @@ class BeanstalkGiant(Card):
     cardtype = 'Creature'
     power:int = 6 # HACK: Instead of actually calculating our power and updating this variable, just set it to 6 for now.
     toughness:int = 6 # HACK: Instead of actually calculating our toughness and updating this variable, just set it to 6 for now.
-
-    def __init__(self):
-        self.is_tapped:bool = False
-        self.has_gone_on_an_adventure:bool = False
-        pass
+    reads = frozenset({'table'})
+    writes = frozenset({'forests', 'library', 'table', 'lands', 'mana', 'opponent_life'})
 
     def do_upkeep(self, controller: Player):
         self.is_tapped = False
@@ -1810,33 +2359,13 @@ class GrowFromTheAshes(Card):
     alt_cost:int = 5 # (Cast w/ kicker)
     colorless_alt_cost:int = 4 # Colorless portion of the alternate cost
     cardtype = 'Sorcery'
-
-    def __init__(self):
-        pass
-
-    def can_play(self, controller: Player) -> bool:
-        return super().can_play(controller) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
-
-    def can_alt_play(self, controller: Player) -> bool:
-        return super().can_alt_play(controller) and (controller.deck.count_cards('Forest') > 1)
-    
-    def play(self, controller: Player):
-        self.do_effect(controller, 1)
-
-    def alt_play(self, controller: Player):
-        self.do_effect(controller, 2)
-
-    def do_effect(self, controller: Player, search_count:int):
-        cards = controller.deck.find_and_remove('Forest', search_count)
-        controller.check_panglacial()
-
-        # Put as many cards as we found onto the battlefield untapped.
-        controller.lands += len(cards)
-        controller.table.extend(cards)
-        # The lands come into play untapped, so immediately add them to our mana pool
-        controller.mana_pool += len(cards)
-
-        super().play(controller)
+    reads = frozenset()
+    writes = frozenset({'forests', 'library', 'table', 'lands', 'mana', 'graveyard'})
+    # Put as many cards as we found onto the battlefield untapped.
+    play_conditions = (('can_search_forests', cost),)
+    play_effects = (('search_forests', 1), ('put_onto_battlefield', True), ('resolve', None))
+    alt_play_conditions = (('forests_in_library', 2),)
+    alt_play_effects = (('search_forests', 2), ('put_onto_battlefield', True), ('resolve', None))
 
 # Nissa's Triumph is a sorcery that costs 2 and says: Search your library for up to two basic Forest cards. If you control a Nissa planeswalker, instead search your library for up to three land cards. Reveal those cards, put them into your hand, then shuffle.
 # NOTE: We will not implement the Nissa planeswalker check, as we are not currently implementing planeswalkers.
@@ -1846,18 +2375,10 @@ class NissasTriumph(Card):
     cost:int = 2
     colorless_cost:int = 0 # Colorless portion of the cost
     cardtype = 'Sorcery'
-
-    def __init__(self):
-        pass
-
-    def can_play(self, controller: Player) -> bool:
-        return super().can_play(controller) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
-
-    def play(self, controller: Player):
-        cards = controller.deck.find_and_remove('Forest', 2)
-        controller.check_panglacial()
-        controller.hand.extend(cards)
-        super().play(controller)
+    reads = frozenset()
+    writes = frozenset({'forests', 'library', 'hand_forests', 'graveyard'})
+    play_conditions = (('can_search_forests', cost),)
+    play_effects = (('search_forests', 2), ('put_in_hand', None), ('resolve', None))
 
 # Manamorphose is an instant that costs 2 and says: Add two mana in any combination of colors. Draw a card.
 class Manamorphose(Card):
@@ -1865,13 +2386,10 @@ class Manamorphose(Card):
     cost:int = 2
     colorless_cost:int = 1 # Colorless portion of the cost
     cardtype = 'Instant'
-
-    def play(self, controller: Player):
-        # Add two mana in any combination of colors
-        controller.mana_pool += 2
-        # Draw a card
-        controller.draw()
-        super().play(controller)
+    reads = frozenset({'library'})
+    writes = frozenset({'mana', 'library', 'hand', 'hand_forests', 'graveyard'})
+    # Add two mana in any combination of colors, and draw a card
+    play_effects = (('add_mana', 2), ('draw', 1), ('resolve', None))
 
 # Tangled Florahedron/Tangled Vale is a DFC that, on the front face, is a creature that costs 2 and says: T: Add G.  On the back face, it is a land that enters the battlefield tapped.
 class TangledFlorahedron(Card):
@@ -1882,6 +2400,8 @@ class TangledFlorahedron(Card):
     alt_cost:int = 0
     power:int = 1
     toughness:int = 1
+    reads = frozenset({'land_drops'})
+    writes = frozenset({'lands', 'land_drops', 'table'})
 
     def play(self, controller: Player):
         # Instead of activating to add mana to our mana pool, just treat it as a new land so we don't have as many branching permutations.
@@ -1896,11 +2416,14 @@ class TangledFlorahedron(Card):
         controller.lands += 1
         # This comes in tapped, so we can't immediately add it to our mana_pool
         controller.land_drops -= 1
-        # Change the name and cardtype to the backside
-        self.cardtype = 'Land'
+        # Flip over to the backside. The back face shares the front face's per-instance state, so we can just swap prototypes.
+        self.__class__ = TangledVale
         super().alt_play(controller)
-        # Adjust the name after play so that it shows up in the log correctly
-        self.name = 'Tangled Vale'
+
+# Tangled Vale is the land backside of Tangled Florahedron.
+class TangledVale(TangledFlorahedron):
+    name = 'Tangled Vale'
+    cardtype = 'Land'
 
 # Disciple of Freyalise is a DFC Creature // Land that is 3/3, costs 3GGG and says: When Disciple of Freyalise enters the battlefield, you may sacrifice another creature. If you do, you gain X life and draw X cards, where X is that creature’s power.
 # On the back face, it is a Land that says: As Garden of Freyalise enters the battlefield, you may pay 3 life. If you don’t, it enters the battlefield tapped.
@@ -1958,11 +2481,14 @@ class DiscipleOfFreyalise(Card):
             controller.life_total -= 3
             controller.mana_pool += 1
 
-        # Change the name and cardtype to the backside
-        self.cardtype = 'Land'
+        # Flip over to the backside. The back face shares the front face's per-instance state, so we can just swap prototypes.
+        self.__class__ = GardenOfFreyalise
         super().alt_play(controller)
-        # Adjust the name after play so that it shows up in the log correctly
-        self.name = 'Garden of Freyalise'
+
+# Garden of Freyalise is the land backside of Disciple of Freyalise.
+class GardenOfFreyalise(DiscipleOfFreyalise):
+    name = 'Garden of Freyalise'
+    cardtype = 'Land'
 
 # Journey of Discovery is a sorcery that costs 3 and says: Choose one — Search your library for up to two basic land cards, reveal them, put them into your hand, then shuffle; or you may play up to two additional lands this turn. Entwine 2G (Choose both if you pay the entwine cost.)
 class JourneyOfDiscovery(Card):
@@ -1974,9 +2500,8 @@ class JourneyOfDiscovery(Card):
     #activation_cost:int = 6 # We're going to count Entwine as the activation
     #colorless_activation_cost:int = 4 # Colorless portion of the activation
     cardtype = 'Sorcery'
-
-    def __init__(self):
-        pass
+    reads = frozenset({'hand_forests', 'land_drops'})
+    writes = frozenset({'forests', 'library', 'hand_forests', 'land_drops', 'graveyard'})
 
     def can_play(self, controller: Player) -> bool:
         return super().can_play(controller) and (controller.deck.count_cards('Forest') > 0 or controller.panglacial_potential(self.cost))
@@ -2010,9 +2535,8 @@ class StreetWraith(Card):
     power:int = 3
     toughness:int = 4
     cardtype = 'Creature'
-
-    def __init__(self):
-        pass
+    reads = frozenset({'library', 'life'})
+    writes = frozenset({'library', 'hand', 'hand_forests', 'life', 'graveyard'})
 
     def can_play(self, controller: Player) -> bool:
         return False
@@ -2031,13 +2555,11 @@ class LotusCobra(Card):
     name = 'Lotus Cobra'
     cost:int = 2
     colorless_cost:int = 1 # Colorless portion of the cost
+    activation_cost:int = 0 # Costs nothing to attack
     cardtype = 'Creature'
     power:int = 2
     toughness:int = 1
-
-    def __init__(self) -> None:
-        self.is_tapped = True
-        super().__init__()
+    starts_tapped:bool = True # Represent summoning sickness by coming into play tapped.
 
     def do_upkeep(self, controller: Player):
         self.is_tapped = False
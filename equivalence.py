@@ -0,0 +1,177 @@
+# Differential testing of the search.
+#  Every optimization of the engine (copying states, the zones, the search itself) risks quietly changing which games
+#  are won, and when. This plays the same decklist and seeds with a reference engine and a candidate engine, and compares
+#  the win turn (and number of search steps) of every game, and optionally the set of states that each of them explored
+#  on every turn. Divergences are reported with the smallest seed that reproduces them, searched to as few turns as
+#  still reproduce them.
+#
+#  An engine is a copy of this repository (for example a git worktree of the commit to compare against), plus optional
+#  settings for montecarlo.py in the same format as a --config file. That way the same code can also be compared against
+#  itself with different settings, like {"search_workers": 2} or {"recycle_pruned_states": false}. Each engine runs in a
+#  process of its own, so that the two copies of the code never get mixed up.
+#  Only the states that are stepped in the engine's own process are recorded, so compare states with serial searches.
+#
+# Usage:
+#  git worktree add ../reference HEAD
+#  python equivalence.py decklist.txt --reference ../reference [--candidate .] [--games 100] [--states]
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+# NOTE: montecarlo (and cards) are only imported inside of functions, since the engine processes have to import the
+#  engine's copy of them rather than this one.
+
+def play_engine_games(config, decklist, seeds, max_turns, prune_limit, record_states):
+    # Runs in the engine's process (see engine_worker()), with the engine's copy of cards and montecarlo
+    import cards
+    import montecarlo as engine
+
+    if len(config) > 0:
+        engine.apply_config(config)
+
+    explored = {}
+    if record_states:
+        step_next_actions = cards.Player.step_next_actions
+        def recording_step_next_actions(self):
+            # Digests are enough to tell whether the engines explored the same states, and much smaller than the states
+            digest = hashlib.sha1(str(self).encode()).hexdigest()[:16]
+            explored.setdefault(self.current_turn, set()).add(digest)
+            return step_next_actions(self)
+        cards.Player.step_next_actions = recording_step_next_actions
+
+    games = []
+    for seed in seeds:
+        explored.clear()
+        then = time.time()
+        win_state, action_count, max_leaf_nodes = engine.find_fastest_win(cards.Player(decklist, seed), max_turns, prune_limit)
+        games.append({
+            'seed': seed,
+            'win_turn': win_state.current_turn if win_state is not None else None,
+            'action_count': action_count,
+            'duration': time.time() - then,
+            'explored': {str(turn): sorted(digests) for turn, digests in explored.items()},
+        })
+    return games
+
+def engine_worker():
+    # The job comes in on stdin and the results go out on stdout, so keep anything that the engine prints off of stdout
+    job = json.load(sys.stdin)
+    sys.path.insert(0, os.path.abspath(job['engine_dir']))
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    games = play_engine_games(job['config'], job['decklist'], job['seeds'], job['max_turns'], job['prune_limit'], job['record_states'])
+    json.dump(games, stdout)
+
+def run_engine(engine_dir, config, decklist, seeds, max_turns, prune_limit, record_states):
+    if not os.path.exists(os.path.join(engine_dir, 'montecarlo.py')):
+        raise Exception(f'No engine (montecarlo.py) in {engine_dir}')
+    job = {'engine_dir': engine_dir, 'config': config, 'decklist': decklist, 'seeds': seeds, 'max_turns': max_turns, 'prune_limit': prune_limit, 'record_states': record_states}
+    # Run from outside of this folder, so that the engine's own copy of the code is the first one on the path
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--engine-worker'], input=json.dumps(job), capture_output=True, text=True, cwd=os.path.abspath(engine_dir))
+    if result.returncode != 0:
+        raise Exception(f'Engine in {engine_dir} failed:\n{result.stderr}')
+    return json.loads(result.stdout)
+
+def compare_games(reference_game, candidate_game):
+    # Return a description of how the games diverged, or None if they didn't
+    divergence = {}
+    if reference_game['win_turn'] != candidate_game['win_turn']:
+        divergence['win_turn'] = (reference_game['win_turn'], candidate_game['win_turn'])
+    if reference_game['action_count'] != candidate_game['action_count']:
+        divergence['action_count'] = (reference_game['action_count'], candidate_game['action_count'])
+    reference_explored = reference_game['explored']
+    candidate_explored = candidate_game['explored']
+    for turn in sorted(set(reference_explored) | set(candidate_explored), key=int):
+        reference_states = set(reference_explored.get(turn, []))
+        candidate_states = set(candidate_explored.get(turn, []))
+        if reference_states != candidate_states:
+            # Only the first turn matters, since everything after it follows from different states anyway
+            divergence['explored_turn'] = int(turn)
+            divergence['reference_only_states'] = len(reference_states - candidate_states)
+            divergence['candidate_only_states'] = len(candidate_states - reference_states)
+            break
+    return divergence if len(divergence) > 0 else None
+
+def compare_engines(reference, candidate, decklist, seeds, max_turns, prune_limit, record_states):
+    # Engines are (folder, config) pairs. Returns the games of both, and a {seed: divergence} dict.
+    reference_games = run_engine(*reference, decklist, seeds, max_turns, prune_limit, record_states)
+    candidate_games = run_engine(*candidate, decklist, seeds, max_turns, prune_limit, record_states)
+    divergences = {}
+    for reference_game, candidate_game in zip(reference_games, candidate_games):
+        divergence = compare_games(reference_game, candidate_game)
+        if divergence is not None:
+            divergences[reference_game['seed']] = divergence
+    return reference_games, candidate_games, divergences
+
+def find_minimal_max_turns(reference, candidate, decklist, seed, max_turns, prune_limit, record_states) -> int:
+    # The fewest turns that the seed has to be searched to for the engines to diverge, for the shortest reproduction
+    for turns in range(1, max_turns):
+        if len(compare_engines(reference, candidate, decklist, [seed], turns, prune_limit, record_states)[2]) > 0:
+            return turns
+    return max_turns
+
+def load_config(filename):
+    if filename is None:
+        return {}
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+def main(argv = None):
+    import montecarlo
+    parser = argparse.ArgumentParser(description='Compare the game results of two versions (or settings) of the search engine.')
+    parser.add_argument('decklist', help='Decklist file (one "<quantity> <card name>" per line, # for comments)')
+    this_folder = os.path.dirname(os.path.abspath(__file__))
+    parser.add_argument('--reference', default=this_folder, help='Folder with the reference copy of the code (default: this one)')
+    parser.add_argument('--candidate', default=this_folder, help='Folder with the candidate copy of the code (default: this one)')
+    parser.add_argument('--reference-config', help='JSON file of montecarlo.py settings for the reference engine')
+    parser.add_argument('--candidate-config', help='JSON file of montecarlo.py settings for the candidate engine')
+    parser.add_argument('--games', type=int, default=100, help='Number of seeds to play (default: 100)')
+    parser.add_argument('--seed', type=int, default=0, help='First seed to play (default: 0)')
+    parser.add_argument('--max-turns', type=int, default=10, help='Max number of turns to search for a win (default: 10)')
+    parser.add_argument('--prune-limit', type=int, default=montecarlo.PRUNE_LIMIT, help=f'Max number of leaf nodes to search through (default: {montecarlo.PRUNE_LIMIT})')
+    parser.add_argument('--states', action='store_true', help='Also compare the states that each engine explored on every turn')
+    args = parser.parse_args(argv)
+
+    # Parse the decklist the same way that the optimizer does
+    with open(args.decklist, 'r') as f:
+        deckrange = montecarlo.parse_decklist(f.read())
+    decklist = montecarlo.get_deck_variants(deckrange)[0]
+
+    reference = (args.reference, load_config(args.reference_config))
+    candidate = (args.candidate, load_config(args.candidate_config))
+    seeds = list(range(args.seed, args.seed + args.games))
+    reference_games, candidate_games, divergences = compare_engines(reference, candidate, decklist, seeds, args.max_turns, args.prune_limit, args.states)
+
+    reference_duration = sum([game['duration'] for game in reference_games])
+    candidate_duration = sum([game['duration'] for game in candidate_games])
+    print(f'Played {len(seeds)} games: reference took {reference_duration:.2f}s, candidate took {candidate_duration:.2f}s ({reference_duration / max(candidate_duration, 1e-9):.2f}x)')
+    if len(divergences) == 0:
+        print('No divergences')
+        return 0
+
+    print(f'{len(divergences)} of {len(seeds)} games diverged:')
+    for seed, divergence in sorted(divergences.items())[:20]:
+        print(f' Seed {seed}: {divergence}')
+
+    seed = min(divergences)
+    turns = find_minimal_max_turns(reference, candidate, decklist, seed, args.max_turns, args.prune_limit, args.states)
+    print(f'Smallest reproduction: seed {seed}, searched to {turns} turns:')
+    command = f'python equivalence.py {args.decklist} --reference {args.reference} --candidate {args.candidate} --seed {seed} --games 1 --max-turns {turns} --prune-limit {args.prune_limit}'
+    if args.reference_config:
+        command += f' --reference-config {args.reference_config}'
+    if args.candidate_config:
+        command += f' --candidate-config {args.candidate_config}'
+    if args.states:
+        command += ' --states'
+    print(f' {command}')
+    return 1
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--engine-worker']:
+        engine_worker()
+    else:
+        sys.exit(main())
@@ -0,0 +1,372 @@
+# Expectimax search engine.
+#  The regular search (montecarlo.find_fastest_win) shuffles the library with a fixed seed and then searches with perfect
+#  knowledge of the library order, which lets it "cheat" on things like Manamorphose and Ancient Stirrings (it only ever
+#  takes the branch that worked out), and it needs thousands of sampled games per decklist to average out the shuffles.
+#
+#  This engine instead treats every action that looks at the (hidden) library as a chance node: a turn's draw,
+#  Manamorphose, Ancient Stirrings, Abundant Harvest, Goblin Charbelcher, etc. Each of those actions is re-run over
+#  several arrangements of the library and their results are averaged, while the player still picks the action with the
+#  best expected result at every decision. The library order doesn't show up in a state's string representation, so
+#  results are memoized on it, just like the regular search deduplicates on it.
+#
+#  The result for a state is the probability distribution of the turn that it wins on (with every game that isn't won
+#  by max_turns counted as max_turns + 2, the same as the regular averages), so both the expected win turn and
+#  quantiles can be read off of it.
+#
+# Usage: python expectimax.py decklist.txt [--hands 20] [--max-turns 5] [--samples 8]
+import argparse
+import pickle
+import random
+import sys
+import time
+
+import cards
+
+# How to arrange the library for each chance node:
+#  None stratifies over the card on top of the library (one outcome for each distinct card, weighted by how many of it
+#   are left), which is exact for single-card draws.
+#  An integer N uses N random shuffles of the library, weighted equally.
+EXPECTIMAX_CHANCE_SAMPLES = 4
+# The cost of the search multiplies by the number of arrangements at every chance node along a line of play, so only
+#  this many levels of chance nodes use the arrangements above. Deeper ones use a single random arrangement.
+EXPECTIMAX_CHANCE_DEPTH = 1
+# Max number of options to consider at each decision, or None to consider every option. Like PRUNE_LIMIT in the regular
+#  search, any options above the limit are randomly pruned. That makes the player pick the best of a random few options,
+#  which is closer to a random policy than to the best play, so a limit biases the expected win turn upwards (later).
+#  Limits are a lot faster (a limit of 2 is about 100x faster on the baseline decklist at 4 turns), so they're still
+#  useful for quick comparisons between decklists, but not for absolute numbers.
+EXPECTIMAX_BRANCH_LIMIT = None
+# Take each action in place on a single state and undo it afterwards (see cards.Player.make()), instead of copying the
+#  state for every option. Chance nodes still start from a copy of the state.
+EXPECTIMAX_MAKE_UNMAKE = True
+
+# ChanceLibrary counts every time that something looks at the hidden part of the library (drawing, revealing, or
+#  peeking at the top cards), so that the search can tell which actions depend on the library order.
+class ChanceLibrary(cards.Library):
+    hidden_reads:int = 0
+
+    def draw(self, quant=1):
+        self.hidden_reads += 1
+        return super().draw(quant)
+
+    def reveal_depth(self, name) -> int:
+        self.hidden_reads += 1
+        return super().reveal_depth(name)
+
+    def count_cards(self, name, in_top=0) -> int:
+        if in_top > 0:
+            self.hidden_reads += 1
+        return super().count_cards(name, in_top)
+
+# ExpectimaxPlayer remembers the last action that was taken, so that a chance node can re-run the same action
+#  against a different arrangement of the library.
+class ExpectimaxPlayer(cards.Player):
+    last_action = None
+    # Checking for a lethal Belcher peeks at the library order, so Belcher activations are settled by chance_distribution instead
+    settle_belcher_lethal = False
+    # Subtrees are memoized by state and shared between every path that reaches them, and chance nodes replay actions from the
+    #  parent state, so the set of children can't depend on the action that led to a state
+    partial_order_reduction = False
+
+    def play(self, card_ref):
+        self.last_action = ('play', self.hand.get_card(card_ref, player=self, can_play=True).uid)
+        super().play(card_ref)
+
+    def alt_play(self, card_ref):
+        self.last_action = ('alt_play', self.hand.get_card(card_ref, player=self, can_alt_play=True).uid)
+        super().alt_play(card_ref)
+
+    def activate(self, card_ref):
+        self.last_action = ('activate', self.table.get_card(card_ref, player=self, can_activate=True).uid)
+        super().activate(card_ref)
+
+    def start_turn(self) -> 'cards.Player':
+        self.last_action = ('start_turn', None)
+        return super().start_turn()
+
+def to_expectimax_player(state:cards.Player) -> ExpectimaxPlayer:
+    # Copies of a state keep its classes, so converting the root state is enough for the whole search.
+    state.__class__ = ExpectimaxPlayer
+    state.deck.__class__ = ChanceLibrary
+    return state
+
+def point_distribution(turn, num_turns):
+    distribution = [0.0] * num_turns
+    distribution[turn] = 1.0
+    return distribution
+
+def expected_turn(distribution) -> float:
+    return sum([turn * probability for turn, probability in enumerate(distribution)])
+
+def win_turn_quantile(distribution, quantile) -> int:
+    # The first turn by which the game has been won with at least the given probability
+    total = 0.0
+    for turn, probability in enumerate(distribution):
+        total += probability
+        if total >= quantile - 1e-9:
+            return turn
+    return len(distribution) - 1
+
+class ExpectimaxSearch:
+    def __init__(self, maxturn = 10, chance_samples = EXPECTIMAX_CHANCE_SAMPLES, chance_depth = EXPECTIMAX_CHANCE_DEPTH, branch_limit = EXPECTIMAX_BRANCH_LIMIT, seed = 0):
+        self.maxturn = maxturn
+        self.num_turns = maxturn + 3 # Turns 0 through maxturn, plus the "didn't win" turn of maxturn + 2
+        self.chance_samples = chance_samples
+        self.chance_depth = chance_depth
+        self.branch_limit = branch_limit
+        self.random = random.Random(seed)
+        self.make_unmake = EXPECTIMAX_MAKE_UNMAKE
+        self.memo = {}
+        self.node_count = 0
+        self.chance_count = 0
+
+    def get_arrangements(self, library, depth):
+        # Return a list of (weight, order) pairs, where order is a permutation of the indices of the library (bottom first).
+        size = len(library)
+        if size == 0:
+            return [(1.0, [])]
+
+        arrangements = []
+        if depth >= self.chance_depth:
+            order = list(range(size))
+            self.random.shuffle(order)
+            arrangements.append((1.0, order))
+        elif self.chance_samples is None:
+            # Stratify over the card on top: one arrangement per distinct card name, with the rest of the library shuffled
+            indices_by_name = {}
+            for index, card in enumerate(library):
+                indices_by_name.setdefault(card.name, []).append(index)
+            for name, indices in indices_by_name.items():
+                top_index = indices[0]
+                rest = [index for index in range(size) if index != top_index]
+                self.random.shuffle(rest)
+                arrangements.append((len(indices) / size, rest + [top_index]))
+        else:
+            for i in range(self.chance_samples):
+                order = list(range(size))
+                self.random.shuffle(order)
+                arrangements.append((1.0 / self.chance_samples, order))
+        return arrangements
+
+    def chance_distribution(self, parent_pickle, action, depth):
+        # Re-run the action against every arrangement of the library and average the results.
+        self.chance_count += 1
+        parent = pickle.loads(parent_pickle)
+
+        method, uid = action
+        if method == 'activate' and isinstance(parent.table.get_card(uid), cards.GoblinCharbelcher):
+            return self.belcher_distribution(parent, parent_pickle, uid, depth)
+
+        arrangements = self.get_arrangements(parent.deck, depth)
+
+        distribution = [0.0] * self.num_turns
+        total_weight = 0.0
+        for weight, order in arrangements:
+            state = pickle.loads(parent_pickle)
+            library = list(state.deck)
+            state.deck.clear()
+            state.deck.extend([library[index] for index in order])
+
+            if method == 'start_turn':
+                state.start_turn()
+            elif getattr(state, 'can_' + method)(uid):
+                getattr(state, method)(uid)
+            elif method in ('play', 'alt_play'):
+                # The card only allows itself to be played when it will hit (e.g. Ancient Stirrings), but the player doesn't
+                #  know that ahead of time. With this arrangement it misses, so just pay for it and put it in the graveyard.
+                card = state.hand.get_card(uid)
+                state.hand.remove(card)
+                if method == 'play':
+                    state.adjust_mana_pool(card.cost, card.colorless_cost)
+                else:
+                    state.adjust_mana_pool(card.alt_cost, card.colorless_alt_cost)
+                state.graveyard.append(card)
+            else:
+                # Not possible with this arrangement, so leave it out of the average
+                continue
+
+            total_weight += weight
+            state_distribution = self.win_distribution(state, depth + 1)
+            for turn in range(self.num_turns):
+                distribution[turn] += weight * state_distribution[turn]
+
+        if total_weight == 0:
+            return None
+        return [probability / total_weight for probability in distribution]
+
+    def belcher_distribution(self, parent, parent_pickle, uid, depth):
+        # Goblin Charbelcher's damage only depends on how deep the first Forest is in the library, so its chance node can be
+        #  settled exactly from the library's composition instead of sampling arrangements of it.
+        distribution = [0.0] * self.num_turns
+        damage_probabilities = {}
+        reveal_count_probabilities = cards.GoblinCharbelcher.reveal_count_probabilities(len(parent.deck), parent.deck.count_cards('Forest'))
+        for revealed_count, probability in reveal_count_probabilities.items():
+            damage = cards.GoblinCharbelcher.damage_for_reveal(revealed_count)
+            if damage >= parent.opponent_lifetotal:
+                distribution[parent.current_turn] += probability
+            else:
+                damage_probabilities[damage] = damage_probabilities.get(damage, 0.0) + probability
+
+        # Below the full-width chance nodes, the chance of lethal is still exact but only one way of missing is followed
+        if depth >= self.chance_depth and len(damage_probabilities) > 1:
+            miss_probability = sum(damage_probabilities.values())
+            damage = self.random.choices(list(damage_probabilities.keys()), weights=list(damage_probabilities.values()))[0]
+            damage_probabilities = {damage: miss_probability}
+
+        # The library order isn't part of a state, so every miss that does the same damage leads to the same state
+        for damage, probability in damage_probabilities.items():
+            state = pickle.loads(parent_pickle)
+            state.activate(uid)
+            state.opponent_lifetotal = parent.opponent_lifetotal - damage
+            state_distribution = self.win_distribution(state, depth + 1)
+            for turn in range(self.num_turns):
+                distribution[turn] += probability * state_distribution[turn]
+
+        return distribution
+
+    def win_distribution(self, state:cards.Player, depth = 0):
+        # depth is the number of chance nodes above this state. States that are below the full-width chance nodes are
+        #  searched differently, so they're memoized separately.
+        key = (min(depth, self.chance_depth), str(state))
+        if key in self.memo:
+            return self.memo[key]
+
+        self.node_count += 1
+        if state.check_win():
+            distribution = point_distribution(state.current_turn, self.num_turns)
+        elif state.current_turn > self.maxturn:
+            distribution = point_distribution(self.maxturn + 2, self.num_turns)
+        elif self.make_unmake:
+            distribution = self.make_unmake_distribution(state, depth)
+        else:
+            # Snapshot the state before expanding it, so that chance nodes can re-run actions from it
+            parent_pickle = pickle.dumps(state)
+            hidden_reads = state.deck.hidden_reads
+            # Make sure that the children are copied from the snapshot too, and not after anything has peeked at the library
+            state.pickledump = parent_pickle
+
+            distribution = None
+            best_turn = cards.MAXINT
+            children = state.step_next_actions()
+            if self.branch_limit is not None and len(children) > self.branch_limit:
+                children = self.random.sample(children, self.branch_limit)
+
+            for child in children:
+                if child.deck.hidden_reads > hidden_reads:
+                    child_distribution = self.chance_distribution(parent_pickle, child.last_action, depth)
+                    if child_distribution is None:
+                        continue
+                else:
+                    child_distribution = self.win_distribution(child, depth)
+
+                child_turn = expected_turn(child_distribution)
+                if child_turn < best_turn:
+                    best_turn = child_turn
+                    distribution = child_distribution
+                    # Nothing can win sooner than this turn, so there's no point looking at the other options
+                    if best_turn <= state.current_turn:
+                        break
+
+            # The subtree is memoized, so don't keep it around
+            state.childstates = []
+
+        if distribution is None:
+            # None of the options could be taken with any arrangement of the library (only possible when the branch limit
+            #  left out passing the turn), so there's no way to win from here
+            distribution = point_distribution(self.maxturn + 2, self.num_turns)
+
+        self.memo[key] = distribution
+        return distribution
+
+    def make_unmake_distribution(self, state:cards.Player, depth):
+        # The same as the options in win_distribution(), but every option is taken on the state itself and then undone.
+        cards.to_journaled_player(state)
+        hidden_reads = state.deck.hidden_reads
+
+        # Working out the options can peek at the library, which doesn't count as an option that depends on it
+        mark = state.mark()
+        actions = state.get_next_actions()
+        state.undo(mark)
+        if self.branch_limit is not None and len(actions) > self.branch_limit:
+            actions = self.random.sample(actions, self.branch_limit)
+
+        # Chance nodes re-run actions from a snapshot of the state, which is only made if one of them needs it
+        parent_pickle = None
+        distribution = None
+        best_turn = cards.MAXINT
+        for mode, card_ref in actions:
+            mark = state.make(mode, card_ref)
+            if state.deck.hidden_reads > hidden_reads:
+                action = state.last_action
+                state.undo(mark)
+                if parent_pickle is None:
+                    parent_pickle = pickle.dumps(state)
+                child_distribution = self.chance_distribution(parent_pickle, action, depth)
+                if child_distribution is None:
+                    continue
+            else:
+                child_distribution = self.win_distribution(state, depth)
+                state.undo(mark)
+
+            child_turn = expected_turn(child_distribution)
+            if child_turn < best_turn:
+                best_turn = child_turn
+                distribution = child_distribution
+                # Nothing can win sooner than this turn, so there's no point looking at the other options
+                if best_turn <= state.current_turn:
+                    break
+
+        return distribution
+
+def find_expected_win(state:cards.Player, maxturn = 10, chance_samples = EXPECTIMAX_CHANCE_SAMPLES, chance_depth = EXPECTIMAX_CHANCE_DEPTH, branch_limit = EXPECTIMAX_BRANCH_LIMIT, seed = 0):
+    # Like find_fastest_win, but returns the distribution of the winning turn for this opening hand (and the number of
+    #  decision and chance nodes that were evaluated), rather than a single winning state.
+    to_expectimax_player(state)
+    state.start_game()
+    state.start_turn()
+
+    # Decisions within a turn can nest a long way, and each of them is a level of recursion
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+
+    search = ExpectimaxSearch(maxturn, chance_samples, chance_depth, branch_limit, seed)
+    distribution = search.win_distribution(state)
+    return distribution, search.node_count, search.chance_count
+
+def test_decklist(decklist, num_hands, max_turns, chance_samples = EXPECTIMAX_CHANCE_SAMPLES, chance_depth = EXPECTIMAX_CHANCE_DEPTH, branch_limit = EXPECTIMAX_BRANCH_LIMIT, seed_base = 0):
+    # Average the win turn distribution over a number of opening hands (the only part of the game that's still sampled).
+    then = time.time()
+    distribution = [0.0] * (max_turns + 3)
+    for i in range(num_hands):
+        player = cards.Player(decklist, seed_base + i)
+        hand_distribution, node_count, chance_count = find_expected_win(player, max_turns, chance_samples, chance_depth, branch_limit, seed_base + i)
+        print(f'  Hand {i+1}: expected win turn {expected_turn(hand_distribution):.3f} ({node_count} nodes, {chance_count} chance nodes)')
+        for turn in range(len(distribution)):
+            distribution[turn] += hand_distribution[turn] / num_hands
+
+    duration = time.time() - then
+    print(f'  Expected win turn: {expected_turn(distribution):.3f} (median {win_turn_quantile(distribution, 0.5)}, 90% by turn {win_turn_quantile(distribution, 0.9)})')
+    print(f'  Tested decklist in {duration} ({duration / num_hands} per hand)')
+    return distribution
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Expectimax evaluation of a Belcher decklist.')
+    parser.add_argument('decklist', help='Decklist file (one "<quantity> <card name>" per line, # for comments)')
+    parser.add_argument('--hands', type=int, default=20, help='Number of opening hands to average over')
+    parser.add_argument('--max-turns', type=int, default=5, help='Max number of turns to search for a win')
+    parser.add_argument('--samples', type=int, default=EXPECTIMAX_CHANCE_SAMPLES, help='Random library arrangements per chance node (0 for one per distinct top card)')
+    parser.add_argument('--chance-depth', type=int, default=EXPECTIMAX_CHANCE_DEPTH, help='Levels of chance nodes that use every arrangement (deeper ones use one)')
+    parser.add_argument('--branch-limit', type=int, default=EXPECTIMAX_BRANCH_LIMIT, help='Max number of options to consider at each decision (faster, but biases the expected win turn upwards)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the first opening hand')
+    args = parser.parse_args(argv)
+
+    # Parse the decklist the same way that the optimizer does
+    import montecarlo
+    with open(args.decklist, 'r') as f:
+        deckrange = montecarlo.parse_decklist(f.read())
+    decklist = montecarlo.get_deck_variants(deckrange)[0]
+
+    chance_samples = args.samples if args.samples > 0 else None
+    test_decklist(decklist, args.hands, args.max_turns, chance_samples, args.chance_depth, args.branch_limit, args.seed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# Importance-sampling estimates of every one-card change, from the baseline's games alone.
+#  A training epoch plays a full set of games for every +1 and -1 variant of the decklist, just to find out which changes
+#  are worth it. Most of what changes between the baseline and a variant is how likely each opening hand and each draw
+#  is: with one more Forest, hands with more Forests in them come up more often. So the baseline's games can stand in
+#  for a variant's games, by weighing each of them by how much more (or less) likely its cards were to come up in the
+#  variant (the likelihood ratio), and the weighted average win turn is an estimate of the variant's.
+#
+#  The cards that a game is weighed by are the ones that it drew naturally: the opening hand, and a card a turn up to
+#  the turn it was won on (IMPORTANCE_EXTRA_DEPTH adds more of the library on top of those). The estimates are only
+#  approximate, because a game also depends on the cards further down: tutors take cards from anywhere in the library,
+#  Charbelcher and Manamorphose see past the natural draws, and the search knows the whole library order. And a card
+#  that the baseline doesn't play can't be added this way at all, since none of its games drew one. So this is a first
+#  ranking of the changes, to pick out the ones worth simulating in full, not a replacement for simulating them.
+#
+#  The effective sample size (ESS) of each estimate says how many unweighted games its weighted games are worth. The
+#  fewer games the weight ends up on, the less the estimate can be trusted.
+#
+# Usage:
+#  python importance.py logs/some_run/ [--epoch N]   (reuse the baseline games that a training run recorded)
+#  python importance.py decklist.txt [--games 1000] [--config settings.json]   (play the baseline games first)
+import argparse
+import json
+import math
+import os
+import sys
+from collections import Counter
+
+import batch
+import cards
+import montecarlo
+import results
+
+IMPORTANCE_EXTRA_DEPTH = 0 # How many more cards from the top of the library to weigh each game by, on top of the ones it drew naturally
+IMPORTANCE_MIN_ESS = 30 # Estimates with an effective sample size below this are marked as unreliable in the summary
+
+def get_drawn_count(win_turn, won, deck_size, extra_depth = IMPORTANCE_EXTRA_DEPTH):
+    # How many cards from the top of the library a game is weighed by: the opening hand and a draw on every turn after
+    #  the first, up to the turn it was won on. Games that weren't won are recorded as max_turns + 2, and were searched
+    #  up to max_turns.
+    last_turn = win_turn if won else win_turn - 2
+    return min(deck_size, 7 + max(0, last_turn - 1) + extra_depth)
+
+def get_top_cards(decklist, seed, count):
+    # The names of the top count cards of the library that a game of decklist on seed starts from, top first (the same
+    #  shuffle as Player.start_game(), without drawing anything)
+    player = cards.Player(decklist, seed)
+    player.deck.shuffle()
+    return [card.name for card in list(reversed(player.deck))[:count]]
+
+def log_falling(n, k):
+    # log(n * (n - 1) * ... * (n - k + 1)), the number of ways to draw k of n cards in order. -inf if there aren't k.
+    if k > n:
+        return -math.inf
+    return math.lgamma(n + 1) - math.lgamma(n - k + 1)
+
+def get_log_weight(deck_counts, deck_size, drawn_counts, drawn_count, cardname, change):
+    # log of how much more likely drawing drawn_counts (the number of each card among the top drawn_count cards) is with
+    #  change more of cardname in the deck. Only cardname's own count and the deck size change, so every other card's
+    #  factor cancels out.
+    count = deck_counts.get(cardname, 0)
+    drawn = drawn_counts.get(cardname, 0)
+    variant_ways = log_falling(count + change, drawn)
+    if variant_ways == -math.inf:
+        return -math.inf
+    return variant_ways - log_falling(count, drawn) + log_falling(deck_size, drawn_count) - log_falling(deck_size + change, drawn_count)
+
+def estimate_change(games, deck_counts, deck_size, cardname, change):
+    # games is a list of (win turn, drawn counts, drawn count). Returns the weighted average win turn, its difference from
+    #  the baseline's and the half-width of that difference's confidence interval, and the effective sample size.
+    log_weights = [get_log_weight(deck_counts, deck_size, drawn_counts, drawn_count, cardname, change) for win_turn, drawn_counts, drawn_count in games]
+    # Scale the weights by the largest one before exponentiating, so that long games don't underflow
+    max_log_weight = max(log_weights)
+    if max_log_weight == -math.inf:
+        return None
+    weights = [math.exp(log_weight - max_log_weight) for log_weight in log_weights]
+    total_weight = sum(weights)
+    win_turns = [win_turn for win_turn, drawn_counts, drawn_count in games]
+    estimate = sum([weight * win_turn for weight, win_turn in zip(weights, win_turns)]) / total_weight
+    baseline = sum(win_turns) / len(win_turns)
+    effective_sample_size = total_weight ** 2 / sum([weight ** 2 for weight in weights])
+    # Both averages are over the same games, so the interval of the difference comes from each game's contribution to
+    #  both of them (the linearized variance of a self-normalized estimate)
+    variance = sum([(weight / total_weight * (win_turn - estimate) - (win_turn - baseline) / len(games)) ** 2 for weight, win_turn in zip(weights, win_turns)])
+    return {'estimate': estimate, 'effect': estimate - baseline, 'effect_interval': batch.CONFIDENCE_Z * math.sqrt(variance),
+            'ess': effective_sample_size}
+
+def estimate_changes(decklist, games, extra_depth = IMPORTANCE_EXTRA_DEPTH):
+    # games is a list of (seed, win turn, won) of the baseline decklist. Returns one row per +1 and -1 change that
+    #  get_deck_variants() would try, best (lowest estimated win turn) first, and the changes that can't be estimated.
+    deckrange = montecarlo.parse_decklist(decklist)
+    deck_counts = {card['name']: card['quant'] for card in deckrange}
+    deck_size = sum(deck_counts.values())
+    deck_baseline, decks_61, cards_61, decks_59, cards_59 = montecarlo.get_deck_variants(deckrange)
+
+    weighed_games = []
+    for seed, win_turn, won in games:
+        drawn_count = get_drawn_count(win_turn, won, deck_size, extra_depth)
+        weighed_games.append((win_turn, Counter(get_top_cards(deck_baseline, seed, drawn_count)), drawn_count))
+
+    rows = []
+    unestimated = []
+    for cardname, change in [(cardname, 1) for cardname in cards_61] + [(cardname, -1) for cardname in cards_59]:
+        label = f'+{cardname}' if change > 0 else f'-{cardname}'
+        # None of the baseline's games drew a card it doesn't play, so they can't say what drawing one would do
+        row = estimate_change(weighed_games, deck_counts, deck_size, cardname, change) if deck_counts[cardname] > 0 else None
+        if row is None:
+            unestimated.append(label)
+            continue
+        row.update({'label': label, 'card': cardname, 'change': change, 'games': len(games)})
+        rows.append(row)
+    rows.sort(key=lambda row: row['estimate'])
+    return rows, unestimated
+
+def load_baseline_games(folder, epoch = None):
+    # The baseline decklist and its (seed, win turn, won) games from a results folder, of the given epoch or the last
+    #  one that played any baseline games
+    variants = [variant for variant in results.load_variants(folder) if variant['label'] == 'baseline']
+    if epoch is not None:
+        variants = [variant for variant in variants if variant['epoch'] == epoch]
+    records = results.load_results(folder)
+    for variant in reversed(variants):
+        variant_games = records[records['variant_id'] == variant['variant_id']]
+        if len(variant_games) > 0:
+            return variant['decklist'], [(int(game['seed']), int(game['win_turn']), bool(game['won'])) for game in variant_games]
+    raise Exception(f'No baseline games found in {folder}' + (f' for epoch {epoch}' if epoch is not None else ''))
+
+def play_baseline_games(decklist, num_games, max_turns = 10, seed_base = 0):
+    deck_baseline = montecarlo.get_deck_variants(montecarlo.parse_decklist(decklist))[0]
+    game_results = montecarlo.play_games([cards.Player(deck_baseline, seed_base + game) for game in range(num_games)], max_turns)
+    games = []
+    for game, (win_state, action_count, max_leaf_nodes, duration, search_stats) in enumerate(game_results):
+        # Games that weren't won count as max_turns + 2, the same as in training
+        games.append((seed_base + game, win_state.current_turn if win_state is not None else max_turns + 2, win_state is not None))
+    return deck_baseline, games
+
+def print_summary(rows, unestimated):
+    for rank, row in enumerate(rows):
+        unreliable = ' (unreliable)' if row['ess'] < IMPORTANCE_MIN_ESS else ''
+        print(f"{rank + 1:3d}. {row['label']}: est {row['estimate']:.3f}, {row['effect']:+.3f} ± {row['effect_interval']:.3f} vs the baseline, "
+              f"ESS {row['ess']:.1f} of {row['games']}{unreliable}")
+    if len(unestimated) > 0:
+        print(f"Can't estimate: {', '.join(unestimated)}")
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Estimate every one-card change's average win turn from the baseline's games alone.")
+    parser.add_argument('source', help="A results folder with a training run's baseline games, or a decklist file to play baseline games of")
+    parser.add_argument('--epoch', type=int, help='Epoch of the results folder to use the baseline games of (default: the last one)')
+    parser.add_argument('--extra-depth', type=int, default=IMPORTANCE_EXTRA_DEPTH, help=f'Cards past the natural draws to weigh each game by (default: {IMPORTANCE_EXTRA_DEPTH})')
+    parser.add_argument('--config', help='JSON file of montecarlo.py settings (e.g. {"prune_limit": 500})')
+    parser.add_argument('--games', type=int, default=1000, help='Number of baseline games to play, for a decklist (default: 1000)')
+    parser.add_argument('--seed', type=int, default=0, help='First seed to play (default: 0)')
+    parser.add_argument('--max-turns', type=int, default=10, help='Max number of turns to search for a win (default: 10)')
+    parser.add_argument('--serial', action='store_true', help='Play games in this process instead of in a pool of workers')
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.source):
+        decklist, games = load_baseline_games(args.source, args.epoch)
+        print(f'Using {len(games)} baseline games from {args.source}')
+    else:
+        if args.config:
+            with open(args.config, 'r') as f:
+                montecarlo.apply_config(json.load(f))
+        if args.serial:
+            montecarlo.USE_PARALLEL = False
+        with open(args.source, 'r') as f:
+            decklist = f.read()
+        print(f'Playing {args.games} baseline games')
+        decklist, games = play_baseline_games(decklist, args.games, args.max_turns, args.seed)
+
+    rows, unestimated = estimate_changes(decklist, games, args.extra_depth)
+    print_summary(rows, unestimated)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1499 @@
+# Headless Monte-Carlo deck optimizer for the Belcher deck.
+#  This holds everything that the simulation needs (searching games, testing decklists, and running epochs),
+#  so that it can be run from the command line or a worker process without pulling in any notebook-only packages.
+#  Plotting (matplotlib) and the surrogate model (numpy) are only imported if they're used.
+#
+# Usage: python montecarlo.py decklist.txt [--config config.json] [--epochs 100] [--step-size 1000] ...
+import argparse
+import datetime
+import gc
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+from functools import partial
+from typing import List
+
+import cards
+import results
+
+def parse_decklist(decklist):
+    # Split the decklist into lines
+    deckrange = decklist.split('\n')
+    # Remove empty lines and comments
+    deckrange = [line.strip() for line in deckrange]
+    deckrange = [line for line in deckrange if line and not line.startswith('#')]
+    # Split the decklist into card names and quantities
+    deckrange = [line.split(' ', 1) for line in deckrange]
+    # Convert the quantities to integers and label the values in a dictionary
+    deckrange = [{'quant':int(quantity), 'name':cardname} for quantity, cardname in deckrange]
+
+    # Ensure that we've got a 60-card list
+    cardcount = sum([card['quant'] for card in deckrange])
+    print(f'### Total cards: {cardcount}')
+    if cardcount != 60:
+        raise Exception(f'Decklist must contain exactly 60 cards, found {cardcount}.')
+
+    return deckrange
+
+
+def get_deck_variants(deckrange):
+    """Get all possible deck variants"""
+    decks_61 = []
+    cards_61 = []
+    decks_59 = []
+    cards_59 = []
+
+    deck_baseline = ""
+    for card in deckrange:
+        deck_baseline += str(card['quant']) + " " + card['name'] + "\n"
+    
+    # 61-card decks
+    for chosen_card in deckrange:
+        deck = ""
+        # Get the max quantity of the chosen card
+        # Find the card by name
+        card_class = cards.get_card_by_name(chosen_card['name'])
+        if chosen_card['quant'] < card_class.deck_max_quant:
+            for card in deckrange:
+                quant = card['quant']
+                if card['name'] == chosen_card['name']:
+                    quant += 1
+                deck += str(quant) + " " + card['name'] + "\n"
+            decks_61.append(deck)
+            cards_61.append(chosen_card['name'])
+
+    # 59-card decks
+    for chosen_card in deckrange:
+        deck = ""
+        if chosen_card['quant'] > 0: #chosen_card['min_quant']:
+            for card in deckrange:
+                quant = card['quant']
+                if card['name'] == chosen_card['name']:
+                    quant -= 1
+                deck += str(quant) + " " + card['name'] + "\n"
+            decks_59.append(deck)
+            cards_59.append(chosen_card['name'])
+
+    return deck_baseline, decks_61, cards_61, decks_59, cards_59
+
+
+PRUNE_LIMIT = 1000 # Max number of leaf nodes that we support iterating through
+PARALLEL_SEARCH_THRESHOLD = 200 # When searching a single game with multiple workers, only split the frontier across them once it has at least this many leaf nodes
+SEARCH_GC_MODE = 'disable' # How to run Python's cyclic garbage collector during a search: 'default' leaves it alone, 'tune' raises its thresholds to SEARCH_GC_THRESHOLDS, and 'disable' turns it off. The search tree doesn't have reference cycles, so scanning it is wasted time.
+SEARCH_GC_THRESHOLDS = (100000, 50, 100) # Collector thresholds for the 'tune' mode
+RECYCLE_PRUNED_STATES = True # Hand the zones of pruned states back to cards.zone_pool, so that the states copied after them can reuse them
+DOMINANCE_PRUNING = True # Before stepping the leaf nodes, drop the ones that another leaf node on the same turn has at least as much of everything as (see DominanceIndex)
+CARD_STATS = True # Count the children, prunes, duplicates, and dominated states that each card's actions lead to. Recorded per variant in the results (see results.CARD_STATS_FILENAME).
+CARD_TIMING = False # Also time each card's can_*/play methods for the per-card stats. Makes the search about 10% slower.
+MEMORY_BUDGET = None # Approximate number of bytes that the states of a single game's search may hold. None for no budget.
+STATE_MEMORY_FACTOR = 4.1 # How many times bigger a live state is than its pickle (measured with tracemalloc on the baseline decklist, including the search's own bookkeeping)
+RELEASED_STATE_BYTES = 330 # How much memory the shell of a released state still holds, to link the search tree together (also measured with tracemalloc)
+MEMORY_COMPACT_FRACTION = 0.8 # Start compacting the search tree once it's estimated to hold this fraction of MEMORY_BUDGET
+
+# Time every garbage collection during a search, so that searches can report how long they were paused for
+gc_stats = {'collections': 0, 'pause': 0.0, 'started': 0.0}
+def time_gc(phase, info):
+    if phase == 'start':
+        gc_stats['started'] = time.perf_counter()
+    else:
+        gc_stats['collections'] += 1
+        gc_stats['pause'] += time.perf_counter() - gc_stats['started']
+
+# How much garbage collection, zone allocation, and (estimated peak) memory the last find_fastest_win() did
+last_search_stats = {}
+
+# Per-card stats of the search in progress (or the last one), as {card name: {stat: amount}} for the stats in CARD_STAT_KEYS.
+#  States are counted under the card whose action led to them (see cards.Player.branch_card), so this shows which cards
+#  make the search expensive (lots of children), and which ones it gives up on the most (pruned by the prune limit).
+CARD_STAT_KEYS = ['children', 'pruned', 'duplicates', 'dominated', 'seconds']
+search_card_stats = {}
+
+def count_card_stat(card_stats, card_name, key, amount = 1):
+    stats = card_stats.get(card_name)
+    if stats is None:
+        stats = card_stats[card_name] = dict.fromkeys(CARD_STAT_KEYS, 0)
+    stats[key] += amount
+
+def count_card_states(states, key):
+    # Has to be called before the states are pruned, since released states don't remember their card anymore
+    if CARD_STATS:
+        for state in states:
+            count_card_stat(search_card_stats, state.branch_card, key)
+
+def merge_card_stats(total, card_stats):
+    for card_name, stats in card_stats.items():
+        for key, amount in stats.items():
+            count_card_stat(total, card_name, key, amount)
+
+def collect_card_stats():
+    # Add the time spent in each card's methods since the last call to search_card_stats
+    if cards.card_timings is not None:
+        for card_name, seconds in cards.card_timings.items():
+            count_card_stat(search_card_stats, card_name, 'seconds', seconds)
+        cards.card_timings = {}
+    return search_card_stats
+
+def start_search_gc():
+    # Returns the collector settings to put back afterwards with stop_search_gc()
+    previous = (gc.isenabled(), gc.get_threshold())
+    # Only time collections while searching, rather than every collection in the host process
+    gc.callbacks.append(time_gc)
+    if SEARCH_GC_MODE != 'default':
+        # Everything that's alive before the search (modules, card classes, decklists) lives at least as long as it does, so
+        #  move it out of the collector's way.
+        gc.freeze()
+    if SEARCH_GC_MODE == 'disable':
+        gc.disable()
+    elif SEARCH_GC_MODE == 'tune':
+        gc.set_threshold(*SEARCH_GC_THRESHOLDS)
+    return previous
+
+def stop_search_gc(previous):
+    enabled, threshold = previous
+    gc.set_threshold(*threshold)
+    if enabled:
+        gc.enable()
+    if SEARCH_GC_MODE != 'default':
+        gc.unfreeze()
+    gc.callbacks.remove(time_gc)
+
+def prune_state(state:cards.Player):
+    state.is_pruned = True
+    if RECYCLE_PRUNED_STATES:
+        state.release()
+
+# Approximate accounting of the memory held by the states of a single search, so that it can stay within a memory budget.
+#  Measuring the real size of every state would cost about as much as copying it, so every live state is assumed to be
+#  as big as the root state, plus whatever pickle dumps they have cached for copying themselves.
+class SearchMemory:
+    def __init__(self, root:cards.Player, budget = None):
+        self.budget = budget
+        self.root = root
+        self.state_bytes = len(root.serialize()) * STATE_MEMORY_FACTOR
+        self.live_states = 1
+        self.released_states = 0
+        self.pickle_bytes = 0
+        # The strings that leaf nodes are deduplicated by (see search_fastest_win()), which are kept for the whole search
+        self.unique_leaf_nodes = {}
+        self.key_bytes = 0
+        # Profiles of the leaf nodes on the current turn, for dominance pruning (only used with DOMINANCE_PRUNING)
+        self.dominance_index = DominanceIndex()
+        # Free zones in cards.zone_pool are memory that this search holds too. Under a budget, start with an empty pool,
+        #  so that it doesn't count zones left over from earlier games.
+        if budget is not None:
+            cards.zone_pool.clear()
+        self.peak = self.used()
+        # Interior states that were stepped since the last compaction
+        self.expanded = []
+        self.expanded_count = 0
+        self.children_count = 0
+
+    def used(self):
+        return (self.live_states * self.state_bytes + self.released_states * RELEASED_STATE_BYTES + self.pickle_bytes
+                + self.key_bytes + sys.getsizeof(self.unique_leaf_nodes) + cards.zone_pool.free_bytes + self.dominance_index.bytes)
+
+    def add_unique_leaf(self, string_rep, leaf):
+        self.unique_leaf_nodes[string_rep] = leaf
+        self.key_bytes += sys.getsizeof(string_rep)
+
+    def is_near_budget(self):
+        return self.budget is not None and self.used() > self.budget * MEMORY_COMPACT_FRACTION
+
+    def is_over_budget(self):
+        return self.budget is not None and self.used() > self.budget
+
+    def add_expanded(self, state:cards.Player, next_states):
+        self.live_states += len(next_states)
+        if state.pickledump is not None:
+            self.pickle_bytes += len(state.pickledump)
+        self.expanded.append(state)
+        self.expanded_count += 1
+        self.children_count += len(next_states)
+        self.peak = max(self.peak, self.used())
+
+    def set_frontier(self, leaf_count):
+        # The main process of a parallel search only sees how many leaf nodes the workers hold. Under a budget, the workers
+        #  release every state that they step, so the leaf nodes (and the root) are all that's left. Without a budget,
+        #  this undercounts the stepped states that the workers keep around. It never counts the zone pools of the workers.
+        self.live_states = leaf_count + 1
+        self.pickle_bytes = 0
+        self.peak = max(self.peak, self.used())
+
+    def remove_states(self, count):
+        self.live_states -= count
+        self.released_states += count
+
+    def add_released(self, count):
+        # For parallel searches, where the workers release the states (see set_frontier())
+        self.released_states += count
+        self.peak = max(self.peak, self.used())
+
+    def compact(self):
+        # Stepped states are only kept around to link the tree together. get_all_leaf_nodes() still walks through released
+        #  states (they keep their childstates), so their zones and cached pickle dumps can be handed back.
+        for state in self.expanded:
+            if state is self.root or state.is_released:
+                continue
+            if state.pickledump is not None:
+                self.pickle_bytes -= len(state.pickledump)
+            state.release()
+            self.remove_states(1)
+        self.expanded = []
+
+    def get_step_limit(self, leaf_node_limit):
+        # How many leaf nodes can still be stepped without going over the budget, based on how many children each step
+        #  has made so far (and the pickle dump that every stepped state caches). Always step at least one, so the search
+        #  keeps going.
+        branching = self.children_count / self.expanded_count if self.expanded_count > 0 else 1
+        step_bytes = branching * self.state_bytes + self.state_bytes / STATE_MEMORY_FACTOR
+        return max(1, min(leaf_node_limit, int((self.budget * MEMORY_COMPACT_FRACTION - self.used()) / step_bytes)))
+
+# Dominance pruning of the leaf nodes on the same turn.
+#  Deduplication only catches states that are exactly the same, but a lot of the frontier is states that only differ in
+#  how many resources they have left (like casting a spell that did nothing useful, or tapping a creature for mana that
+#  never got spent). A state that has at least as much of everything as another one (see
+#  cards.Player.get_dominance_profile()) can always do whatever the other one does, so it wins at least as soon, and the
+#  other one doesn't need to be expanded. Unlike random pruning, this shrinks the frontier without choosing which lines of
+#  play to give up on.
+#  Leaves are bucketed by the key of their profile, so each one is only compared against the few that could dominate it,
+#  and only the current turn is indexed, since the search never goes back to an earlier turn.
+class DominanceIndex:
+    def __init__(self):
+        self.turn = None
+        # {profile key: [(resources, hand, table, exile) of the leaves that were kept]}
+        self.buckets = {}
+        self.bytes = 0
+        self.dominated = 0
+
+    @staticmethod
+    def dominates(resources_and_cards, other) -> bool:
+        resources, hand, table, exile = resources_and_cards
+        other_resources, other_hand, other_table, other_exile = other
+        for amount, other_amount in zip(resources, other_resources):
+            if amount < other_amount:
+                return False
+        for cards, other_cards in ((hand, other_hand), (table, other_table), (exile, other_exile)):
+            for card, count in other_cards.items():
+                if cards.get(card, 0) < count:
+                    return False
+        return True
+
+    @staticmethod
+    def get_size(profile) -> int:
+        # Dominating a profile takes at least as big of a size, so sorting by size puts the dominating profiles first
+        key, resources, hand, table, exile = profile
+        return sum(resources) + sum(hand.values()) + sum(table.values()) + sum(exile.values())
+
+    def find_dominated(self, turn, profiles) -> set:
+        # Index the profiles of the leaf nodes at the given turn, and return the positions of the ones that are dominated by
+        #  another one (whether from this step or an earlier one). Of equal profiles, the first one is kept.
+        if turn != self.turn:
+            self.turn = turn
+            self.buckets = {}
+            self.bytes = 0
+        dominated = set()
+        order = sorted(range(len(profiles)), key=lambda index: -self.get_size(profiles[index]))
+        for index in order:
+            key, resources, hand, table, exile = profiles[index]
+            resources_and_cards = (resources, hand, table, exile)
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = []
+                # The library is most of the key
+                self.bytes += sys.getsizeof(key) + sys.getsizeof(key[1]) + sys.getsizeof(bucket)
+            if any(self.dominates(other, resources_and_cards) for other in bucket):
+                dominated.add(index)
+            else:
+                bucket.append(resources_and_cards)
+                self.bytes += (sys.getsizeof(resources_and_cards) + sys.getsizeof(resources) + sys.getsizeof(hand)
+                               + sys.getsizeof(table) + sys.getsizeof(exile))
+        self.dominated += len(dominated)
+        return dominated
+
+def print_tree(state:cards.Player, depth = 0):
+    if state.is_released:
+        print ("  "*depth, "(pruned)")
+        return
+    print ("  "*depth, state.short_str())
+    for child in state.childstates:
+        print_tree(child, depth+1)
+
+def get_all_leaf_nodes(state:cards.Player) -> List[cards.Player]:
+    if state.is_pruned:
+        return []
+
+    if len(state.childstates) == 0:
+        return [state]
+    else:
+        leaf_nodes = []
+        for child in state.childstates:
+            leaf_nodes.extend(get_all_leaf_nodes(child))
+        return leaf_nodes
+
+def find_fastest_win(state:cards.Player, maxturn = 10, prune_limit = None, search_workers = 1, memory_budget = None):
+    global last_search_stats
+    global search_card_stats
+    collections, pause = gc_stats['collections'], gc_stats['pause']
+    allocated, reused = cards.zone_pool.allocated, cards.zone_pool.reused
+    if memory_budget is None:
+        memory_budget = MEMORY_BUDGET
+
+    state.start_game()
+    state.start_turn()
+    memory = SearchMemory(state, memory_budget)
+    search_card_stats = {}
+    if CARD_STATS and CARD_TIMING:
+        cards.card_timings = {}
+
+    gc_settings = start_search_gc()
+    try:
+        result = search_fastest_win(state, maxturn, prune_limit, search_workers, memory)
+    finally:
+        stop_search_gc(gc_settings)
+        collect_card_stats()
+        cards.card_timings = None
+
+    last_search_stats = {
+        'gc_collections': gc_stats['collections'] - collections,
+        'gc_pause': gc_stats['pause'] - pause,
+        'zones_allocated': cards.zone_pool.allocated - allocated,
+        'zones_reused': cards.zone_pool.reused - reused,
+        'peak_memory': int(memory.peak),
+        'dominated_states': memory.dominance_index.dominated,
+    }
+    if CARD_STATS:
+        last_search_stats['card_stats'] = search_card_stats
+    return result
+
+def search_fastest_win(state:cards.Player, maxturn, prune_limit, search_workers, memory:SearchMemory):
+    did_win = False
+    win_state = None
+    max_leaf_nodes = 0
+    action_count = 0
+    leaf_node_limit = PRUNE_LIMIT if prune_limit is None else prune_limit
+
+    # Track leaf nodes that are unique
+    unique_leaf_nodes = memory.unique_leaf_nodes
+
+    while not did_win:
+        action_count += 1
+        leaf_nodes = get_all_leaf_nodes(state)
+        
+        if len(leaf_nodes) > max_leaf_nodes:
+            max_leaf_nodes = len(leaf_nodes)
+
+        # Every line of play can end up pruned if the only states that could continue it were pruned (see cards.Player.is_redundant_ordering)
+        if len(leaf_nodes) == 0:
+            break
+
+        # If this is a hard game with a big frontier, then hand the rest of the search off to multiple worker processes.
+        if search_workers > 1 and len(leaf_nodes) >= PARALLEL_SEARCH_THRESHOLD:
+            return find_fastest_win_parallel(state, leaf_nodes, unique_leaf_nodes, maxturn, leaf_node_limit, search_workers, action_count, max_leaf_nodes, memory)
+
+        # Find the minimum turn in the leaf nodes
+        min_turn = min([leaf.current_turn for leaf in leaf_nodes])
+
+        # Find any leaf nodes that are at the minimum turn
+        min_turn_leaf_nodes = [leaf for leaf in leaf_nodes if leaf.current_turn == min_turn]
+
+        # Find any leaf nodes where check_win() is True
+        win_leaf_nodes = [leaf for leaf in min_turn_leaf_nodes if leaf.check_win()]
+
+        if len(win_leaf_nodes) > 0:
+            did_win = True
+            win_state = win_leaf_nodes[0]
+            break
+        elif min_turn > maxturn:
+            break
+
+        next_min_turn_leaf_nodes = []
+        # For each leaf node in the min_turn_leaf_node list, deduplicate states that have the same string representation
+        for leaf in min_turn_leaf_nodes:
+            string_rep = str(leaf)
+            if string_rep not in unique_leaf_nodes:
+                memory.add_unique_leaf(string_rep, leaf)
+                next_min_turn_leaf_nodes.append(leaf)
+            else:
+                count_card_states([leaf], 'duplicates')
+                prune_state(leaf)
+                if RECYCLE_PRUNED_STATES:
+                    memory.remove_states(1)
+
+        #next_min_turn_leaf_nodes = list(unique_leaf_nodes.values())
+
+        min_turn_leaf_nodes = next_min_turn_leaf_nodes
+
+        if DOMINANCE_PRUNING:
+            dominated = memory.dominance_index.find_dominated(min_turn, [leaf.get_dominance_profile() for leaf in min_turn_leaf_nodes])
+            if len(dominated) > 0:
+                count_card_states([min_turn_leaf_nodes[index] for index in dominated], 'dominated')
+                for index in dominated:
+                    prune_state(min_turn_leaf_nodes[index])
+                if RECYCLE_PRUNED_STATES:
+                    memory.remove_states(len(dominated))
+                min_turn_leaf_nodes = [leaf for index, leaf in enumerate(min_turn_leaf_nodes) if index not in dominated]
+        
+        #print(f'Deduplicated {len(min_turn_leaf_nodes)} leaf nodes to {len(unique_leaf_nodes)} leaf nodes')
+
+        # When we're getting close to the memory budget, first compact the states that were already stepped, and if that's
+        #  not enough, step fewer leaf nodes this time around instead of growing the tree past the budget.
+        step_limit = leaf_node_limit
+        if memory.is_near_budget():
+            memory.compact()
+            if memory.is_near_budget():
+                step_limit = memory.get_step_limit(leaf_node_limit)
+
+        # For each leaf node that is 
+        # If we have more than step_limit leaf nodes, randomly select step_limit of them
+        excess = len(min_turn_leaf_nodes) - step_limit
+        if excess > 0:
+            #print(f'Warning: Exceeding leaf node limit of {leaf_node_limit} at turn {min_turn} with {len(min_turn_leaf_nodes)} leaf nodes')
+
+            """
+            # Print off five random leaf nodes
+            for i in range(5):
+                print(f'*** Random leaf node {i}:')
+                random_leaf = random.choice(min_turn_leaf_nodes)
+                print_tree(random_leaf)
+                print(random_leaf)
+                random_leaf.dumplog()
+            """
+            
+            # Randomly select a subset of leaf nodes to prune
+            # Shuffle our list of leaf nodes
+            cards.get_game_random(state.randseed).shuffle(min_turn_leaf_nodes)
+            
+            # Select the second half of min_turn_leaf_nodes to be pruned
+            prune_nodes = min_turn_leaf_nodes[step_limit:]
+            count_card_states(prune_nodes, 'pruned')
+            for leaf in prune_nodes:
+                prune_state(leaf)
+            if RECYCLE_PRUNED_STATES:
+                memory.remove_states(len(prune_nodes))
+            # The others are not pruned and are kept.
+            min_turn_leaf_nodes = min_turn_leaf_nodes[:step_limit]
+
+        # Step through all min_turn_leaf_nodes
+        for index, leaf in enumerate(min_turn_leaf_nodes):
+            if memory.is_over_budget():
+                # Out of budget partway through, so drop the rest of the leaf nodes rather than stepping them
+                for pruned_leaf in min_turn_leaf_nodes[index:]:
+                    prune_state(pruned_leaf)
+                if RECYCLE_PRUNED_STATES:
+                    memory.remove_states(len(min_turn_leaf_nodes) - index)
+                break
+            next_states = leaf.step_next_actions()
+            memory.add_expanded(leaf, next_states)
+            count_card_states(next_states, 'children')
+            for next_state in next_states:
+                if next_state.check_win():
+                    did_win = True
+                    win_state = next_state
+                    break
+            if did_win:
+                break
+        
+    return win_state, action_count, max_leaf_nodes
+# Parallel search within a single game.
+#  The frontier is split into contiguous slices (in the same order that get_all_leaf_nodes returns them), and each
+#  worker process owns the subtrees under its slice. The workers expand their own subtrees, but they step in lockstep
+#  with the main process, which does the deduplication and random pruning over the whole frontier exactly like
+#  find_fastest_win does. This way the result is identical to the single-process search, just with the expensive
+#  parts (copying states, stepping them, and building their string representations) spread over multiple cores.
+def search_worker(conn, roots, best_win_position, config):
+    global search_card_stats
+    # Workers that weren't forked start out with the module defaults, rather than the settings of the search they're in
+    apply_config(config)
+    # Start over from the stats that were copied from the main process, which sends back what it hasn't counted yet
+    search_card_stats = {}
+    if CARD_STATS and CARD_TIMING:
+        cards.card_timings = {}
+    leaf_nodes = []
+    min_turn_leaf_nodes = []
+    win_state = None
+
+    while True:
+        command, arg = conn.recv()
+
+        if command == 'leaves':
+            leaf_nodes = []
+            for root in roots:
+                leaf_nodes.extend(get_all_leaf_nodes(root))
+            min_turn = min([leaf.current_turn for leaf in leaf_nodes]) if leaf_nodes else None
+            conn.send((min_turn, len(leaf_nodes)))
+        elif command == 'describe':
+            min_turn_leaf_nodes = [leaf for leaf in leaf_nodes if leaf.current_turn == arg]
+            conn.send([(str(leaf), leaf.check_win(), leaf.get_dominance_profile() if DOMINANCE_PRUNING else None, leaf.branch_card) for leaf in min_turn_leaf_nodes])
+        elif command == 'step':
+            pruned, steps, compact = arg
+            for index in pruned:
+                prune_state(min_turn_leaf_nodes[index])
+
+            # Steps are (position, index) pairs, where position is the order that the main process would step them in.
+            found_position = None
+            for position, index in steps:
+                # If another worker already found a win earlier in the stepping order, then there's no point in continuing.
+                if best_win_position.value <= position:
+                    break
+                leaf = min_turn_leaf_nodes[index]
+                next_states = leaf.step_next_actions()
+                count_card_states(next_states, 'children')
+                for next_state in next_states:
+                    if next_state.check_win():
+                        win_state = next_state
+                        found_position = position
+                        break
+                if found_position is None and compact:
+                    # Under a memory budget, stepped states are released straight away (see SearchMemory.compact)
+                    leaf.release()
+                if found_position is not None:
+                    with best_win_position.get_lock():
+                        if found_position < best_win_position.value:
+                            best_win_position.value = found_position
+                    break
+            conn.send((found_position, collect_card_stats()))
+            search_card_stats = {}
+        elif command == 'win':
+            # Send back either the winning leaf at the given index, or the winning state that we found while stepping
+            conn.send(win_state if arg is None else min_turn_leaf_nodes[arg])
+        elif command == 'stop':
+            break
+
+    conn.close()
+
+def find_fastest_win_parallel(state:cards.Player, leaf_nodes, unique_leaf_nodes, maxturn, leaf_node_limit, search_workers, action_count, max_leaf_nodes, memory:SearchMemory):
+    win_state = None
+
+    # Hand each worker a contiguous slice of the leaf nodes so that the overall leaf order stays the same
+    chunk_size = -(-len(leaf_nodes) // search_workers)
+    best_win_position = mp.Value('i', cards.MAXINT)
+    workers = []
+    for i in range(search_workers):
+        conn, worker_conn = mp.Pipe()
+        process = mp.Process(target=search_worker, args=(worker_conn, leaf_nodes[i*chunk_size:(i+1)*chunk_size], best_win_position, get_config()))
+        process.start()
+        workers.append((process, conn))
+
+    def ask_all(command, args):
+        for (process, conn), arg in zip(workers, args):
+            conn.send((command, arg))
+        return [conn.recv() for process, conn in workers]
+
+    try:
+        while True:
+            replies = ask_all('leaves', [None] * search_workers)
+
+            leaf_count = sum([leaf_count for min_turn, leaf_count in replies])
+            if leaf_count > max_leaf_nodes:
+                max_leaf_nodes = leaf_count
+            memory.set_frontier(leaf_count)
+
+            # Every line of play can end up pruned (see find_fastest_win)
+            if all([min_turn is None for min_turn, leaf_count in replies]):
+                break
+
+            # Find the minimum turn in the leaf nodes
+            min_turn = min([min_turn for min_turn, leaf_count in replies if min_turn is not None])
+
+            # Gather the leaf nodes at the minimum turn, in order, as (worker, index) pairs
+            descriptions = ask_all('describe', [min_turn] * search_workers)
+            min_turn_leaf_nodes = []
+            # The card that led to each leaf node, for the per-card stats
+            branch_cards = {}
+            for worker, worker_descriptions in enumerate(descriptions):
+                for index, (string_rep, is_win, profile, branch_card) in enumerate(worker_descriptions):
+                    min_turn_leaf_nodes.append((worker, index, string_rep, is_win, profile))
+                    branch_cards[(worker, index)] = branch_card
+
+            # Find any leaf nodes where check_win() is True
+            win_leaf_nodes = [(worker, index) for worker, index, string_rep, is_win, profile in min_turn_leaf_nodes if is_win]
+            if len(win_leaf_nodes) > 0:
+                worker, index = win_leaf_nodes[0]
+                workers[worker][1].send(('win', index))
+                win_state = workers[worker][1].recv()
+                break
+            elif min_turn > maxturn:
+                break
+
+            # Deduplicate states that have the same string representation
+            pruned = [[] for worker in workers]
+            next_min_turn_leaf_nodes = []
+            profiles = []
+            for worker, index, string_rep, is_win, profile in min_turn_leaf_nodes:
+                if string_rep not in unique_leaf_nodes:
+                    memory.add_unique_leaf(string_rep, None)
+                    next_min_turn_leaf_nodes.append((worker, index))
+                    profiles.append(profile)
+                else:
+                    pruned[worker].append(index)
+                    if CARD_STATS:
+                        count_card_stat(search_card_stats, branch_cards[(worker, index)], 'duplicates')
+            min_turn_leaf_nodes = next_min_turn_leaf_nodes
+
+            # Drop the dominated leaf nodes (see find_fastest_win)
+            if DOMINANCE_PRUNING:
+                dominated = memory.dominance_index.find_dominated(min_turn, profiles)
+                for position in dominated:
+                    worker, index = min_turn_leaf_nodes[position]
+                    pruned[worker].append(index)
+                    if CARD_STATS:
+                        count_card_stat(search_card_stats, branch_cards[(worker, index)], 'dominated')
+                min_turn_leaf_nodes = [leaf for position, leaf in enumerate(min_turn_leaf_nodes) if position not in dominated]
+
+            # Step fewer leaf nodes when we're close to the memory budget (see find_fastest_win)
+            step_limit = leaf_node_limit
+            if memory.is_near_budget():
+                step_limit = memory.get_step_limit(leaf_node_limit)
+
+            # Randomly prune down to the step limit, using the same random sequence as find_fastest_win
+            excess = len(min_turn_leaf_nodes) - step_limit
+            if excess > 0:
+                cards.get_game_random(state.randseed).shuffle(min_turn_leaf_nodes)
+                for worker, index in min_turn_leaf_nodes[step_limit:]:
+                    pruned[worker].append(index)
+                    if CARD_STATS:
+                        count_card_stat(search_card_stats, branch_cards[(worker, index)], 'pruned')
+                min_turn_leaf_nodes = min_turn_leaf_nodes[:step_limit]
+
+            # Step through all min_turn_leaf_nodes, keeping track of the order that they would be stepped in
+            steps = [[] for worker in workers]
+            for position, (worker, index) in enumerate(min_turn_leaf_nodes):
+                steps[worker].append((position, index))
+            compact = [memory.budget is not None] * search_workers
+            replies = ask_all('step', list(zip(pruned, steps, compact)))
+            found_positions = [found_position for found_position, worker_card_stats in replies]
+            for found_position, worker_card_stats in replies:
+                merge_card_stats(search_card_stats, worker_card_stats)
+            memory.add_released((sum([len(worker_pruned) for worker_pruned in pruned]) if RECYCLE_PRUNED_STATES else 0)
+                                + (len(min_turn_leaf_nodes) if memory.budget is not None else 0))
+
+            wins = [(position, worker) for worker, position in enumerate(found_positions) if position is not None]
+            if len(wins) > 0:
+                position, worker = min(wins)
+                workers[worker][1].send(('win', None))
+                win_state = workers[worker][1].recv()
+                break
+
+            action_count += 1
+    finally:
+        for process, conn in workers:
+            conn.send(('stop', None))
+            process.join()
+
+    return win_state, action_count, max_leaf_nodes
+
+USE_PARALLEL = True # True
+PARALLEL_SPARE_CORES = 2 # How many cores do we save for doing other things on the computer?
+SEARCH_WORKERS = 1 # When not running games in parallel, how many worker processes to split the search of a single (hard) game across
+DETERMINISTIC = False
+DELTA_EVALUATION = False # Play each step's +1 and -1 card variants on the same seeds as the baseline, starting from the baseline's shuffled library with the card put in or taken out (see cards.Player.with_card_changed). Makes the per-card deltas much less noisy.
+RECORD_WINNING_LOG_MESSAGES = False
+PROFILE_INTERVAL = float(os.environ['MONTECARLO_PROFILE_INTERVAL']) if 'MONTECARLO_PROFILE_INTERVAL' in os.environ else None # Seconds between stack samples of each game's search (see profiler.py), e.g. 0.005. None to turn off profiling. Each epoch step's samples are written to the log folder.
+cards.LOGGING_ENABLED = False
+
+fastest_recorded_win_turns = 4
+fastest_recorded_win = None
+profile_samples = {} # Stack samples from every game played since the last write_profile(), merged across the workers
+
+def play_game(player, prune_limit, search_workers = 1, memory_budget = None, max_turns = 10, profile_interval = None):
+    # Time each game on its own, so that the results store can record how long every game took
+    sampler = None
+    if profile_interval is not None:
+        import profiler
+        sampler = profiler.StackSampler(profile_interval)
+        sampler.start()
+    then = time.time()
+    try:
+        win_state, action_count, max_leaf_nodes = find_fastest_win(player, max_turns, prune_limit = prune_limit, search_workers = search_workers, memory_budget = memory_budget)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+    duration = time.time() - then
+    if sampler is None:
+        return win_state, action_count, max_leaf_nodes, duration, last_search_stats
+    # The samples travel back from the pool workers along with the rest of the search stats
+    return win_state, action_count, max_leaf_nodes, duration, dict(last_search_stats, profile_samples = sampler.samples)
+
+def play_games(players, max_turns = 10):
+    if USE_PARALLEL:
+        # h.t. https://www.machinelearningplus.com/python/parallel-processing-python/ for the multiprocessing code
+        # Worker processes don't necessarily share our module globals (they only do when they're forked), so hand every
+        #  worker the current settings to start from
+        pool = mp.Pool(mp.cpu_count()-PARALLEL_SPARE_CORES, initializer=apply_config, initargs=(get_config(),))
+        # Hand the games out one at a time. Some games take a hundred times longer than others, so handing them out in
+        #  chunks leaves most of the cores idle at the end, waiting on whichever worker got the chunk with the slow games.
+        game_results = pool.map(partial(play_game, prune_limit = PRUNE_LIMIT, memory_budget = MEMORY_BUDGET, max_turns = max_turns, profile_interval = PROFILE_INTERVAL), [player for player in players], chunksize = 1)
+        pool.close()
+    else:
+        # Worker processes in a pool can't start their own workers, so we only split up hard games when running serially.
+        #  (Only this process is profiled, not the search workers.)
+        game_results = [play_game(player, PRUNE_LIMIT, search_workers = SEARCH_WORKERS, memory_budget = MEMORY_BUDGET, max_turns = max_turns, profile_interval = PROFILE_INTERVAL) for player in players]
+    return game_results
+
+def test_decklist(decklist, num_trials, max_turns, seed_base = 0, variant_id = None, step = 0, baseline_decklist = None, change = None):
+    # Return the average winning turn number
+    variant_ids = None if variant_id is None else [variant_id]
+    return test_decklists([decklist], num_trials, max_turns, seed_base, variant_ids, step, baseline_decklist, [change])[0]
+
+def get_player(decklist, seed, baseline_decklist = None, change = None):
+    # change is None for the baseline itself, or (card name, +1 or -1) for a variant that's played against the baseline's games
+    if baseline_decklist is None or change is None:
+        return cards.Player(decklist, seed)
+    cardname, quant_change = change
+    return cards.Player(baseline_decklist, seed).with_card_changed(decklist, cardname, quant_change)
+
+# Test several decklists at once, scheduling all of their games across a single pool so that every core stays busy.
+#  Every decklist is played against the same seeds, so that their results are directly comparable.
+#  If variant ids are given, every game is also recorded in the results store under its decklist's variant id.
+def test_decklists(decklists, num_trials, max_turns, seed_base = 0, variant_ids = None, step = 0, baseline_decklist = None, changes = None):
+    global fastest_recorded_win_turns
+    global fastest_recorded_win
+    
+    durations = []
+    search_stats = {}
+
+    winning_log_messages = {}
+    then = time.time()
+    if PROFILE_INTERVAL is not None:
+        import profiler
+
+    # NOTE: Use a deterministic seed for testing performance improvements
+    #  Games that are played against a baseline's games have to use the same seeds as it did, so the caller picks those.
+    if not DETERMINISTIC and baseline_decklist is None:
+        seed_base = random.randint(0, 2**31-1)
+    if changes is None:
+        changes = [None] * len(decklists)
+    players = [get_player(decklist, seed_base + i, baseline_decklist, change) for decklist, change in zip(decklists, changes) for i in range(num_trials)]
+
+    game_results = play_games(players, max_turns)
+
+    avg_win_turns = []
+    for deck_index in range(len(decklists)):
+        total_turns = 0
+        card_stats = {}
+
+        for i in range(deck_index * num_trials, (deck_index + 1) * num_trials):
+            win_state, action_count, max_leaf_nodes, game_duration, game_search_stats = game_results[i]
+            for key, value in game_search_stats.items():
+                if key == 'peak_memory':
+                    search_stats[key] = max(search_stats.get(key, 0), value)
+                elif key == 'profile_samples':
+                    profiler.merge_samples(profile_samples, value)
+                elif key == 'card_stats':
+                    merge_card_stats(card_stats, value)
+                else:
+                    search_stats[key] = search_stats.get(key, 0) + value
+
+            won_turn = max_turns + 2
+
+            if win_state is not None:
+                won_turn = win_state.current_turn
+                #end_reason = win_state.log[-1].strip()
+
+                if won_turn < fastest_recorded_win_turns:
+                    filename = f'turn_{won_turn}_win.txt'
+                    with open(filename, 'w') as f:
+                        f.write(f'Won in {won_turn} turns')
+                        original_state = players[i]
+                        if USE_PARALLEL:
+                            original_state.start_turn()
+                        f.write(f' Original state: {original_state}\n')
+                        f.write('\n'.join(win_state.log))
+                        f.write(str(win_state))
+
+                if RECORD_WINNING_LOG_MESSAGES:
+                    for log_message in win_state.log:
+                        log_message = log_message.strip()
+                        if log_message not in winning_log_messages:
+                            winning_log_messages[log_message] = 0
+                        winning_log_messages[log_message] += 1
+            else:
+                #print (f'  Did not find win.  Max leaf nodes: {max_leaf_nodes}')
+                pass
+
+            total_turns += won_turn
+
+            if variant_ids is not None:
+                results_store.add_game(epoch_num, step, variant_ids[deck_index], seed_base + i - deck_index * num_trials, won_turn, win_state is not None, action_count, max_leaf_nodes, game_duration, game_search_stats.get('peak_memory', 0))
+
+            # TODO: Also save the total number of plays / alt-plays / activations that each card had
+
+            #if end_reason not in end_reasons:
+            #    end_reasons[end_reason] = 1
+            #else:
+            #    end_reasons[end_reason] += 1
+
+        if variant_ids is not None and len(card_stats) > 0:
+            results_store.add_card_stats(epoch_num, step, variant_ids[deck_index], card_stats)
+
+        avg_win_turn = total_turns / num_trials
+        print (f'  Average win turn: {avg_win_turn}')
+        avg_win_turns.append(avg_win_turn)
+
+    duration = time.time() - then
+    avg_duration = duration / len(players)
+
+    if len(decklists) == 1:
+        print (f'  Tested decklist in {duration} ({avg_duration} each)')
+    else:
+        print (f'  Tested {len(decklists)} decklists in {duration} ({avg_duration} each)')
+    print (f"  Search GC: {search_stats.get('gc_collections', 0)} collections, {search_stats.get('gc_pause', 0):.3f}s paused. Zones: {search_stats.get('zones_allocated', 0)} allocated, {search_stats.get('zones_reused', 0)} reused. Peak memory: {search_stats.get('peak_memory', 0) / 2**20:.1f}MB")
+
+    return avg_win_turns
+
+CALIBRATION_FILE = 'prune_calibration.json' # Calibration results, stored per deck family
+CALIBRATION_PRUNE_LIMITS = [100, 250, 500, 1000, 2000] # Candidate prune limits to try
+CALIBRATION_REFERENCE_LIMIT = 5000 # High-limit reference to compare against. Set to None for a completely unpruned search (can be VERY slow).
+CALIBRATION_TRIALS = 100 # How many games to play with each prune limit (and the reference)
+CALIBRATION_TOLERANCE = 0.02 # How far (in turns) the average win turn may shift from the reference before a limit is considered unsafe...
+CALIBRATION_STANDARD_ERRORS = 2.0 # ...plus this many standard errors of the shift, so that a limit isn't ruled out by the noise of a small calibration
+
+def run_calibration_games(decklist, num_trials, max_turns, prune_limit, seed_base):
+    # Every prune limit is run against the same seeds so that the games are directly comparable.
+    #  Returns (won turn, duration, max leaf nodes) for each game.
+    players = [cards.Player(decklist, seed_base + i) for i in range(num_trials)]
+    if prune_limit is None:
+        prune_limit = cards.MAXINT
+
+    if USE_PARALLEL:
+        pool = mp.Pool(mp.cpu_count()-PARALLEL_SPARE_CORES, initializer=apply_config, initargs=(get_config(),))
+        game_results = pool.map(partial(play_game, prune_limit = prune_limit, memory_budget = MEMORY_BUDGET, max_turns = max_turns), players)
+        pool.close()
+    else:
+        game_results = [play_game(player, prune_limit, memory_budget = MEMORY_BUDGET, max_turns = max_turns) for player in players]
+
+    results = []
+    for win_state, action_count, max_leaf_nodes, duration, search_stats in game_results:
+        won_turn = max_turns + 2
+        if win_state is not None:
+            won_turn = win_state.current_turn
+        results.append((won_turn, duration, max_leaf_nodes))
+    return results
+
+def load_calibrations():
+    if not os.path.exists(CALIBRATION_FILE):
+        return {}
+    with open(CALIBRATION_FILE, 'r') as f:
+        return json.load(f)
+
+def save_calibration(family, calibration):
+    calibrations = load_calibrations()
+    calibrations[family] = calibration
+    with open(CALIBRATION_FILE, 'w') as f:
+        json.dump(calibrations, f, indent=2)
+
+def get_calibrated_prune_limit(family, default = PRUNE_LIMIT):
+    # Return the cheapest prune limit that was calibrated as safe for this deck family, or the default if it was never calibrated.
+    calibration = load_calibrations().get(family)
+    if calibration is None:
+        return default
+    return calibration['recommended_prune_limit']
+
+def calibrate_prune_limit(decklist, family, num_trials = CALIBRATION_TRIALS, max_turns = 10, prune_limits = None, reference_limit = CALIBRATION_REFERENCE_LIMIT, tolerance = CALIBRATION_TOLERANCE, seed_base = 0):
+    if prune_limits is None:
+        prune_limits = CALIBRATION_PRUNE_LIMITS
+
+    print(f'Calibrating prune limit for {family} with {num_trials} games per limit')
+
+    reference_results = run_calibration_games(decklist, num_trials, max_turns, reference_limit, seed_base)
+    reference_turns = [result[0] for result in reference_results]
+    reference_avg_win_turn = sum(reference_turns) / num_trials
+    reference_avg_duration = sum([result[1] for result in reference_results]) / num_trials
+    print(f' Reference (prune limit {reference_limit}): average win turn {reference_avg_win_turn:.3f}, {reference_avg_duration:.4f}s per game')
+
+    results = {}
+    recommended_prune_limit = None
+    for prune_limit in sorted(prune_limits):
+        limit_results = run_calibration_games(decklist, num_trials, max_turns, prune_limit, seed_base)
+        turns = [result[0] for result in limit_results]
+        avg_win_turn = sum(turns) / num_trials
+        avg_duration = sum([result[1] for result in limit_results]) / num_trials
+        # Average shift tells us how biased the limit is, while the per-game difference tells us how noisy it is.
+        shift = avg_win_turn - reference_avg_win_turn
+        differences = [turn - reference_turn for turn, reference_turn in zip(turns, reference_turns)]
+        mean_abs_diff = sum([abs(difference) for difference in differences]) / num_trials
+        games_changed = sum([1 for difference in differences if difference != 0])
+        # Both runs play the same seeds, so the standard error of the shift comes from the per-game differences
+        standard_error = 0.0
+        if num_trials > 1:
+            standard_error = (sum([(difference - shift) ** 2 for difference in differences]) / (num_trials - 1) / num_trials) ** 0.5
+
+        results[str(prune_limit)] = {
+            'avg_win_turn': avg_win_turn,
+            'shift': shift,
+            'standard_error': standard_error,
+            'mean_abs_diff': mean_abs_diff,
+            'games_changed': games_changed,
+            'avg_duration': avg_duration,
+            'max_leaf_nodes': max([result[2] for result in limit_results]),
+        }
+        print(f'  Prune limit {prune_limit}: average win turn {avg_win_turn:.3f} (shift: {shift:+.3f} +/- {standard_error:.3f}, {games_changed} games changed), {avg_duration:.4f}s per game')
+
+        if recommended_prune_limit is None and abs(shift) <= tolerance + CALIBRATION_STANDARD_ERRORS * standard_error:
+            recommended_prune_limit = prune_limit
+
+    # If none of the candidates were close enough, then fall back to the reference.
+    if recommended_prune_limit is None:
+        recommended_prune_limit = reference_limit if reference_limit is not None else cards.MAXINT
+
+    print(f' Recommended prune limit for {family}: {recommended_prune_limit}')
+
+    save_calibration(family, {
+        'decklist': decklist,
+        'num_trials': num_trials,
+        'max_turns': max_turns,
+        'seed_base': seed_base,
+        'tolerance': tolerance,
+        'standard_errors': CALIBRATION_STANDARD_ERRORS,
+        'reference_limit': reference_limit,
+        'reference_avg_win_turn': reference_avg_win_turn,
+        'reference_avg_duration': reference_avg_duration,
+        'results': results,
+        'recommended_prune_limit': recommended_prune_limit,
+        'calibrated_at': datetime.datetime.now().isoformat(),
+    })
+
+    return recommended_prune_limit
+
+def update_plots(baseline_wins, running_wins_61_avgs, running_wins_59_avgs, running_best_win, running_delta, filename = None):
+    # Only import matplotlib if we're actually plotting, so that headless runs don't need it
+    import matplotlib
+    if filename is not None:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    # Create a plot of each decklist's average winning turn number
+    plt.figure(figsize=(20,10))
+    plt.plot(baseline_wins, label='Baseline')
+    plt.plot(running_wins_61_avgs, label='61 card decklist')
+    plt.plot(running_wins_59_avgs, label='59 card decklist')
+    plt.plot(running_best_win, label='Best win')
+    plt.plot(running_delta, label='Delta')
+    plt.legend()
+    if filename is None:
+        plt.show()
+    else:
+        # Headless runs save the plot next to the logs instead
+        plt.savefig(filename)
+        plt.close()
+
+USE_SURROGATE = False # Use a surrogate model of deck quality (see surrogate.py) to decide which variants are worth simulating in run_epoch
+SURROGATE_SIMULATE_COUNT = 8 # How many additions (and how many removals) to simulate per epoch once the surrogate is trained
+PLOT_FILE = None # If set, save a plot of each epoch's progress to this file in the log folder
+
+epoch_num = 0
+log_folder = ''
+results_store = None
+
+def get_results_store():
+    # Every game is recorded in a results store in the log folder (which also creates the log folder)
+    global results_store
+    if results_store is None or results_store.results_filename != os.path.join(log_folder, results.RESULTS_FILENAME):
+        if results_store is not None:
+            results_store.flush()
+        results_store = results.ResultsStore(log_folder)
+    return results_store
+
+def log_to_file(log_filename, log_message):
+    # The log folder is created along with the results store at the start of each epoch
+    with open(log_folder + log_filename, 'a') as f:
+        f.write(log_message)
+
+def write_profile(profile_filename):
+    # Write out the stack samples of the games played since the last call (if profiling is on), and start collecting afresh
+    if PROFILE_INTERVAL is None or len(profile_samples) == 0:
+        return
+    import profiler
+    profiler.write_collapsed(log_folder + profile_filename, profile_samples)
+    print(f' Profile ({sum(profile_samples.values())} samples) written to {log_folder + profile_filename}. Most time spent in:')
+    for function, fraction in profiler.get_top_functions(profile_samples, 5):
+        print(f'  {fraction:6.1%} {function}')
+    profile_samples.clear()
+
+def run_epoch(deckrange, num_trials, max_turns, step_size):
+    global epoch_num
+    cardnames = [card['name'] for card in deckrange]
+    deck_baseline, decks_61, cards_61, decks_59, cards_59 = get_deck_variants(deckrange)
+
+    # Once the surrogate has seen enough results, only simulate the variants that it thinks are worth it
+    deck_surrogate = None
+    if USE_SURROGATE:
+        import surrogate
+        deck_surrogate = surrogate.get_surrogate(cardnames)
+        if deck_surrogate.num_samples >= surrogate.SURROGATE_MIN_SAMPLES:
+            decks_61, cards_61 = surrogate.select_promising_variants(deck_surrogate, deckrange, decks_61, cards_61, 1, SURROGATE_SIMULATE_COUNT)
+            decks_59, cards_59 = surrogate.select_promising_variants(deck_surrogate, deckrange, decks_59, cards_59, -1, SURROGATE_SIMULATE_COUNT)
+            print(f' Surrogate picked additions to simulate: {cards_61}')
+            print(f' Surrogate picked removals to simulate: {cards_59}')
+
+    baseline_wins = []
+    epoch_num += 1
+    overall_tsv_filename = f'progress.tsv'
+    tsv_filename = f'epoch_{epoch_num}.tsv'
+    decklist_filename = f'epoch_{epoch_num}_decklist.txt'
+    
+    print (f'Running epoch {epoch_num} with {num_trials} trials and {max_turns} max turns.')
+    simulations_per_step = (len(decks_61) + len(decks_59)) * step_size
+    print (f' Total number of simulated games in this epoch: {num_trials * simulations_per_step}')
+
+    # Every game is recorded in the results store under its variant, and the averages below are derived from it
+    store = get_results_store()
+    baseline_id = store.add_variant(epoch_num, 'baseline', deck_baseline)
+    ids_61 = [store.add_variant(epoch_num, f'+{cards_61[i]}', decks_61[i]) for i in range(len(decks_61))]
+    ids_59 = [store.add_variant(epoch_num, f'-{cards_59[i]}', decks_59[i]) for i in range(len(decks_59))]
+    log_to_file(decklist_filename, f'Epoch {epoch_num} baseline decklist\n{deck_baseline}')
+    print(f' Baseline decklist:\n{deck_baseline}')
+    print(f' Number of 61-card decks: {len(decks_61)}')
+    print(f' Number of 59-card decks: {len(decks_59)}')
+
+    running_baseline_wins = []
+    running_wins_61_avgs = []
+    running_wins_59_avgs = []
+    running_best_win = []
+    running_delta = []
+    running_durations = []
+
+    for i in range(num_trials):
+        print(f'Step {i+1}/{num_trials}:')
+
+        print(f' Current Decklist:')
+        print(deck_baseline)
+
+        then = time.time()
+        # With delta evaluation, every variant plays the same games as the baseline (but for its one changed card)
+        seed_base = i * step_size
+        baseline_decklist = None
+        if DELTA_EVALUATION:
+            if not DETERMINISTIC:
+                seed_base = random.randint(0, 2**31-1)
+            baseline_decklist = deck_baseline
+
+        print(f'Testing baseline')
+        baseline_wins.append(test_decklist(deck_baseline, step_size, max_turns, seed_base = seed_base, variant_id = baseline_id, step = i, baseline_decklist = baseline_decklist))
+
+        for deck_61_index, deck_61 in enumerate(decks_61):
+            print(f' Testing addition of {cards_61[deck_61_index]} ({deck_61_index+1} / {len(decks_61)})')
+            test_decklist(deck_61, step_size, max_turns, seed_base = seed_base, variant_id = ids_61[deck_61_index], step = i, baseline_decklist = baseline_decklist, change = (cards_61[deck_61_index], 1))
+        for deck_59_index, deck_59 in enumerate(decks_59):
+            print(f' Testing removal of {cards_59[deck_59_index]} ({deck_59_index+1} / {len(decks_59)})')
+            test_decklist(deck_59, step_size, max_turns, seed_base = seed_base, variant_id = ids_59[deck_59_index], step = i, baseline_decklist = baseline_decklist, change = (cards_59[deck_59_index], -1))
+
+        duration = time.time() - then
+        write_profile(f'profile_epoch{epoch_num}_step{i+1}.collapsed')
+        avg_duration = duration / simulations_per_step
+
+        wins_61_avgs = {}
+        wins_59_avgs = {}
+        for deck_61_index, deck_61 in enumerate(decks_61):
+            wins_61_avgs[cards_61[deck_61_index]] = store.average_win_turn(ids_61[deck_61_index])
+        for deck_59_index, deck_59 in enumerate(decks_59):
+            wins_59_avgs[cards_59[deck_59_index]] = store.average_win_turn(ids_59[deck_59_index])
+
+        # Sort the wins_61_avgs and wins_59_avgs by average winning turn
+        wins_61_avgs = {k: v for k, v in sorted(wins_61_avgs.items(), key=lambda item: item[1])}
+        wins_59_avgs = {k: v for k, v in sorted(wins_59_avgs.items(), key=lambda item: item[1])}
+
+        baseline_wins_avg = store.average_win_turn(baseline_id)
+
+        running_wins_61_avgs.append(wins_61_avgs)
+        running_wins_59_avgs.append(wins_59_avgs)
+        running_baseline_wins.append(baseline_wins_avg)
+        running_durations.append(avg_duration)
+
+        # Print out the sorted list of cards and their average winning turn
+        print(f' Baseline wins: {baseline_wins_avg}')
+        print(f' Average duration: {avg_duration}')
+        print(f'  Best cards to add:')
+        for card, avg_win in wins_61_avgs.items():
+            delta = avg_win - baseline_wins_avg
+            if delta > 0:
+                print(f'   {card}: +{delta}')
+            else:
+                print(f'   {card}: {delta}')
+        print(f'  Best cards to remove:')
+        for card, avg_win in wins_59_avgs.items():
+            delta = avg_win - baseline_wins_avg
+            if delta > 0:
+                print(f'   {card}: +{delta}')
+            else:
+                print(f'   {card}: {delta}')
+
+        # Get the best card to add and the best card to remove
+        best_card_to_add = list(wins_61_avgs.keys())[0]
+        best_card_to_remove = list(wins_59_avgs.keys())[0]
+
+        # Average the win rate of the best 61-card deck and the best 59-card deck
+        best_61_win = wins_61_avgs[best_card_to_add]
+        best_59_win = wins_59_avgs[best_card_to_remove]
+        best_win = (best_61_win + best_59_win) / 2
+
+        print (f' Best card to add: {best_card_to_add} ({best_61_win - best_win})')
+        print (f' Best card to remove: {best_card_to_remove} ({best_59_win - best_win})')
+        delta = best_win - baseline_wins_avg
+        print (f' Best win: {best_win} vs. prev {baseline_wins_avg} (change: {delta})')
+
+        running_best_win.append(best_win)
+        running_delta.append(delta)
+
+        # Output to TSV
+        # First check to see if we need to write headers
+        if not os.path.exists(log_folder+tsv_filename):
+            headers = 'Trials\tAvg. Time Per Test\tBaseline\tBest Win\tDelta\tBest Card to Add\tBest Card to Remove\t'
+            for cardname in cardnames:
+                headers += f"'#{cardname}\t'+{cardname}\t'-{cardname}\t"
+            headers += '\n'
+            log_to_file(tsv_filename, headers)
+            if not os.path.exists(log_folder+overall_tsv_filename):
+                log_to_file(overall_tsv_filename, f'Epoch\t{headers}')
+
+        log_line = f'{(i+1)*step_size}\t{avg_duration:.4f}\t{baseline_wins_avg:.3f}\t{best_win:.3f}\t{delta:.3f}\t{best_card_to_add}\t{best_card_to_remove}\t'
+        for cardname in cardnames:
+            # Output the number of cards in the current decklist
+            card_quant = 0
+            for card in deckrange:
+                if card['name'] == cardname:
+                    card_quant = card['quant']
+            
+            log_line += f'{card_quant}\t'
+
+            # Output the delta for adding this card
+            if cardname in wins_61_avgs:
+                log_line += f'{wins_61_avgs[cardname]:.3f}\t'
+            else:
+                log_line += f'\t'
+
+            # Output the delta for removing this card
+            if cardname in wins_59_avgs:
+                log_line += f'{wins_59_avgs[cardname]:.3f}\t'
+            else:
+                log_line += f'\t'
+
+        log_line += '\n'
+        log_to_file(tsv_filename, log_line)
+
+        # If we're on the last iteration, output this log of data to TSV also
+        if (i == num_trials-1):
+            log_to_file(overall_tsv_filename, f'{epoch_num}\t{log_line}')
+
+        if PLOT_FILE is not None:
+            update_plots(baseline_wins, running_wins_61_avgs, running_wins_59_avgs, running_best_win, running_delta, log_folder + PLOT_FILE)
+
+    store.flush()
+
+    # Teach the surrogate about everything that we simulated this epoch
+    if deck_surrogate is not None:
+        baseline_quants = {card['name']: card['quant'] for card in deckrange}
+        surrogate.add_epoch_results_to_surrogate(deck_surrogate, baseline_quants, baseline_wins_avg, wins_61_avgs, wins_59_avgs, num_trials * step_size)
+        deck_surrogate.save(surrogate.SURROGATE_FILE)
+
+    return baseline_wins, best_win, best_card_to_add, best_card_to_remove
+
+OPTIMIZER_MODE = 'single_swap' # 'single_swap' adds one card and removes one card per epoch (run_epoch). 'multi_swap' runs a local search over whole 60-card decks with several swaps at a time (run_multi_swap_epoch).
+POPULATION_SIZE = 12 # How many candidate decks to test in each multi-swap epoch
+MAX_SWAPS = 3 # Max number of cards that are swapped out of the baseline in each candidate deck
+
+# The optimizer keeps its own random number generator, so that its choices don't depend on anything else that uses the random module.
+optimizer_random = random.Random()
+
+def get_multi_swap_variants(deckrange, population_size, max_swaps):
+    """Get random 60-card variants of the baseline deck, each with between 1 and max_swaps cards swapped"""
+    baseline_quants = {card['name']: card['quant'] for card in deckrange}
+    max_quants = {card['name']: cards.get_card_by_name(card['name']).deck_max_quant for card in deckrange}
+
+    deck_baseline = ""
+    for card in deckrange:
+        deck_baseline += str(card['quant']) + " " + card['name'] + "\n"
+
+    decks = []
+    deck_quants = []
+    deck_swaps = []
+    attempts = 0
+    while len(decks) < population_size and attempts < population_size * 10:
+        attempts += 1
+        quants = dict(baseline_quants)
+        for swap in range(optimizer_random.randint(1, max_swaps)):
+            cards_to_remove = [name for name, quant in quants.items() if quant > 0]
+            card_to_remove = optimizer_random.choice(cards_to_remove)
+            # Respect the max quantity of each card
+            cards_to_add = [name for name, quant in quants.items() if quant < max_quants[name] and name != card_to_remove]
+            if len(cards_to_add) == 0:
+                continue
+            card_to_add = optimizer_random.choice(cards_to_add)
+            quants[card_to_remove] -= 1
+            quants[card_to_add] += 1
+
+        deck = ""
+        for card in deckrange:
+            deck += str(quants[card['name']]) + " " + card['name'] + "\n"
+
+        # Swaps can cancel each other out, so skip anything that we've already got
+        if deck == deck_baseline or deck in decks:
+            continue
+
+        # Describe the net change from the baseline
+        swaps = []
+        for card in deckrange:
+            change = quants[card['name']] - baseline_quants[card['name']]
+            if change > 0:
+                swaps.append(f"+{change} {card['name']}")
+        for card in deckrange:
+            change = quants[card['name']] - baseline_quants[card['name']]
+            if change < 0:
+                swaps.append(f"{change} {card['name']}")
+
+        decks.append(deck)
+        deck_quants.append(quants)
+        deck_swaps.append(', '.join(swaps))
+
+    return deck_baseline, decks, deck_quants, deck_swaps
+
+def run_multi_swap_epoch(deckrange, num_trials, max_turns, step_size):
+    global epoch_num
+    cardnames = [card['name'] for card in deckrange]
+    deck_baseline, decks, deck_quants, deck_swaps = get_multi_swap_variants(deckrange, POPULATION_SIZE, MAX_SWAPS)
+    epoch_num += 1
+    overall_tsv_filename = f'progress.tsv'
+    tsv_filename = f'epoch_{epoch_num}.tsv'
+    decklist_filename = f'epoch_{epoch_num}_decklist.txt'
+
+    print (f'Running multi-swap epoch {epoch_num} with {num_trials} trials and {max_turns} max turns.')
+    simulations_per_step = (len(decks) + 1) * step_size
+    print (f' Total number of simulated games in this epoch: {num_trials * simulations_per_step}')
+
+    # Every game is recorded in the results store under its variant, and the averages below are derived from it
+    store = get_results_store()
+    variant_ids = [store.add_variant(epoch_num, 'baseline', deck_baseline)]
+    variant_ids += [store.add_variant(epoch_num, deck_swaps[i], decks[i]) for i in range(len(decks))]
+    log_to_file(decklist_filename, f'Epoch {epoch_num} baseline decklist\n{deck_baseline}')
+    print(f' Baseline decklist:\n{deck_baseline}')
+    print(f' Number of candidate decks: {len(decks)}')
+
+    baseline_wins = []
+
+    for i in range(num_trials):
+        print(f'Step {i+1}/{num_trials}:')
+
+        then = time.time()
+        # Test the baseline and the whole population on the same seeds, all at once.
+        avg_win_turns = test_decklists([deck_baseline] + decks, step_size, max_turns, seed_base = i * step_size, variant_ids = variant_ids, step = i)
+        baseline_wins.append(avg_win_turns[0])
+
+        duration = time.time() - then
+        write_profile(f'profile_epoch{epoch_num}_step{i+1}.collapsed')
+        avg_duration = duration / simulations_per_step
+
+        baseline_wins_avg = store.average_win_turn(variant_ids[0])
+        deck_wins_avgs = [store.average_win_turn(variant_id) for variant_id in variant_ids[1:]]
+
+        print(f' Baseline wins: {baseline_wins_avg}')
+        print(f' Average duration: {avg_duration}')
+        print(f'  Candidate decks:')
+        for deck_index in sorted(range(len(decks)), key=lambda deck_index: deck_wins_avgs[deck_index]):
+            delta = deck_wins_avgs[deck_index] - baseline_wins_avg
+            print(f'   {deck_swaps[deck_index]}: {delta:+}')
+
+        # Only move to the best candidate if it actually beats the baseline
+        best_quants = {card['name']: card['quant'] for card in deckrange}
+        best_swaps = ''
+        best_win = baseline_wins_avg
+        if len(decks) > 0:
+            best_index = min(range(len(decks)), key=lambda deck_index: deck_wins_avgs[deck_index])
+            if deck_wins_avgs[best_index] < baseline_wins_avg:
+                best_quants = deck_quants[best_index]
+                best_swaps = deck_swaps[best_index]
+                best_win = deck_wins_avgs[best_index]
+        delta = best_win - baseline_wins_avg
+
+        print (f' Best swaps: {best_swaps}')
+        print (f' Best win: {best_win} vs. prev {baseline_wins_avg} (change: {delta})')
+
+        # Output to TSV
+        if not os.path.exists(log_folder+tsv_filename):
+            headers = 'Trials\tAvg. Time Per Test\tBaseline\tBest Win\tDelta\tBest Swaps\t'
+            for cardname in cardnames:
+                headers += f"'#{cardname}\t"
+            headers += '\n'
+            log_to_file(tsv_filename, headers)
+            if not os.path.exists(log_folder+overall_tsv_filename):
+                log_to_file(overall_tsv_filename, f'Epoch\t{headers}')
+
+        log_line = f'{(i+1)*step_size}\t{avg_duration:.4f}\t{baseline_wins_avg:.3f}\t{best_win:.3f}\t{delta:.3f}\t{best_swaps}\t'
+        for cardname in cardnames:
+            log_line += f'{best_quants.get(cardname, 0)}\t'
+        log_line += '\n'
+        log_to_file(tsv_filename, log_line)
+
+        # If we're on the last iteration, output this log of data to TSV also
+        if (i == num_trials-1):
+            log_to_file(overall_tsv_filename, f'{epoch_num}\t{log_line}')
+
+    store.flush()
+
+    return baseline_wins, best_win, best_quants
+
+def run_training(deckrange, num_epochs = 100, num_trials = 1, max_turns = 10, step_size = 1000, deck_family = None, calibrate = False, use_calibrated_prune_limit = True):
+    global PRUNE_LIMIT
+    global log_folder
+
+    if calibrate:
+        # Pass the settings along explicitly, since --config and the command line can change them after the defaults were bound
+        calibrate_prune_limit(get_deck_variants(deckrange)[0], deck_family, CALIBRATION_TRIALS, max_turns, CALIBRATION_PRUNE_LIMITS, CALIBRATION_REFERENCE_LIMIT, CALIBRATION_TOLERANCE)
+
+    # Use the cheapest prune limit that was calibrated as safe for this deck family (if any)
+    if deck_family is not None and use_calibrated_prune_limit:
+        PRUNE_LIMIT = get_calibrated_prune_limit(deck_family, PRUNE_LIMIT)
+
+    # Log folder is named with the year, month, day, hour, minute, and second
+    log_folder = f'logs/output_prune{PRUNE_LIMIT}_turns{max_turns}_{datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")}/'
+
+    for i in range(num_epochs):
+        print(f'Epoch {i+1} of {num_epochs}')
+        if OPTIMIZER_MODE == 'multi_swap':
+            baseline_wins, best_win, best_quants = run_multi_swap_epoch(deckrange, num_trials, max_turns, step_size)
+
+            # Move to the best candidate deck
+            for card in deckrange:
+                card['quant'] = best_quants[card['name']]
+        else:
+            baseline_wins, best_win, best_card_to_add, best_card_to_remove = run_epoch(deckrange, num_trials, max_turns, step_size)
+
+            # Find the card in deckrange that has this name and increase its quant
+            for card in deckrange:
+                if card['name'] == best_card_to_add:
+                    card['quant'] += 1
+                if card['name'] == best_card_to_remove:
+                    card['quant'] -= 1
+
+    # Print the final decklist
+    print('Final decklist:')
+    final_decklist = ""
+    for card in deckrange:
+        final_decklist += str(card['quant']) + " " + card['name'] + "\n"
+
+    print(final_decklist)
+    return final_decklist
+
+# Settings that can be given in a --config JSON file, mapped to the module setting that they override
+CONFIG_SETTINGS = {
+    'prune_limit': 'PRUNE_LIMIT',
+    'parallel_search_threshold': 'PARALLEL_SEARCH_THRESHOLD',
+    'search_gc_mode': 'SEARCH_GC_MODE',
+    'search_gc_thresholds': 'SEARCH_GC_THRESHOLDS',
+    'recycle_pruned_states': 'RECYCLE_PRUNED_STATES',
+    'dominance_pruning': 'DOMINANCE_PRUNING',
+    'card_stats': 'CARD_STATS',
+    'card_timing': 'CARD_TIMING',
+    'memory_budget': 'MEMORY_BUDGET',
+    'state_memory_factor': 'STATE_MEMORY_FACTOR',
+    'memory_compact_fraction': 'MEMORY_COMPACT_FRACTION',
+    'use_parallel': 'USE_PARALLEL',
+    'parallel_spare_cores': 'PARALLEL_SPARE_CORES',
+    'search_workers': 'SEARCH_WORKERS',
+    'deterministic': 'DETERMINISTIC',
+    'delta_evaluation': 'DELTA_EVALUATION',
+    'record_winning_log_messages': 'RECORD_WINNING_LOG_MESSAGES',
+    'optimizer_mode': 'OPTIMIZER_MODE',
+    'population_size': 'POPULATION_SIZE',
+    'max_swaps': 'MAX_SWAPS',
+    'use_surrogate': 'USE_SURROGATE',
+    'surrogate_simulate_count': 'SURROGATE_SIMULATE_COUNT',
+    'calibration_file': 'CALIBRATION_FILE',
+    'calibration_prune_limits': 'CALIBRATION_PRUNE_LIMITS',
+    'calibration_reference_limit': 'CALIBRATION_REFERENCE_LIMIT',
+    'calibration_trials': 'CALIBRATION_TRIALS',
+    'calibration_tolerance': 'CALIBRATION_TOLERANCE',
+    'calibration_standard_errors': 'CALIBRATION_STANDARD_ERRORS',
+    'plot_file': 'PLOT_FILE',
+    'profile_interval': 'PROFILE_INTERVAL',
+}
+
+# Run settings (rather than module settings) that can also be given in a --config JSON file
+CONFIG_RUN_SETTINGS = ['epochs', 'trials', 'max_turns', 'step_size', 'deck_family', 'calibrate']
+
+def apply_config(config):
+    for key, value in config.items():
+        if key in CONFIG_SETTINGS:
+            globals()[CONFIG_SETTINGS[key]] = value
+        elif key not in CONFIG_RUN_SETTINGS:
+            raise Exception(f'Unknown config setting: {key}')
+
+def get_config():
+    # The current value of every setting, in the form that apply_config() takes, to hand to worker processes
+    return {key: globals()[name] for key, name in CONFIG_SETTINGS.items()}
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Monte-Carlo optimizer for Belcher decklists.')
+    parser.add_argument('decklist', help='Decklist file to start from (one "<quantity> <card name>" per line, # for comments)')
+    parser.add_argument('--config', help='JSON file of settings (e.g. {"prune_limit": 500, "use_parallel": false})')
+    parser.add_argument('--epochs', type=int, help='Number of epochs to train for (default: 100)')
+    parser.add_argument('--trials', type=int, help='Number of steps of simulations within each epoch (default: 1)')
+    parser.add_argument('--step-size', type=int, help='Number of games to run for each deck in each step (default: 1000)')
+    parser.add_argument('--max-turns', type=int, help='Max number of turns to search for a win (default: 10)')
+    parser.add_argument('--prune-limit', type=int, help='Max number of leaf nodes to search through')
+    parser.add_argument('--memory-budget', type=int, help='Approximate number of bytes that the search of each game may hold')
+    parser.add_argument('--serial', action='store_true', help='Play games in this process instead of in a pool of workers')
+    parser.add_argument('--optimizer', choices=['single_swap', 'multi_swap'], help='Which optimizer to train with')
+    parser.add_argument('--deck-family', help='Deck family to look up (or store) the calibrated prune limit under')
+    parser.add_argument('--calibrate', action='store_true', help='(Re-)calibrate the prune limit for the deck family before training')
+    parser.add_argument('--calibration-trials', type=int, help=f'Number of games to play with each prune limit when calibrating (default: {CALIBRATION_TRIALS})')
+    parser.add_argument('--calibration-limits', type=int, nargs='+', help=f'Candidate prune limits to calibrate (default: {" ".join([str(limit) for limit in CALIBRATION_PRUNE_LIMITS])})')
+    parser.add_argument('--calibration-reference-limit', type=int, help=f'Prune limit to calibrate against (default: {CALIBRATION_REFERENCE_LIMIT})')
+    parser.add_argument('--plot', action='store_true', help='Save a plot of each epoch\'s progress to the log folder')
+    parser.add_argument('--profile', type=float, metavar='INTERVAL', help='Sample the search\'s call stacks every INTERVAL seconds (e.g. 0.005), and write collapsed stacks for each epoch step to the log folder (can also be set with the MONTECARLO_PROFILE_INTERVAL environment variable)')
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.config:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+    apply_config(config)
+
+    # Command-line flags take precedence over the config file
+    if args.prune_limit is not None:
+        globals()['PRUNE_LIMIT'] = args.prune_limit
+    if args.memory_budget is not None:
+        globals()['MEMORY_BUDGET'] = args.memory_budget
+    if args.serial:
+        globals()['USE_PARALLEL'] = False
+    if args.optimizer is not None:
+        globals()['OPTIMIZER_MODE'] = args.optimizer
+    if args.plot:
+        globals()['PLOT_FILE'] = 'progress.png'
+    if args.profile is not None:
+        globals()['PROFILE_INTERVAL'] = args.profile
+    if args.calibration_trials is not None:
+        globals()['CALIBRATION_TRIALS'] = args.calibration_trials
+    if args.calibration_limits is not None:
+        globals()['CALIBRATION_PRUNE_LIMITS'] = args.calibration_limits
+    if args.calibration_reference_limit is not None:
+        globals()['CALIBRATION_REFERENCE_LIMIT'] = args.calibration_reference_limit
+
+    def run_setting(name, default):
+        value = getattr(args, name)
+        if value is None or value is False:
+            value = config.get(name, default)
+        return value
+
+    with open(args.decklist, 'r') as f:
+        deckrange = parse_decklist(f.read())
+
+    calibrate = run_setting('calibrate', False)
+    deck_family = run_setting('deck_family', None)
+    if calibrate and deck_family is None:
+        raise Exception('A deck family (--deck-family) is needed to store the calibrated prune limit under.')
+
+    run_training(deckrange,
+                 num_epochs = run_setting('epochs', 100),
+                 num_trials = run_setting('trials', 1),
+                 max_turns = run_setting('max_turns', 10),
+                 step_size = run_setting('step_size', 1000),
+                 deck_family = deck_family,
+                 calibrate = calibrate,
+                 # An explicitly given prune limit wins over the calibrated one
+                 use_calibrated_prune_limit = args.prune_limit is None and 'prune_limit' not in config)
+
+if __name__ == '__main__':
+    main()
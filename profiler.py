@@ -0,0 +1,66 @@
+# Sampling profiler for the search.
+#  While a game is being searched, a background thread looks at what the game's thread is doing every so often, and counts
+#  how many times it found each call stack. Sampling keeps the overhead low enough to profile real runs (inside the pool
+#  workers too), unlike cProfile, which slows down every function call.
+#  Samples are stored as collapsed stacks ("outer;inner;innermost count" per line), which can be turned into a flamegraph
+#  with flamegraph.pl, or opened directly in https://www.speedscope.app.
+import os
+import sys
+import threading
+
+# StackSampler samples the thread that created it, from when start() is called until stop() is called.
+class StackSampler:
+    def __init__(self, interval, root_function = 'find_fastest_win'):
+        self.interval = interval
+        # Stacks are cut off above this function, so that they look the same whether a game ran in a pool worker or not
+        self.root_function = root_function
+        self.thread_id = threading.get_ident()
+        self.samples = {}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        return self.samples
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            found_root = False
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)})')
+                if code.co_name == self.root_function:
+                    found_root = True
+                    break
+                frame = frame.f_back
+            # Skip samples from outside the search (like setting up the game)
+            if found_root:
+                stack = ';'.join(reversed(names))
+                self.samples[stack] = self.samples.get(stack, 0) + 1
+
+def merge_samples(total, samples):
+    for stack, count in samples.items():
+        total[stack] = total.get(stack, 0) + count
+
+def write_collapsed(filename, samples):
+    with open(filename, 'w') as f:
+        for stack, count in sorted(samples.items(), key=lambda item: -item[1]):
+            f.write(f'{stack} {count}\n')
+
+def get_top_functions(samples, count = 10):
+    # The functions that were running (rather than just waiting on something they called) in the most samples, as
+    #  (function, fraction of samples) pairs
+    total = sum(samples.values())
+    self_counts = {}
+    for stack, stack_count in samples.items():
+        function = stack.rsplit(';', 1)[-1]
+        self_counts[function] = self_counts.get(function, 0) + stack_count
+    top = sorted(self_counts.items(), key=lambda item: -item[1])[:count]
+    return [(function, function_count / total) for function, function_count in top]
@@ -0,0 +1,163 @@
+# Per-game results store.
+#  Every game that gets played is stored as a fixed-size binary record, so that the whole distribution of results (and
+#  not just the per-step averages in the TSV logs) can be analyzed later without re-running any simulations.
+#  The records are packed without any padding, so the file can be memory-mapped directly with numpy:
+#   np.memmap('games_v2.bin', dtype=results.result_dtype(), mode='r')
+#  The version in the file name changes whenever the record layout does, so that files with the old layout are never read
+#  back with the new one.
+#
+# Usage: python results.py logs/output_.../   (prints a summary of every variant that was played)
+import json
+import os
+import struct
+import sys
+
+RESULTS_VERSION = 2 # Version 2 added peak_memory
+RESULTS_FILENAME = f'games_v{RESULTS_VERSION}.bin'
+OLD_RESULTS_FILENAMES = ['games.bin'] # Version 1 didn't have a version in its name
+VARIANTS_FILENAME = 'variants.jsonl'
+CARD_STATS_FILENAME = 'card_stats.jsonl' # Per-card search stats (see montecarlo.CARD_STAT_KEYS) of each variant, for each step
+RESULTS_BUFFER_SIZE = 4096 # How many records to hold in memory before appending them to the file
+CARD_STATS_SUMMARY_COUNT = 3 # How many cards to list the stats of under each variant in the summary (the ones with the most children)
+
+# (field name, struct format, numpy type) for each field of a record
+RESULT_FIELDS = [
+    ('epoch', 'I', '<u4'),
+    ('step', 'I', '<u4'),
+    ('variant_id', 'I', '<u4'),
+    ('seed', 'q', '<i8'),
+    ('win_turn', 'i', '<i4'), # Games that weren't won are recorded as max_turns + 2, same as in the averages
+    ('won', 'B', 'u1'),
+    ('action_count', 'I', '<u4'),
+    ('max_leaf_nodes', 'I', '<u4'),
+    ('duration', 'f', '<f4'), # Seconds
+    ('peak_memory', 'Q', '<u8'), # Estimated peak bytes held by the search (see montecarlo.SearchMemory)
+]
+RESULT_STRUCT = struct.Struct('<' + ''.join([field[1] for field in RESULT_FIELDS]))
+
+def result_dtype():
+    # Only import numpy when we're reading the results back
+    import numpy as np
+    return np.dtype([(field[0], field[2]) for field in RESULT_FIELDS])
+
+class ResultsStore:
+    def __init__(self, folder):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.results_filename = os.path.join(folder, RESULTS_FILENAME)
+        self.variants_filename = os.path.join(folder, VARIANTS_FILENAME)
+        self.card_stats_filename = os.path.join(folder, CARD_STATS_FILENAME)
+        self.buffer = bytearray()
+        self.buffered_count = 0
+        self.num_variants = len(load_variants(folder))
+        # Running (total win turns, number of games) for each variant, so that averages don't need to read the file back
+        self.totals = {}
+
+    def add_variant(self, epoch, label, decklist):
+        # Variants are rare compared to games, so they're written out straight away as JSON lines
+        variant_id = self.num_variants
+        self.num_variants += 1
+        with open(self.variants_filename, 'a') as f:
+            f.write(json.dumps({'variant_id': variant_id, 'epoch': epoch, 'label': label, 'decklist': decklist}) + '\n')
+        return variant_id
+
+    def add_card_stats(self, epoch, step, variant_id, card_stats):
+        # One line for all of a variant's games in a step, which is rare enough to write out straight away too
+        with open(self.card_stats_filename, 'a') as f:
+            f.write(json.dumps({'epoch': epoch, 'step': step, 'variant_id': variant_id, 'card_stats': card_stats}) + '\n')
+
+    def add_game(self, epoch, step, variant_id, seed, win_turn, won, action_count, max_leaf_nodes, duration, peak_memory = 0):
+        self.buffer += RESULT_STRUCT.pack(epoch, step, variant_id, seed, win_turn, won, action_count, max_leaf_nodes, duration, peak_memory)
+        self.buffered_count += 1
+
+        total = self.totals.setdefault(variant_id, [0, 0])
+        total[0] += win_turn
+        total[1] += 1
+
+        if self.buffered_count >= RESULTS_BUFFER_SIZE:
+            self.flush()
+
+    def average_win_turn(self, variant_id):
+        total_turns, num_games = self.totals[variant_id]
+        return total_turns / num_games
+
+    def flush(self):
+        if self.buffered_count == 0:
+            return
+        with open(self.results_filename, 'ab') as f:
+            f.write(self.buffer)
+        self.buffer = bytearray()
+        self.buffered_count = 0
+
+def load_variants(folder):
+    variants_filename = os.path.join(folder, VARIANTS_FILENAME)
+    if not os.path.exists(variants_filename):
+        return []
+    with open(variants_filename, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def load_card_stats(folder):
+    # Returns {variant_id: {card name: {stat: amount}}}, added up over every step that the variant was played in
+    card_stats_filename = os.path.join(folder, CARD_STATS_FILENAME)
+    variant_card_stats = {}
+    if not os.path.exists(card_stats_filename):
+        return variant_card_stats
+    with open(card_stats_filename, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            card_stats = variant_card_stats.setdefault(record['variant_id'], {})
+            for card_name, stats in record['card_stats'].items():
+                total = card_stats.setdefault(card_name, {})
+                for key, amount in stats.items():
+                    total[key] = total.get(key, 0) + amount
+    return variant_card_stats
+
+def load_results(folder):
+    import numpy as np
+    results_filename = os.path.join(folder, RESULTS_FILENAME)
+    for old_filename in OLD_RESULTS_FILENAMES:
+        if not os.path.exists(results_filename) and os.path.exists(os.path.join(folder, old_filename)):
+            raise Exception(f'{os.path.join(folder, old_filename)} was written with an older record layout than version {RESULTS_VERSION}')
+    if not os.path.exists(results_filename) or os.path.getsize(results_filename) == 0:
+        return np.zeros(0, dtype=result_dtype())
+    return np.memmap(results_filename, dtype=result_dtype(), mode='r')
+
+def summarize_results(folder):
+    import numpy as np
+    games = load_results(folder)
+    variants = load_variants(folder)
+    variant_card_stats = load_card_stats(folder)
+    print(f'{len(games)} games of {len(variants)} variants')
+
+    for variant in variants:
+        variant_games = games[games['variant_id'] == variant['variant_id']]
+        if len(variant_games) == 0:
+            continue
+        win_turns = variant_games['win_turn']
+        # Distribution of winning turns, e.g. {3: 12, 4: 80, 5: 8}
+        turns, counts = np.unique(win_turns, return_counts=True)
+        distribution = {int(turn): int(count) for turn, count in zip(turns, counts)}
+        print(f"Epoch {variant['epoch']} {variant['label']}: {len(variant_games)} games, "
+              f"avg {win_turns.mean():.3f} (std {win_turns.std():.3f}), "
+              f"won {variant_games['won'].mean() * 100:.1f}%, "
+              f"avg {variant_games['duration'].mean():.4f}s, "
+              f"max leaf nodes {variant_games['max_leaf_nodes'].max()}, "
+              f"peak memory {variant_games['peak_memory'].max() / 2**20:.1f}MB, "
+              f"turns {distribution}")
+        # The cards that the search spent the most on for this variant
+        card_stats = variant_card_stats.get(variant['variant_id'], {})
+        for card_name, stats in sorted(card_stats.items(), key=lambda item: -item[1]['children'])[:CARD_STATS_SUMMARY_COUNT]:
+            line = (f"  {card_name}: {stats['children']} children, {stats['pruned']} pruned by the limit, "
+                    f"{stats['duplicates']} duplicates, {stats['dominated']} dominated")
+            # Only timed with montecarlo.CARD_TIMING
+            if stats['seconds'] > 0:
+                line += f", {stats['seconds']:.3f}s in its methods"
+            print(line)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: python results.py <log folder>')
+        sys.exit(1)
+    summarize_results(sys.argv[1])
@@ -0,0 +1,215 @@
+# Local evaluation service.
+#  Answers quick "what if I swap X for Y" questions without a notebook kernel, and without paying for a new pool of workers
+#  every time: the pool is started once (with the card classes and the engine already imported in every worker), and kept
+#  warm between requests. Only listens on localhost.
+#
+#  POST /evaluate with a JSON body like:
+#   {"decklist": "4 Goblin Charbelcher\n...", "games": 200, "seed": 0, "max_turns": 10, "settings": {"prune_limit": 500}}
+#  Only the decklist is required. settings takes the same keys as montecarlo.py's --config file.
+#  The response is one JSON object per line: progress lines ({"progress": games played, "games": ...}) while the games are
+#  being played, and then the result ({"result": {...}}) with the win turn statistics. Identical requests are answered
+#  from a cache, straight away. GET / returns the state of the service.
+#
+# Usage:
+#  python service.py [--port 8765] [--workers N]
+#  curl -N localhost:8765/evaluate -d '{"decklist": "...", "games": 100}'
+import argparse
+import hashlib
+import http.server
+import json
+import multiprocessing as mp
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import batch
+import cards
+import montecarlo
+
+SERVICE_HOST = '127.0.0.1' # Never listen on anything but localhost
+SERVICE_PORT = 8765
+SERVICE_CACHE_SIZE = 256 # Most results to keep in the cache (least recently used ones go first)
+SERVICE_PROGRESS_INTERVAL = 0.5 # Seconds between progress lines
+SERVICE_MAX_GAMES = 100000 # Most games that a single request may ask for
+
+# The engine settings that a worker started out with, which every game starts from before applying its request's settings
+default_settings = None
+
+def start_worker(settings):
+    # settings are the ones that the service was started with. Workers that weren't forked don't share the service's
+    #  module globals, so they only get them from here.
+    global default_settings
+    montecarlo.apply_config(settings)
+    default_settings = settings
+    # Look up every card class once, so that the first game doesn't pay for it
+    for card_class in cards.Card.__subclasses__():
+        cards.get_card_by_name(card_class.name)
+
+def play_service_game(task):
+    # Runs in a pool worker. Settings are module globals there, so put back the defaults before every game, rather than
+    #  keeping whatever the last request on this worker set.
+    settings, decklist, seed, max_turns = task
+    montecarlo.apply_config(dict(default_settings, **settings))
+    win_state, action_count, max_leaf_nodes, duration, search_stats = montecarlo.play_game(cards.Player(decklist, seed), montecarlo.PRUNE_LIMIT, memory_budget = montecarlo.MEMORY_BUDGET, max_turns = max_turns)
+    return (win_state.current_turn if win_state is not None else None), duration
+
+class EvaluationService:
+    def __init__(self, workers = None):
+        if workers is None:
+            workers = max(1, mp.cpu_count() - montecarlo.PARALLEL_SPARE_CORES)
+        self.workers = workers
+        self.pool = mp.Pool(workers, initializer=start_worker, initargs=(montecarlo.get_config(),))
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.requests = 0
+        self.cache_hits = 0
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def parse_request(self, request):
+        # Returns the (decklist, games, seed, max_turns, settings) of a request, or raises an Exception that says what's wrong
+        if not isinstance(request, dict) or 'decklist' not in request:
+            raise Exception('Expected a JSON object with a "decklist"')
+        unknown = set(request) - {'decklist', 'games', 'seed', 'max_turns', 'settings'}
+        if len(unknown) > 0:
+            raise Exception(f'Unknown request fields: {", ".join(sorted(unknown))}')
+        decklist = montecarlo.get_deck_variants(montecarlo.parse_decklist(request['decklist']))[0]
+        games = int(request.get('games', 100))
+        if games < 1 or games > SERVICE_MAX_GAMES:
+            raise Exception(f'games must be between 1 and {SERVICE_MAX_GAMES}')
+        seed = int(request.get('seed', 0))
+        max_turns = int(request.get('max_turns', 10))
+        settings = request.get('settings', {})
+        unknown = set(settings) - set(montecarlo.CONFIG_SETTINGS)
+        if len(unknown) > 0:
+            raise Exception(f'Unknown settings: {", ".join(sorted(unknown))}')
+        return decklist, games, seed, max_turns, settings
+
+    def get_cache_key(self, decklist, games, seed, max_turns, settings):
+        # The decklist is already in its canonical form (see parse_request()), so the same deck always gets the same key
+        query = json.dumps([decklist, games, seed, max_turns, settings], sort_keys=True)
+        return hashlib.sha1(query.encode()).hexdigest()
+
+    def evaluate(self, request, report_progress = None):
+        # Play (or look up) the games of a request, and return the result. report_progress(games played, games) is called
+        #  every so often while playing.
+        return self.evaluate_query(self.parse_request(request), report_progress)
+
+    def evaluate_query(self, query, report_progress = None):
+        decklist, games, seed, max_turns, settings = query
+        key = self.get_cache_key(decklist, games, seed, max_turns, settings)
+        with self.cache_lock:
+            self.requests += 1
+            if key in self.cache:
+                self.cache_hits += 1
+                self.cache.move_to_end(key)
+                return dict(self.cache[key], cached=True)
+
+        then = time.time()
+        tasks = [(settings, decklist, seed + game, max_turns) for game in range(games)]
+        win_turns = []
+        durations = []
+        wins = 0
+        last_report = then
+        for win_turn, duration in self.pool.imap_unordered(play_service_game, tasks):
+            # Games that weren't won count as max_turns + 2, the same as in training
+            win_turns.append(win_turn if win_turn is not None else max_turns + 2)
+            wins += win_turn is not None
+            durations.append(duration)
+            if report_progress is not None and time.time() - last_report >= SERVICE_PROGRESS_INTERVAL:
+                last_report = time.time()
+                report_progress(len(win_turns), games)
+
+        avg_win_turn, interval = batch.get_interval(win_turns)
+        distribution = {}
+        for win_turn in sorted(win_turns):
+            distribution[str(win_turn)] = distribution.get(str(win_turn), 0) + 1
+        result = {
+            'games': games,
+            'avg_win_turn': avg_win_turn,
+            'interval': interval if interval != float('inf') else None,
+            'win_rate': wins / games,
+            'distribution': distribution,
+            'avg_game_duration': sum(durations) / games,
+            'duration': time.time() - then,
+        }
+        with self.cache_lock:
+            self.cache[key] = result
+            while len(self.cache) > SERVICE_CACHE_SIZE:
+                self.cache.popitem(last=False)
+        return dict(result, cached=False)
+
+class ServiceRequestHandler(http.server.BaseHTTPRequestHandler):
+    # The response streams until it's done, and then the connection closes (HTTP/1.0), so there's no need to know how
+    #  long it will be up front
+    service:EvaluationService = None
+
+    def send_json(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write((json.dumps(body) + '\n').encode())
+
+    def do_GET(self):
+        if self.path != '/':
+            self.send_json(404, {'error': f'Unknown path: {self.path}'})
+            return
+        self.send_json(200, {'workers': self.service.workers, 'requests': self.service.requests,
+                             'cache_hits': self.service.cache_hits, 'cached_results': len(self.service.cache)})
+
+    def do_POST(self):
+        if self.path != '/evaluate':
+            self.send_json(404, {'error': f'Unknown path: {self.path}'})
+            return
+        try:
+            query = self.service.parse_request(json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0)))))
+        except Exception as e:
+            self.send_json(400, {'error': str(e)})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        def report_progress(played, games):
+            self.wfile.write((json.dumps({'progress': played, 'games': games}) + '\n').encode())
+            self.wfile.flush()
+        try:
+            result = self.service.evaluate_query(query, report_progress)
+            self.wfile.write((json.dumps({'result': result}) + '\n').encode())
+        except Exception as e:
+            # The status has already been sent, so report the error in the stream
+            self.wfile.write((json.dumps({'error': str(e)}) + '\n').encode())
+
+def start_server(service, port = SERVICE_PORT):
+    # Returns the server, which serve_forever() runs. Every request gets a thread of its own, but they all share the pool.
+    handler = type('BoundServiceRequestHandler', (ServiceRequestHandler,), {'service': service})
+    return http.server.ThreadingHTTPServer((SERVICE_HOST, port), handler)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Serve decklist evaluations on localhost, from a warm pool of workers.')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help=f'Port to listen on (default: {SERVICE_PORT})')
+    parser.add_argument('--workers', type=int, help='Number of worker processes (default: all but PARALLEL_SPARE_CORES of the cores)')
+    parser.add_argument('--config', help='JSON file of montecarlo.py settings for every request to start from')
+    args = parser.parse_args(argv)
+
+    if args.config:
+        with open(args.config, 'r') as f:
+            montecarlo.apply_config(json.load(f))
+    # Start the pool after applying the config, so that the settings that the workers are handed include it
+    service = EvaluationService(args.workers)
+    server = start_server(service, args.port)
+    print(f'Serving on http://{SERVICE_HOST}:{server.server_address[1]} with {service.workers} workers')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
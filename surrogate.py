@@ -0,0 +1,133 @@
+# Surrogate model of deck quality, used by montecarlo.run_epoch to decide which variants are worth simulating.
+#  This lives in its own module so that numpy is only needed when the surrogate is turned on (USE_SURROGATE).
+import glob
+import os
+
+import numpy as np
+
+SURROGATE_FILE = 'surrogate.npz' # Where the trained surrogate is stored between epochs (and runs)
+SURROGATE_LOG_GLOB = 'logs/*/progress.tsv' # Past epoch results to train a fresh surrogate from
+SURROGATE_MIN_SAMPLES = 200 # Keep simulating every variant until the surrogate has been trained on at least this many results
+SURROGATE_EXPLORATION = 1.0 # How many standard deviations of uncertainty to give a variant the benefit of the doubt for
+SURROGATE_RIDGE = 1.0 # Ridge regularization, so that the model is solvable before it has seen enough distinct decklists
+
+# DeckSurrogate is a least-squares model that predicts the average win turn of a decklist from its card quantities,
+#  including pairwise interaction terms between every pair of cards (and each card with itself, for diminishing returns).
+#  It only stores the weighted normal equations, so it can be trained incrementally as new results come in.
+class DeckSurrogate:
+    def __init__(self, cardnames):
+        self.cardnames = list(cardnames)
+        num_features = len(self.features({}))
+        self.xtx = np.zeros((num_features, num_features))
+        self.xty = np.zeros(num_features)
+        self.yty = 0.0
+        self.num_samples = 0
+        self.weights = None
+        self.covariance = None
+        self.noise_variance = None
+
+    def features(self, quants):
+        q = np.array([quants.get(cardname, 0) for cardname in self.cardnames], dtype=float)
+        i, j = np.triu_indices(len(q))
+        return np.concatenate(([1.0], q, q[i] * q[j]))
+
+    def add_result(self, quants, avg_win_turn, num_games):
+        # Each result is weighted by the number of games behind it, since the noise in an average shrinks with more games.
+        x = self.features(quants)
+        self.xtx += num_games * np.outer(x, x)
+        self.xty += num_games * avg_win_turn * x
+        self.yty += num_games * avg_win_turn * avg_win_turn
+        self.num_samples += 1
+        self.weights = None
+
+    def fit(self):
+        self.covariance = np.linalg.inv(self.xtx + SURROGATE_RIDGE * np.eye(len(self.xty)))
+        self.weights = self.covariance @ self.xty
+        # Estimate the per-game variance from the (weighted) residuals
+        residuals = self.yty - 2 * self.weights @ self.xty + self.weights @ self.xtx @ self.weights
+        self.noise_variance = max(residuals, 0.0) / max(self.num_samples, 1)
+
+    def predict(self, quants):
+        # Return the predicted average win turn, and the standard deviation of that prediction
+        if self.weights is None:
+            self.fit()
+        x = self.features(quants)
+        mean = x @ self.weights
+        std = (self.noise_variance * (x @ self.covariance @ x)) ** 0.5
+        return mean, std
+
+    def save(self, filename):
+        np.savez(filename, cardnames=np.array(self.cardnames), xtx=self.xtx, xty=self.xty, yty=self.yty, num_samples=self.num_samples)
+
+    @staticmethod
+    def load(filename) -> 'DeckSurrogate':
+        data = np.load(filename)
+        surrogate = DeckSurrogate([str(cardname) for cardname in data['cardnames']])
+        surrogate.xtx = data['xtx']
+        surrogate.xty = data['xty']
+        surrogate.yty = float(data['yty'])
+        surrogate.num_samples = int(data['num_samples'])
+        return surrogate
+
+def add_epoch_results_to_surrogate(surrogate, baseline_quants, baseline_win, wins_61_avgs, wins_59_avgs, num_games):
+    surrogate.add_result(baseline_quants, baseline_win, num_games)
+    for cardname, avg_win in wins_61_avgs.items():
+        quants = dict(baseline_quants)
+        quants[cardname] = quants.get(cardname, 0) + 1
+        surrogate.add_result(quants, avg_win, num_games)
+    for cardname, avg_win in wins_59_avgs.items():
+        quants = dict(baseline_quants)
+        quants[cardname] = quants.get(cardname, 0) - 1
+        surrogate.add_result(quants, avg_win, num_games)
+
+def train_surrogate_from_logs(surrogate, log_glob = SURROGATE_LOG_GLOB):
+    # Train on the final line of each epoch in the progress.tsv files written by run_epoch
+    for filename in glob.glob(log_glob):
+        with open(filename, 'r') as f:
+            lines = f.read().split('\n')
+        headers = lines[0].split('\t')
+        # Only run_epoch's logs record the results of each addition and removal
+        if not any([header.startswith("'+") for header in headers]):
+            continue
+        for line in lines[1:]:
+            if not line:
+                continue
+            values = dict(zip(headers, line.split('\t')))
+            baseline_quants = {}
+            wins_61_avgs = {}
+            wins_59_avgs = {}
+            for header, value in values.items():
+                if header.startswith("'#"):
+                    baseline_quants[header[2:]] = int(value)
+                elif header.startswith("'+") and value:
+                    wins_61_avgs[header[2:]] = float(value)
+                elif header.startswith("'-") and value:
+                    wins_59_avgs[header[2:]] = float(value)
+            add_epoch_results_to_surrogate(surrogate, baseline_quants, float(values['Baseline']), wins_61_avgs, wins_59_avgs, int(values['Trials']))
+
+def get_surrogate(cardnames) -> DeckSurrogate:
+    # Load the saved surrogate, or train a new one from past logs if there isn't one for this set of cards.
+    if os.path.exists(SURROGATE_FILE):
+        surrogate = DeckSurrogate.load(SURROGATE_FILE)
+        if surrogate.cardnames == list(cardnames):
+            return surrogate
+        print(f'Warning: Saved surrogate was trained on a different set of cards, retraining from logs')
+    surrogate = DeckSurrogate(cardnames)
+    train_surrogate_from_logs(surrogate)
+    print(f'Trained surrogate on {surrogate.num_samples} results from past logs')
+    return surrogate
+
+def select_promising_variants(surrogate, deckrange, decks, variant_cards, quant_change, count):
+    # Rank the variants by how good the surrogate thinks they could be (an optimistic lower bound on their average win turn),
+    #  so that we spend our simulations on variants that are either promising or that the surrogate is unsure about.
+    baseline_quants = {card['name']: card['quant'] for card in deckrange}
+    scores = []
+    for cardname in variant_cards:
+        quants = dict(baseline_quants)
+        quants[cardname] += quant_change
+        mean, std = surrogate.predict(quants)
+        scores.append(mean - SURROGATE_EXPLORATION * std)
+
+    # Keep the chosen variants in their original order
+    chosen = sorted(sorted(range(len(decks)), key=lambda i: scores[i])[:count])
+    return [decks[i] for i in chosen], [variant_cards[i] for i in chosen]